@@ -41,6 +41,16 @@ def create_app():
 
     login_manager.login_view = 'auth.login'
 
+    from .broker import broker
+    broker.init_app(app)
+
+    from .querystats import init_query_stats
+    init_query_stats(app)
+    from .metrics import init_metrics
+    init_metrics(app)
+    from .audit import init_audit_writer
+    init_audit_writer(app)
+
     from .models import User, Company  # noqa: F401
 
     @login_manager.user_loader
@@ -56,6 +66,7 @@ def create_app():
     from .reports.routes import reports_bp
     from .notifications.routes import notify_bp
     from .chat.routes import chat_bp
+    from .realtime.routes import realtime_bp
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(tickets_bp, url_prefix='/tickets')
@@ -65,6 +76,7 @@ def create_app():
     app.register_blueprint(reports_bp, url_prefix='/reports')
     app.register_blueprint(chat_bp, url_prefix='/chat')
     app.register_blueprint(notify_bp)
+    app.register_blueprint(realtime_bp)
 
     # Jinja filter para converter UTC -> timezone configurado
     def _localtime(value, fmt='%d/%m/%Y %H:%M'):
@@ -151,6 +163,18 @@ def create_app():
                     db.session.commit()
                 except Exception:
                     pass
+            if 'unread_notifications' not in ucols:
+                try:
+                    db.session.execute(text("ALTER TABLE user ADD COLUMN unread_notifications INTEGER"))
+                    db.session.commit()
+                except Exception:
+                    pass
+            if 'notify_digest_minutes' not in ucols:
+                try:
+                    db.session.execute(text("ALTER TABLE user ADD COLUMN notify_digest_minutes INTEGER DEFAULT 0"))
+                    db.session.commit()
+                except Exception:
+                    pass
             # Ensure notification.seen_at and notification.read_at
             try:
                 ncols = {c['name'] for c in inspector.get_columns('notification')}
@@ -159,6 +183,8 @@ def create_app():
                     nstmts.append("ALTER TABLE notification ADD COLUMN seen_at DATETIME")
                 if 'read_at' not in ncols:
                     nstmts.append("ALTER TABLE notification ADD COLUMN read_at DATETIME")
+                if 'group_count' not in ncols:
+                    nstmts.append("ALTER TABLE notification ADD COLUMN group_count INTEGER DEFAULT 1")
                 for s in nstmts:
                     try:
                         db.session.execute(text(s))
@@ -193,6 +219,16 @@ def create_app():
                     db.session.commit()
             except Exception:
                 pass
+            # Ensure indexes added after the initial schema
+            try:
+                db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_ticket_created_at_id ON ticket (created_at, id)"))
+                db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_ticket_user_rating_at ON ticket (user_rating_at)"))
+                db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_audit_log_entity ON audit_log (entity, entity_id, id)"))
+                db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_audit_log_user ON audit_log (user_id, id)"))
+                db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_audit_log_created_at ON audit_log (created_at, id)"))
+                db.session.commit()
+            except Exception:
+                pass
         except Exception:
             pass
         if Company.query.count() == 0:
@@ -233,4 +269,11 @@ def create_app():
         except Exception:
             pass
 
+    # Worker do outbox de e-mail (depois do ensure de schema)
+    from .mailer import init_mailer
+    init_mailer(app)
+    # Agendador de prazos de SLA (os hooks de publicação valem em todo processo)
+    from .sla_scheduler import init_sla_scheduler
+    init_sla_scheduler(app)
+
     return app
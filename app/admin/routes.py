@@ -2,10 +2,11 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from flask_login import current_user
 from ..utils import role_required
 from .. import db
-from ..models import Company, Category, Contract, SLAPlan, User, Queue, Asset, EmailTemplate, Problem, ChangeRequest, LGPDRevision
+from ..models import Company, Category, Contract, SLAPlan, User, Queue, Asset, EmailTemplate, Problem, ChangeRequest, LGPDRevision, AuditLog
 from .forms import CompanyForm, CategoryForm, ContractForm, SLAPlanForm, UserRoleForm, QueueForm, AssetForm, EmailTemplateForm, ProblemForm, ChangeRequestForm, UserCreateForm, UserEditForm, LGPDRevisionForm
-from ..utils import poll_imap_and_process, run_automations, run_retention, audit
-from ..email import _send
+from ..utils import poll_imap_and_process, run_automations, run_retention, sweep_orphan_uploads, audit, invalidate_sla_index
+from ..email import _deliver, invalidate_email_templates, invalidate_company_branding
+from ..audit import archive_audit_log, archived_segments
 from werkzeug.utils import secure_filename
 import os
 import uuid
@@ -79,6 +80,7 @@ def companies():
                 c.logo_url = url_for('static', filename=f'uploads/logos/{filename}') + f"?v={uuid.uuid4().hex[:6]}"
         db.session.add(c)
         db.session.commit()
+        invalidate_company_branding(c.id)
         flash('Empresa criada.', 'success')
         return redirect(url_for('admin.companies'))
     items = Company.query.order_by(Company.name).all()
@@ -171,6 +173,7 @@ def slaplans():
         )
         db.session.add(plan)
         db.session.commit()
+        invalidate_sla_index(plan.company_id)
         flash('SLA criado.', 'success')
         return redirect(url_for('admin.slaplans'))
     items = SLAPlan.query.order_by(SLAPlan.company_id, SLAPlan.name).all()
@@ -306,6 +309,7 @@ def company_edit(company_id):
         elif form.logo_url.data:
             c.logo_url = form.logo_url.data
         db.session.commit()
+        invalidate_company_branding(c.id)
         flash('Empresa atualizada.', 'success')
         return redirect(url_for('admin.companies'))
     return render_template('admin/company_edit.html', form=form, company=c)
@@ -362,6 +366,7 @@ def email_templates():
         )
         db.session.add(tpl)
         db.session.commit()
+        invalidate_email_templates()
         flash('Modelo de e-mail salvo.', 'success')
         return redirect(url_for('admin.email_templates'))
     items = EmailTemplate.query.order_by(EmailTemplate.company_id, EmailTemplate.name).all()
@@ -410,18 +415,72 @@ def tools_poll_imap():
 
 @admin_bp.route('/tools/run-automations', methods=['POST'])
 def tools_run_automations():
-    run_automations()
-    flash('Automações executadas.', 'success')
+    stats = run_automations()
+    flash(f"Automações executadas: {stats['tickets']} ticket(s) escalonado(s) em {stats['total']:.2f}s.", 'success')
     return redirect(url_for('admin.tools'))
 
 
 @admin_bp.route('/tools/run-retention', methods=['POST'])
 def tools_run_retention():
-    run_retention()
-    flash('Rotina de retenção executada.', 'success')
+    stats = run_retention()
+    msg = (f"Rotina de retenção executada: {stats['tickets']} ticket(s), {stats['files']} arquivo(s), "
+           f"{stats['comments']} comentário(s) em {len(stats['batches'])} lote(s), {stats['total']:.2f}s.")
+    if not stats['complete']:
+        msg += ' Limite de tempo atingido: a próxima execução continua de onde parou.'
+    flash(msg, 'success')
     return redirect(url_for('admin.tools'))
 
 
+@admin_bp.route('/tools/sweep-uploads', methods=['POST'])
+def tools_sweep_uploads():
+    stats = sweep_orphan_uploads()
+    flash(f"Limpeza de anexos: {stats['files_removed']} arquivo(s) órfão(s) removido(s), "
+          f"{stats['bytes'] / (1024 * 1024):.1f} MB liberados em {stats['dirs']} pasta(s), {stats['total']:.2f}s.", 'success')
+    return redirect(url_for('admin.tools'))
+
+
+@admin_bp.route('/tools/archive-audit', methods=['POST'])
+def tools_archive_audit():
+    stats = archive_audit_log()
+    flash(f"Auditoria arquivada: {stats['rows']} registro(s) em {stats['segments']} segmento(s), "
+          f"{stats['bytes'] / 1024:.1f} KB.", 'success')
+    return redirect(url_for('admin.tools'))
+
+
+@admin_bp.route('/audit')
+def audit_log():
+    # Keyset em id (mais recentes primeiro); filtros usam os índices por entidade e por usuário
+    filters = {
+        'entity': (request.args.get('entity') or '').strip(),
+        'entity_id': request.args.get('entity_id', type=int),
+        'user_id': request.args.get('user_id', type=int),
+        'action': (request.args.get('action') or '').strip(),
+    }
+    before = request.args.get('before', type=int)
+    page_size = current_app.config.get('AUDIT_PAGE_SIZE', 100)
+    q = AuditLog.query
+    if filters['entity']:
+        q = q.filter(AuditLog.entity == filters['entity'])
+        if filters['entity_id']:
+            q = q.filter(AuditLog.entity_id == filters['entity_id'])
+    if filters['user_id']:
+        q = q.filter(AuditLog.user_id == filters['user_id'])
+    if filters['action']:
+        q = q.filter(AuditLog.action == filters['action'])
+    if before:
+        q = q.filter(AuditLog.id < before)
+    items = q.order_by(AuditLog.id.desc()).limit(page_size + 1).all()
+    next_before = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        next_before = items[-1].id
+    user_ids = {i.user_id for i in items if i.user_id}
+    users = {u.id: u for u in User.query.filter(User.id.in_(user_ids)).all()} if user_ids else {}
+    filter_args = {k: v for k, v in filters.items() if v}
+    return render_template('admin/audit.html', items=items, users=users, filters=filters, filter_args=filter_args,
+                           next_before=next_before, segments=archived_segments()[:20])
+
+
 @admin_bp.route('/tools/send-test-email', methods=['POST'])
 def tools_send_test_email():
     to = (request.form.get('to') or '').strip()
@@ -431,7 +490,8 @@ def tools_send_test_email():
         return redirect(url_for('admin.tools'))
     body = 'Este é um envio de teste do Service Desk.'
     try:
-        _send(subject, [to], body)
+        # Envio direto (sem outbox) para validar a configuração SMTP na hora
+        _deliver(subject, [to], body)
         flash(f'E-mail de teste enviado para {to}.', 'success')
     except Exception as e:
         flash(f'Falha ao enviar e-mail de teste: {e}', 'danger')
@@ -0,0 +1,248 @@
+"""Gravação do AuditLog em lote, fora da transação das rotas.
+
+audit() só enfileira o registro; uma thread junta o que estiver na fila e
+grava com um único INSERT em conexão própria (sem commit na sessão de quem
+chamou). A fila é limitada (AUDIT_QUEUE_SIZE): cheia, ou sem o gravador
+ativo (testes, scripts, AUDIT_ASYNC=0), o registro é gravado na hora pelo
+mesmo caminho. Na saída do processo a fila é esvaziada antes de encerrar.
+
+archive_audit_log() move registros antigos para segmentos JSONL gzip
+(só acrescentados, nunca reescritos), cada um com um índice .idx.json.
+"""
+import atexit
+import glob
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select
+from . import db
+from .models import AuditLog
+from .metrics import AUDIT_RECORDS
+
+RETRIES = 3
+
+_queue = None
+_worker = None
+_stop = threading.Event()
+
+
+def _insert(rows):
+    with db.engine.begin() as conn:
+        conn.execute(AuditLog.__table__.insert(), rows)
+
+
+def write(row):
+    row.setdefault('created_at', datetime.utcnow())
+    q = _queue
+    if q is not None and _worker is not None and _worker.is_alive():
+        try:
+            q.put_nowait(row)
+            return
+        except queue.Full:
+            pass  # contrapressão: grava na hora em vez de perder o registro
+    _insert([row])
+    AUDIT_RECORDS.inc('sync')
+
+
+def _drain(q, limit):
+    rows = []
+    while len(rows) < limit:
+        try:
+            rows.append(q.get_nowait())
+        except queue.Empty:
+            break
+    return rows
+
+
+def run_writer(app, q, stop):
+    batch = app.config.get('AUDIT_BATCH_SIZE', 500)
+    while not (stop.is_set() and q.empty()):
+        try:
+            first = q.get(timeout=1)
+        except queue.Empty:
+            continue
+        # O que acumulou enquanto o INSERT anterior rodava vai junto
+        rows = [first] + _drain(q, batch - 1)
+        for attempt in range(RETRIES):
+            try:
+                with app.app_context():
+                    _insert(rows)
+                AUDIT_RECORDS.inc('batch', amount=len(rows))
+                break
+            except Exception:
+                if attempt == RETRIES - 1:
+                    app.logger.exception('Falha ao gravar %s registro(s) de auditoria; descartados', len(rows))
+                    AUDIT_RECORDS.inc('dropped', amount=len(rows))
+                else:
+                    stop.wait(1)
+
+
+def shutdown(timeout=5):
+    """Esvazia a fila e encerra o gravador (registrado no atexit)."""
+    global _worker
+    worker = _worker
+    if worker is None:
+        return
+    _stop.set()
+    worker.join(timeout)
+    _worker = None
+
+
+def init_audit_writer(app):
+    global _queue, _worker
+    if not app.config.get('AUDIT_ASYNC', True) or app.config.get('TESTING'):
+        return
+    if _worker is not None and _worker.is_alive():
+        return
+    _stop.clear()
+    _queue = queue.Queue(maxsize=app.config.get('AUDIT_QUEUE_SIZE', 10000))
+    _worker = threading.Thread(target=run_writer, args=(app, _queue, _stop), name='audit-writer', daemon=True)
+    _worker.start()
+
+
+atexit.register(shutdown)
+
+
+ARCHIVE_READ_CHUNK = 1000
+
+
+def _archive_dir():
+    path = current_app.config.get('AUDIT_ARCHIVE_DIR') or os.path.join(current_app.root_path, 'audit_archive')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _durable_replace(tmp, path):
+    with open(tmp, 'rb') as fh:
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+
+
+def _delete_archived(idx):
+    # Exatamente as linhas do segmento: mesmo intervalo de id e o mesmo corte de data
+    t = AuditLog.__table__
+    cutoff = datetime.fromisoformat(idx['cutoff'])
+    return db.session.execute(
+        t.delete().where(t.c.id >= idx['first_id'], t.c.id <= idx['last_id'], t.c.created_at < cutoff)
+    ).rowcount
+
+
+def _write_segment(path, first, cutoff, segment_rows, info):
+    """Grava em ``path`` (gzip, JSON por linha) até ``segment_rows`` registros
+    anteriores a ``cutoff`` a partir do id ``first``, preenchendo ``info``."""
+    t = AuditLog.__table__
+    columns = [c.name for c in t.columns]
+    last = first - 1
+    with gzip.open(path, 'wt', encoding='utf-8') as out:
+        while info['rows'] < segment_rows:
+            # Lê em blocos (memória limitada) na ordem do id
+            rows = db.session.execute(
+                select(t).where(t.c.id > last, t.c.created_at < cutoff).order_by(t.c.id)
+                .limit(min(ARCHIVE_READ_CHUNK, segment_rows - info['rows']))).all()
+            if not rows:
+                break
+            for row in rows:
+                rec = dict(zip(columns, row))
+                rec['created_at'] = created = rec['created_at'].isoformat()
+                out.write(json.dumps(rec, ensure_ascii=False, separators=(',', ':')) + '\n')
+                if info['min_created_at'] is None or created < info['min_created_at']:
+                    info['min_created_at'] = created
+                if info['max_created_at'] is None or created > info['max_created_at']:
+                    info['max_created_at'] = created
+                info['entities'][rec['entity']] = info['entities'].get(rec['entity'], 0) + 1
+                info['actions'][rec['action']] = info['actions'].get(rec['action'], 0) + 1
+            info['rows'] += len(rows)
+            last = rows[-1][0]
+    info['last_id'] = last
+
+
+def _remove_orphans(folder):
+    # Segmento sem índice (ou .partial/.tmp) é de uma execução interrompida antes
+    # do DELETE: as linhas continuam no banco e serão arquivadas de novo
+    removed = 0
+    for path in glob.glob(os.path.join(folder, 'audit-*')):
+        base = os.path.basename(path)
+        if base.endswith('.idx.json'):
+            continue
+        if base.endswith('.jsonl.gz') and '.partial' not in base and \
+                os.path.exists(path[:-len('.jsonl.gz')] + '.idx.json'):
+            continue
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def archive_audit_log(days=None, segment_rows=None):
+    """Move registros mais antigos que AUDIT_ARCHIVE_DAYS para segmentos
+    audit-<primeiro id>.jsonl.gz no AUDIT_ARCHIVE_DIR.
+
+    Ordem: grava o segmento, grava o índice (marca o segmento como completo)
+    e só então apaga as linhas no banco, um commit por segmento. O nome vem do
+    primeiro id: se o processo cair antes do índice, a próxima execução
+    regrava o mesmo segmento (e descarta sobras sem índice); se cair depois,
+    conclui o DELETE do último segmento. Retorna as estatísticas.
+    """
+    days = current_app.config.get('AUDIT_ARCHIVE_DAYS', 180) if days is None else days
+    segment_rows = segment_rows or current_app.config.get('AUDIT_ARCHIVE_SEGMENT_ROWS', 50000)
+    stats = {'segments': 0, 'rows': 0, 'bytes': 0, 'recovered': 0, 'orphans': 0}
+    if days <= 0:
+        return stats
+    started = time.perf_counter()
+    folder = _archive_dir()
+    existing = sorted(glob.glob(os.path.join(folder, 'audit-*.idx.json')))
+    if existing:
+        try:
+            with open(existing[-1], encoding='utf-8') as fh:
+                stats['recovered'] = _delete_archived(json.load(fh))
+            db.session.commit()
+        except (OSError, ValueError, KeyError):
+            db.session.rollback()
+    stats['orphans'] = _remove_orphans(folder)
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    t = AuditLog.__table__
+    while True:
+        first = db.session.execute(
+            select(t.c.id).where(t.c.created_at < cutoff).order_by(t.c.id).limit(1)).scalar()
+        if first is None:
+            break
+        info = {'rows': 0, 'first_id': first, 'last_id': first, 'cutoff': cutoff.isoformat(),
+                'min_created_at': None, 'max_created_at': None, 'entities': {}, 'actions': {}}
+        name = f'audit-{first:012d}'
+        tmp = os.path.join(folder, name + '.partial.jsonl.gz')
+        _write_segment(tmp, first, cutoff, segment_rows, info)
+        info['segment'] = name + '.jsonl.gz'
+        _durable_replace(tmp, os.path.join(folder, info['segment']))
+        info['bytes'] = os.path.getsize(os.path.join(folder, info['segment']))
+
+        idx_tmp = os.path.join(folder, name + '.idx.json.tmp')
+        with open(idx_tmp, 'w', encoding='utf-8') as fh:
+            json.dump(info, fh, ensure_ascii=False, indent=1)
+        _durable_replace(idx_tmp, os.path.join(folder, name + '.idx.json'))
+        deleted = _delete_archived(info)
+        db.session.commit()
+        stats['segments'] += 1
+        stats['rows'] += deleted
+        stats['bytes'] += info['bytes']
+        current_app.logger.info('Auditoria: segmento %s com %s registro(s), %s bytes', info['segment'], info['rows'], info['bytes'])
+    stats['total'] = time.perf_counter() - started
+    return stats
+
+
+def archived_segments():
+    """Índices dos segmentos arquivados (mais recentes primeiro)."""
+    items = []
+    for path in sorted(glob.glob(os.path.join(_archive_dir(), 'audit-*.idx.json')), reverse=True):
+        try:
+            with open(path, encoding='utf-8') as fh:
+                items.append(json.load(fh))
+        except (OSError, ValueError):
+            continue
+    return items
@@ -44,11 +44,11 @@ def login():
                 code = f"{__import__('random').randint(0, 999999):06d}"
                 otp = OTPCode(user_id=user.id, code=code, created_at=datetime.utcnow(), expires_at=datetime.utcnow()+timedelta(minutes=10))
                 db.session.add(otp)
-                db.session.commit()
                 try:
                     send_otp_email(user, code)
                 except Exception:
                     pass
+                db.session.commit()
                 session['pending_otp_user'] = user.id
                 session['remember_me'] = form.remember.data
                 flash('Enviamos um código de verificação para seu e-mail.', 'info')
@@ -111,6 +111,7 @@ def register():
         token = user.generate_confirmation_token()
         try:
             send_confirmation_email(user, token)
+            db.session.commit()
             flash('Cadastro criado. Enviamos um link de confirmação para seu e-mail.', 'success')
         except Exception as e:
             current_app.logger.exception('Falha ao enviar e-mail de confirmação no cadastro')
@@ -153,6 +154,7 @@ def resend_confirmation():
     token = user.generate_confirmation_token()
     try:
         send_confirmation_email(user, token)
+        db.session.commit()
         flash('Reenviamos o e-mail de confirmação.', 'success')
     except Exception as e:
         current_app.logger.exception('Falha ao reenviar e-mail de confirmação')
@@ -203,6 +205,7 @@ def forgot_password():
                 ts = URLSafeTimedSerializer(s)
                 token = ts.dumps({'user_id': user.id, 'email': user.email, 'purpose': 'reset'})
                 send_password_reset_email(user, token)
+                db.session.commit()
             except Exception:
                 current_app.logger.exception('Falha ao enviar e-mail de reset de senha')
         flash('Se o e-mail estiver cadastrado, enviaremos instruções para redefinir a senha.', 'info')
@@ -0,0 +1,232 @@
+"""Broker de eventos em processo para os streams SSE.
+
+As alterações relevantes (novo comentário, nova notificação, mudança de
+status) são publicadas após o commit da sessão; os handlers SSE ficam
+bloqueados numa assinatura e só consultam o banco quando algo mudou.
+
+Tópicos: ``user:<id>`` (notificações) e ``ticket:<id>`` (comentários e
+status). O backend é plugável: ``local`` (padrão, um processo) ou
+``redis`` (fan-out entre processos, requer o pacote ``redis``).
+"""
+import asyncio
+import json
+import threading
+from collections import deque
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+
+
+class LocalBackend:
+    def __init__(self):
+        self._subs = {}
+        self._lock = threading.Lock()
+
+    def publish(self, topic, message):
+        with self._lock:
+            callbacks = list(self._subs.get(topic, ()))
+        for cb in callbacks:
+            try:
+                cb(topic, message)
+            except Exception:
+                pass
+
+    def subscribe(self, topic, callback):
+        with self._lock:
+            self._subs.setdefault(topic, set()).add(callback)
+
+    def unsubscribe(self, topic, callback):
+        with self._lock:
+            subs = self._subs.get(topic)
+            if subs:
+                subs.discard(callback)
+                if not subs:
+                    del self._subs[topic]
+
+    def close(self):
+        with self._lock:
+            self._subs.clear()
+
+
+class RedisBackend:
+    """Fan-out entre processos via Redis pub/sub; entrega local pelo LocalBackend."""
+
+    def __init__(self, url, prefix='servicedesk:events:'):
+        import redis  # type: ignore
+        self._redis = redis.Redis.from_url(url)
+        self._prefix = prefix
+        self._local = LocalBackend()
+        self._stop = threading.Event()
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.psubscribe(prefix + '*')
+        self._thread = threading.Thread(target=self._run, name='events-redis', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                msg = self._pubsub.get_message(timeout=1.0)
+            except Exception:
+                self._stop.wait(1.0)
+                continue
+            if not msg or msg.get('type') != 'pmessage':
+                continue
+            try:
+                channel = msg['channel'].decode() if isinstance(msg['channel'], bytes) else msg['channel']
+                self._local.publish(channel[len(self._prefix):], json.loads(msg['data']))
+            except Exception:
+                continue
+
+    def publish(self, topic, message):
+        self._redis.publish(self._prefix + topic, json.dumps(message))
+
+    def subscribe(self, topic, callback):
+        self._local.subscribe(topic, callback)
+
+    def unsubscribe(self, topic, callback):
+        self._local.unsubscribe(topic, callback)
+
+    def close(self):
+        self._stop.set()
+        try:
+            self._pubsub.close()
+        except Exception:
+            pass
+        self._local.close()
+
+
+class Subscription:
+    def __init__(self, broker, topics=(), maxlen=1000):
+        self._broker = broker
+        self._topics = set()
+        self._events = deque(maxlen=maxlen)
+        self._cond = threading.Condition()
+        self._closed = False
+        for t in topics:
+            self.add(t)
+
+    def _deliver(self, topic, message):
+        with self._cond:
+            self._events.append((topic, message))
+            self._cond.notify()
+
+    def add(self, topic):
+        if topic not in self._topics:
+            self._topics.add(topic)
+            self._broker.backend.subscribe(topic, self._deliver)
+
+    def remove(self, topic):
+        if topic in self._topics:
+            self._topics.discard(topic)
+            self._broker.backend.unsubscribe(topic, self._deliver)
+
+    def wait(self, timeout=None):
+        """Bloqueia até haver eventos (ou timeout) e devolve a lista de (tópico, evento)."""
+        with self._cond:
+            if not self._events and not self._closed:
+                self._cond.wait(timeout)
+            items = list(self._events)
+            self._events.clear()
+        return items
+
+    def close(self):
+        for t in list(self._topics):
+            self.remove(t)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class AsyncSubscription(Subscription):
+    """Mesma assinatura, mas aguardada por uma corrotina (gateway ASGI)."""
+
+    def __init__(self, broker, topics=(), maxlen=1000):
+        self._loop = asyncio.get_running_loop()
+        self._ready = asyncio.Event()
+        super().__init__(broker, topics, maxlen)
+
+    def _deliver(self, topic, message):
+        # Chamado na thread de quem publicou; acorda o loop com segurança
+        with self._cond:
+            self._events.append((topic, message))
+        try:
+            self._loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            pass
+
+    async def wait(self, timeout=None):
+        if not self._events and not self._closed:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self._ready.clear()
+        with self._cond:
+            items = list(self._events)
+            self._events.clear()
+        return items
+
+    def close(self):
+        super().close()
+        try:
+            self._loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            pass
+
+
+class Broker:
+    def __init__(self):
+        self.backend = LocalBackend()
+
+    def init_app(self, app):
+        kind = (app.config.get('EVENTS_BACKEND') or 'local').lower()
+        if kind == 'redis':
+            self.backend = RedisBackend(app.config.get('EVENTS_REDIS_URL') or 'redis://localhost:6379/0')
+        else:
+            self.backend = LocalBackend()
+
+    def publish(self, topic, message):
+        self.backend.publish(topic, message)
+
+    def subscribe(self, topics=()):
+        return Subscription(self, topics)
+
+    def subscribe_async(self, topics=()):
+        return AsyncSubscription(self, topics)
+
+
+broker = Broker()
+
+
+# Coleta eventos no flush e publica somente após o commit
+def _collect_events(session, flush_context):
+    from .models import Notification, TicketComment, Ticket
+    pending = session.info.setdefault('_broker_events', [])
+    for obj in session.new:
+        if isinstance(obj, Notification):
+            pending.append((f'user:{obj.user_id}', {'type': 'notification', 'id': obj.id}))
+        elif isinstance(obj, TicketComment):
+            pending.append((f'ticket:{obj.ticket_id}', {'type': 'comment', 'id': obj.id, 'internal': bool(obj.internal)}))
+    for obj in session.dirty:
+        if isinstance(obj, Ticket):
+            hist = get_history(obj, 'status')
+            if hist.added:
+                pending.append((f'ticket:{obj.id}', {'type': 'status', 'status': obj.status}))
+
+
+def _publish_events(session):
+    pending = session.info.pop('_broker_events', None)
+    for topic, message in pending or ():
+        try:
+            broker.publish(topic, message)
+        except Exception:
+            pass
+
+
+def _discard_events(session):
+    session.info.pop('_broker_events', None)
+
+
+event.listen(Session, 'after_flush', _collect_events)
+event.listen(Session, 'after_commit', _publish_events)
+event.listen(Session, 'after_rollback', _discard_events)
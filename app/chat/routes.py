@@ -3,9 +3,9 @@ from flask_login import login_required, current_user
 from .. import db
 from ..models import Ticket, TicketComment
 from ..tickets.forms import CommentForm
+from ..tickets.routes import comment_events
+from ..realtime.sse import last_event_id, parse_cursor
 from datetime import datetime
-import json
-import time
 
 
 chat_bp = Blueprint('chat', __name__, template_folder='../templates')
@@ -72,32 +72,12 @@ def stream():
     ticket = Ticket.query.get_or_404(ticket_id)
     if current_user.role == 'client' and ticket.created_by_id != current_user.id:
         return jsonify({'ok': False, 'error': 'forbidden'}), 403
-    def gen():
-        last = after
-        for _ in range(720):  # ~60 min @5s
-            q = TicketComment.query.filter_by(ticket_id=ticket.id)
-            if current_user.role == 'client':
-                q = q.filter_by(internal=False)
-            if last:
-                q = q.filter(TicketComment.id > last)
-            items = q.order_by(TicketComment.id.asc()).all()
-            if items:
-                last = max(last, max(c.id for c in items))
-            def fmt(dt):
-                try:
-                    return dt.strftime('%d/%m/%Y %H:%M') if dt else ''
-                except Exception:
-                    return ''
-            data = [{
-                'id': c.id,
-                'user_id': c.user_id,
-                'user_name': getattr(c.user, 'name', 'Usuário'),
-                'content': c.content,
-                'created_at': fmt(c.created_at),
-            } for c in items]
-            yield f"data: {json.dumps({'ok': True, 'items': data})}\n\n"
-            time.sleep(5)
-    return Response(stream_with_context(gen()), mimetype='text/event-stream')
+    is_client = current_user.role == 'client'
+    resume = last_event_id(request.headers, request.args)
+    if resume:
+        after = parse_cursor(resume)[0] or after
+    return Response(stream_with_context(comment_events(ticket_id, after, is_client, current_app.config, 'chat.stream')),
+                    mimetype='text/event-stream')
 
 
 @chat_bp.route('/send', methods=['POST'])
@@ -28,6 +28,18 @@ class BaseConfig:
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER', 'no-reply@local')
     MAIL_SUPPRESS_SEND = env_bool('MAIL_SUPPRESS_SEND', True)
+    # Outbox: e-mails gravados na transação e entregues em background com retentativas
+    MAIL_OUTBOX_ENABLED = env_bool('MAIL_OUTBOX_ENABLED', True)
+    MAIL_OUTBOX_WORKER = env_bool('MAIL_OUTBOX_WORKER', True)  # thread no processo web; use False com run_mailer.py
+    MAIL_OUTBOX_POLL_SECONDS = int(os.environ.get('MAIL_OUTBOX_POLL_SECONDS', 5))
+    MAIL_OUTBOX_BATCH = int(os.environ.get('MAIL_OUTBOX_BATCH', 50))
+    MAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get('MAIL_OUTBOX_MAX_ATTEMPTS', 8))
+    MAIL_OUTBOX_BACKOFF_SECONDS = int(os.environ.get('MAIL_OUTBOX_BACKOFF_SECONDS', 30))
+    # Sessão SMTP reaproveitada pelo worker (renovada se ociosa ou após N mensagens)
+    MAIL_SMTP_IDLE_SECONDS = int(os.environ.get('MAIL_SMTP_IDLE_SECONDS', 30))
+    MAIL_SMTP_MAX_MESSAGES = int(os.environ.get('MAIL_SMTP_MAX_MESSAGES', 500))
+    # Cache de modelos de e-mail e do layout por empresa (invalidado pelo admin)
+    EMAIL_CACHE_SECONDS = int(os.environ.get('EMAIL_CACHE_SECONDS', 300))
     NOTIFY_TICKETS_TO = env_list('NOTIFY_TICKETS_TO')
     # Branding (can be overridden via .env)
     BRAND_PRIMARY = os.environ.get('BRAND_PRIMARY', '#2563eb')
@@ -38,15 +50,69 @@ class BaseConfig:
 
     # Sessions
     PERMANENT_SESSION_LIFETIME = timedelta(seconds=int(os.environ.get('SESSION_LIFETIME_SECONDS', 60 * 60 * 8)))
+    # Índice de planos de SLA por empresa (invalidado ao salvar planos no admin)
+    SLA_INDEX_CACHE_SECONDS = int(os.environ.get('SLA_INDEX_CACHE_SECONDS', 300))
+    # Escalonação (run_automations): tickets por lote/commit
+    AUTOMATION_CHUNK_SIZE = int(os.environ.get('AUTOMATION_CHUNK_SIZE', 500))
+    # Agendador de prazos de SLA (heap em memória; ative em um único processo)
+    SLA_SCHEDULER_ENABLED = env_bool('SLA_SCHEDULER_ENABLED', False)
+    SLA_SCHEDULER_MAX_WAIT_SECONDS = int(os.environ.get('SLA_SCHEDULER_MAX_WAIT_SECONDS', 60))
+    # Retenção: tickets por lote/commit e tempo máximo por execução (0 = sem limite; retoma pelo checkpoint)
+    RETENTION_BATCH_SIZE = int(os.environ.get('RETENTION_BATCH_SIZE', 200))
+    RETENTION_MAX_SECONDS = int(os.environ.get('RETENTION_MAX_SECONDS', 0))
+    # Remoção de arquivos de anexos em threads e limpeza de órfãos (ignora arquivos mais novos que a carência)
+    UPLOAD_DELETE_WORKERS = int(os.environ.get('UPLOAD_DELETE_WORKERS', 8))
+    UPLOAD_SWEEP_GRACE_SECONDS = int(os.environ.get('UPLOAD_SWEEP_GRACE_SECONDS', 3600))
+    # Ticket list page size (per group, keyset pagination)
+    TICKETS_PAGE_SIZE = int(os.environ.get('TICKETS_PAGE_SIZE', 50))
     # Timezone for display
     TIMEZONE = os.environ.get('TIMEZONE', 'America/Sao_Paulo')
 
+    # SQL instrumentation (per-request query counter / N+1 detector)
+    SQL_QUERY_STATS = env_bool('SQL_QUERY_STATS', False)
+    SQL_N_PLUS_ONE_THRESHOLD = int(os.environ.get('SQL_N_PLUS_ONE_THRESHOLD', 5))
+
+    # AuditLog gravado em lote por uma thread (fila limitada; cheia ou desativado, grava na hora)
+    AUDIT_ASYNC = env_bool('AUDIT_ASYNC', True)
+    AUDIT_QUEUE_SIZE = int(os.environ.get('AUDIT_QUEUE_SIZE', 10000))
+    AUDIT_BATCH_SIZE = int(os.environ.get('AUDIT_BATCH_SIZE', 500))
+    AUDIT_PAGE_SIZE = int(os.environ.get('AUDIT_PAGE_SIZE', 100))
+    # Arquivamento: registros mais antigos que N dias vão para segmentos JSONL gzip (0 = desativado)
+    AUDIT_ARCHIVE_DAYS = int(os.environ.get('AUDIT_ARCHIVE_DAYS', 180))
+    AUDIT_ARCHIVE_DIR = os.environ.get('AUDIT_ARCHIVE_DIR')  # padrão: app/audit_archive
+    AUDIT_ARCHIVE_SEGMENT_ROWS = int(os.environ.get('AUDIT_ARCHIVE_SEGMENT_ROWS', 50000))
+
+    # /metrics endpoint (Prometheus text format): only served when METRICS_TOKEN is set
+    # (Authorization: Bearer <token>); METRICS_ALLOWED_IPS optionally restricts it further
+    METRICS_ENABLED = env_bool('METRICS_ENABLED', True)
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    METRICS_ALLOWED_IPS = env_list('METRICS_ALLOWED_IPS')
+
+    # Real-time events (SSE) broker: 'local' (single process) or 'redis'
+    EVENTS_BACKEND = os.environ.get('EVENTS_BACKEND', 'local')
+    EVENTS_REDIS_URL = os.environ.get('EVENTS_REDIS_URL')
+    SSE_KEEPALIVE_SECONDS = int(os.environ.get('SSE_KEEPALIVE_SECONDS', 25))
+    SSE_MAX_SECONDS = int(os.environ.get('SSE_MAX_SECONDS', 3600))
+    # Intervalo base de reconexão (retry:) e limite de backfill ao retomar por Last-Event-ID
+    SSE_RETRY_MS = int(os.environ.get('SSE_RETRY_MS', 5000))
+    SSE_BACKFILL_LIMIT = int(os.environ.get('SSE_BACKFILL_LIMIT', 200))
+
     # IMAP inbound (email -> ticket)
     IMAP_HOST = os.environ.get('IMAP_HOST')
     IMAP_PORT = int(os.environ.get('IMAP_PORT', 993))
     IMAP_SSL = os.environ.get('IMAP_SSL', '1') == '1'
     IMAP_USERNAME = os.environ.get('IMAP_USERNAME')
     IMAP_PASSWORD = os.environ.get('IMAP_PASSWORD')
+    IMAP_MAILBOX = os.environ.get('IMAP_MAILBOX', 'INBOX')
+    # UIDs por UID FETCH (cabeçalhos e corpos buscados em lote)
+    IMAP_FETCH_BATCH = int(os.environ.get('IMAP_FETCH_BATCH', 50))
+    # run_imap.py: renova o IDLE antes do corte de 30 min dos servidores; sem IDLE, consulta periódica
+    IMAP_IDLE_SECONDS = int(os.environ.get('IMAP_IDLE_SECONDS', 1500))
+    IMAP_POLL_SECONDS = int(os.environ.get('IMAP_POLL_SECONDS', 60))
+    IMAP_RECONNECT_MAX_SECONDS = int(os.environ.get('IMAP_RECONNECT_MAX_SECONDS', 300))
+    # Decodificação MIME em processos, só no run_imap.py (vazio = nº de CPUs até 4; 0/1 = sem pool) e limite por anexo
+    IMAP_PARSE_WORKERS = int(os.environ['IMAP_PARSE_WORKERS']) if os.environ.get('IMAP_PARSE_WORKERS') else None
+    IMAP_MAX_ATTACHMENT_BYTES = int(os.environ.get('IMAP_MAX_ATTACHMENT_BYTES', 25 * 1024 * 1024))
 
 
 class DevelopmentConfig(BaseConfig):
@@ -1,35 +1,192 @@
 ﻿from flask_mail import Message
 from flask import url_for, current_app
-from . import mail
-from .models import EmailTemplate, Company
+from . import mail, db
+from .models import EmailTemplate, Company, EmailOutbox, DigestItem
+from .metrics import EMAIL_LATENCY
+import json
+import smtplib
+import threading
+import time
 
 
 def _send(subject, recipients, body, html=None):
+    # Enfileira no outbox dentro da transação corrente; o commit de quem chamou
+    # efetiva o envio (entregue pelo worker de app/mailer.py)
+    if not current_app.config.get('MAIL_OUTBOX_ENABLED', True):
+        return _deliver(subject, recipients, body, html)
+    item = EmailOutbox(subject=subject[:255], recipients=json.dumps(list(recipients)), body=body, html=html)
+    db.session.add(item)
+    return item
+
+
+def _send_to_users(subject, users, body, html=None, ticket=None, kind=None):
+    # Usuários em modo resumo recebem o evento depois, agrupado (mailer.flush_digests);
+    # os demais entram na mensagem imediata. O resumo depende do worker do outbox.
+    outbox = current_app.config.get('MAIL_OUTBOX_ENABLED', True)
+    recipients = []
+    seen = set()
+    for user in users:
+        if user is None or user.id in seen:
+            continue
+        seen.add(user.id)
+        if outbox and (user.notify_digest_minutes or 0) > 0:
+            db.session.add(DigestItem(user_id=user.id, ticket_id=ticket.id if ticket else None,
+                                      kind=kind or 'ticket', subject=subject[:255], body=body))
+        else:
+            recipients.append(user.email)
+    if recipients:
+        _send(subject, recipients, body, html)
+
+
+def _deliver(subject, recipients, body, html=None, pool=None):
+    # pool=SMTPPool reaproveita a sessão SMTP (worker/lotes); sem pool, uma conexão por mensagem
     msg = Message(subject=subject, recipients=recipients, body=body)
     if html:
         msg.html = html
     if current_app.config.get('MAIL_SUPPRESS_SEND', True):
         print(f"[MAIL SUPPRESSED] To: {', '.join(recipients)}\nSubject: {subject}\n\n{body}")
+        EMAIL_LATENCY.observe(0.0, 'suppressed')
         return
+    start = time.perf_counter()
     try:
-        mail.send(msg)
+        if pool is not None:
+            pool.send(msg)
+        else:
+            mail.send(msg)
     except Exception as e:
+        EMAIL_LATENCY.observe(time.perf_counter() - start, 'error')
         current_app.logger.exception('Erro ao enviar e-mail')
         raise e
+    EMAIL_LATENCY.observe(time.perf_counter() - start, 'sent')
+
+
+class SMTPPool:
+    """Sessão SMTP reutilizável (uma por thread): conexão, TLS e AUTH uma vez
+    para muitas mensagens. Renova após MAIL_SMTP_IDLE_SECONDS ocioso ou
+    MAIL_SMTP_MAX_MESSAGES enviadas e reconecta uma vez se o servidor caiu."""
+
+    RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _connection(self):
+        st = self._local
+        conn = getattr(st, 'conn', None)
+        cfg = current_app.config
+        if conn is not None:
+            idle = time.monotonic() - st.last_used
+            if idle > cfg.get('MAIL_SMTP_IDLE_SECONDS', 30) or st.sent >= cfg.get('MAIL_SMTP_MAX_MESSAGES', 500):
+                self.close()
+                conn = None
+        if conn is None:
+            conn = mail.connect()
+            conn.__enter__()
+            st.conn = conn
+            st.sent = 0
+            st.last_used = time.monotonic()
+        return conn
+
+    def send(self, msg):
+        try:
+            self._connection().send(msg)
+        except self.RECONNECT_ERRORS:
+            self.close()
+            self._connection().send(msg)
+        st = self._local
+        st.sent += 1
+        st.last_used = time.monotonic()
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn.__exit__(None, None, None)
+            except Exception:
+                pass
+
+
+smtp_pool = SMTPPool()
+
+# Exceções SMTP (subclasses de OSError) que valem só para a mensagem
+MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+
+def deliver_batch(messages, pool=None):
+    """Envia vários (subject, recipients, body, html) pela mesma sessão SMTP.
+
+    Retorna uma lista alinhada com ``messages``: None para enviada ou a exceção.
+    """
+    pool = pool or smtp_pool
+    results = []
+    for subject, recipients, body, html in messages:
+        try:
+            _deliver(subject, recipients, body, html, pool=pool)
+            results.append(None)
+        except MESSAGE_ERRORS as e:
+            # Recusa desta mensagem (destinatário, remetente, conteúdo): a sessão segue válida
+            results.append(e)
+        except (OSError, smtplib.SMTPServerDisconnected) as e:
+            # Servidor fora do ar mesmo após reconectar: não insiste no resto do lote
+            pool.close()
+            results.extend([e] * (len(messages) - len(results)))
+            break
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+# Cache de modelos e do layout HTML por empresa: o caminho quente (cada
+# notificação) não faz consultas. Entradas expiram após EMAIL_CACHE_SECONDS
+# (outros processos) e são descartadas na hora pelas telas de admin
+# (invalidate_email_templates / invalidate_company_branding).
+_template_cache = {}  # (company_id, name) -> (expira_em, (subject, body) | None)
+_shell_cache = {}  # company_id -> (expira_em, (antes do título, entre título e corpo, depois do corpo))
+_SUBJECT_MARK = '\x00subject\x00'
+_BODY_MARK = '\x00body\x00'
+
+
+def _cached(cache, key, loader):
+    now = time.monotonic()
+    hit = cache.get(key)
+    if hit is not None and hit[0] > now:
+        return hit[1]
+    value = loader()
+    cache[key] = (now + current_app.config.get('EMAIL_CACHE_SECONDS', 300), value)
+    return value
+
+
+def invalidate_email_templates():
+    # Modelos globais valem para todas as empresas: descarta tudo
+    _template_cache.clear()
+
+
+def invalidate_company_branding(company_id=None):
+    if company_id is None:
+        _shell_cache.clear()
+    else:
+        _shell_cache.pop(company_id, None)
+
+
+def _load_template(company_id, name):
+    tpl = EmailTemplate.query.filter_by(company_id=company_id, name=name, active=True).first()
+    # None também é cacheado: a maioria das empresas não tem modelo próprio
+    return (tpl.subject, tpl.body) if tpl else None
 
 
 def _render_template(name, company_id, default_subject, default_body, context: dict):
     tpl = None
     if company_id:
-        tpl = EmailTemplate.query.filter_by(company_id=company_id, name=name, active=True).first()
+        tpl = _cached(_template_cache, (company_id, name), lambda: _load_template(company_id, name))
     if not tpl:
-        tpl = EmailTemplate.query.filter_by(company_id=None, name=name, active=True).first()
+        tpl = _cached(_template_cache, (None, name), lambda: _load_template(None, name))
     subject = default_subject
     body = default_body
     if tpl:
         try:
-            subject = (tpl.subject or default_subject).format_map(context)
-            body = (tpl.body or default_body).format_map(context)
+            subject = (tpl[0] or default_subject).format_map(context)
+            body = (tpl[1] or default_body).format_map(context)
         except Exception:
             pass
     else:
@@ -64,22 +221,22 @@ def _text_to_html(body: str) -> str:
     return "\n".join(html_parts) or "<p></p>"
 
 
-def _wrap_html(subject: str, company_id, body: str) -> str:
+def _compile_shell(company_id):
+    # Layout da empresa montado uma vez, partido nos pontos de assunto e corpo
     brand = _brand_for_company(company_id)
-    body_html = _text_to_html(body)
     primary = brand['primary']
     logo_html = (
         f"<img src=\"{brand['logo_url']}\" alt=\"{brand['brand_name']}\" style=\"max-height:40px; display:block;\">"
         if brand['logo_url'] else
         f"<div style=\"font-weight:700; font-size:20px; color:#fff;\">{brand['brand_name']}</div>"
     )
-    return f"""
+    html = f"""
 <!doctype html>
 <html lang=\"pt-BR\">
 <head>
   <meta charset=\"utf-8\">
   <meta name=\"viewport\" content=\"width=device-width, initial-scale=1\">
-  <title>{subject}</title>
+  <title>{_SUBJECT_MARK}</title>
   <style>
     @media (prefers-color-scheme: dark) {{ body {{ background:#111 !important; }} }}
   </style>
@@ -88,13 +245,21 @@ def _wrap_html(subject: str, company_id, body: str) -> str:
   <div style=\"max-width:640px; margin:0 auto;\">
     <div style=\"background:{primary}; padding:16px 20px; border-radius:12px 12px 0 0;\">{logo_html}</div>
     <div style=\"background:#fff; border:1px solid #e5e7eb; border-top:0; border-radius:0 0 12px 12px; padding:20px;\">
-      {body_html}
+      {_BODY_MARK}
     </div>
     <div style=\"text-align:center; color:#6b7280; font-size:12px; margin-top:12px;\">© {brand['brand_name']}</div>
   </div>
 </body>
 </html>
 """
+    head, rest = html.split(_SUBJECT_MARK, 1)
+    middle, tail = rest.split(_BODY_MARK, 1)
+    return head, middle, tail
+
+
+def _wrap_html(subject: str, company_id, body: str) -> str:
+    head, middle, tail = _cached(_shell_cache, company_id, lambda: _compile_shell(company_id))
+    return ''.join((head, subject, middle, _text_to_html(body), tail))
 
 
 def send_confirmation_email(user, token):
@@ -163,14 +328,14 @@ def send_ticket_comment(ticket, author, public=True):
         'link': link,
     }
     subject, body = _render_template('ticket_comment', ticket.company_id, default_subject, default_body, context)
-    recipients = []
+    users = []
     if public:
-        recipients.append(ticket.creator.email)
+        users.append(ticket.creator)
     if ticket.assignee:
-        recipients.append(ticket.assignee.email)
-    if recipients:
+        users.append(ticket.assignee)
+    if users:
         html = _wrap_html(subject, ticket.company_id, body)
-        _send(subject, recipients, body, html)
+        _send_to_users(subject, users, body, html, ticket=ticket, kind='ticket_comment')
 
 
 def send_ticket_status(ticket, actor, old_status, new_status):
@@ -190,11 +355,9 @@ def send_ticket_status(ticket, actor, old_status, new_status):
         'link': link,
     }
     subject, body = _render_template('ticket_status', ticket.company_id, default_subject, default_body, context)
-    recipients = [ticket.creator.email]
-    if ticket.assignee:
-        recipients.append(ticket.assignee.email)
+    users = [ticket.creator, ticket.assignee]
     html = _wrap_html(subject, ticket.company_id, body)
-    _send(subject, recipients, body, html)
+    _send_to_users(subject, users, body, html, ticket=ticket, kind='ticket_status')
 
 
 def send_otp_email(user, code):
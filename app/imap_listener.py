@@ -0,0 +1,116 @@
+"""Ingestão contínua de e-mails via IMAP IDLE (e-mail -> ticket em segundos).
+
+Mantém uma conexão IMAP aberta: lê o que chegou (utils.ingest_imap_mailbox,
+mesma lógica do botão "poll IMAP"), entra em IDLE e volta a ler assim que o
+servidor avisa de mensagem nova. Caiu a conexão: reconecta com backoff
+exponencial. Servidor sem IDLE: consulta a cada IMAP_POLL_SECONDS.
+Processo separado: ``python run_imap.py``.
+"""
+import imaplib
+import random
+import select
+import time
+import threading
+from .metrics import IMAP_POLL_LATENCY
+from .utils import ingest_imap_mailbox, start_parse_pool, stop_parse_pool
+
+
+def _connect(config):
+    host = config.get('IMAP_HOST')
+    port = config.get('IMAP_PORT', 993)
+    conn = imaplib.IMAP4_SSL(host, port) if config.get('IMAP_SSL', True) else imaplib.IMAP4(host, port)
+    conn.login(config.get('IMAP_USERNAME'), config.get('IMAP_PASSWORD'))
+    return conn
+
+
+def _readable(conn, timeout):
+    sock = conn.sock
+    # TLS pode ter bytes já decifrados que o select não enxerga
+    if getattr(sock, 'pending', None) and sock.pending():
+        return True
+    r, _, _ = select.select([sock], [], [], timeout)
+    return bool(r)
+
+
+def idle(conn, seconds, stop):
+    """IDLE (RFC 2177) até chegar uma resposta do servidor, passar ``seconds``
+    ou ``stop`` ser sinalizado. Retorna True se houve atividade na caixa."""
+    tag = conn._new_tag().decode()
+    conn.send(f'{tag} IDLE\r\n'.encode())
+    line = conn.readline()
+    if not line.startswith(b'+'):
+        raise imaplib.IMAP4.error(f'IDLE recusado: {line!r}')
+    activity = False
+    deadline = time.monotonic() + seconds
+    while not stop.is_set():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        if _readable(conn, min(remaining, 1.0)):
+            line = conn.readline()
+            if not line:
+                raise imaplib.IMAP4.abort('conexão encerrada durante IDLE')
+            # EXISTS/RECENT/EXPUNGE/FETCH: sai do IDLE e deixa a ingestão decidir
+            activity = True
+            break
+    conn.send(b'DONE\r\n')
+    # Consome o que sobrou até a resposta marcada do IDLE
+    while True:
+        line = conn.readline()
+        if not line:
+            raise imaplib.IMAP4.abort('conexão encerrada ao sair do IDLE')
+        if line.startswith(tag.encode()):
+            if b' OK' not in line[:len(tag) + 4]:
+                raise imaplib.IMAP4.error(f'IDLE terminou com erro: {line!r}')
+            return activity
+        activity = True
+
+
+def run_listener(app, stop=None):
+    stop = stop or threading.Event()
+    config = app.config
+    mailbox = config.get('IMAP_MAILBOX', 'INBOX')
+    name = f"imap:{config.get('IMAP_USERNAME')}@{config.get('IMAP_HOST')}/{mailbox}"
+    batch = config.get('IMAP_FETCH_BATCH', 50)
+    idle_seconds = config.get('IMAP_IDLE_SECONDS', 1500)
+    poll_seconds = config.get('IMAP_POLL_SECONDS', 60)
+    max_backoff = config.get('IMAP_RECONNECT_MAX_SECONDS', 300)
+    backoff = 1
+    # Decodificação MIME em processos só aqui (processo do listener)
+    start_parse_pool(config)
+    try:
+        while not stop.is_set():
+            conn = None
+            try:
+                conn = _connect(config)
+                can_idle = 'IDLE' in conn.capabilities
+                app.logger.info('IMAP conectado (%s, IDLE=%s)', name, can_idle)
+                backoff = 1
+                while not stop.is_set():
+                    conn.untagged_responses.pop('EXISTS', None)
+                    with app.app_context():
+                        with IMAP_POLL_LATENCY.time():
+                            count = ingest_imap_mailbox(conn, name, mailbox, batch)
+                    if count:
+                        app.logger.info('IMAP: %s mensagem(ns) processada(s)', count)
+                    # O SELECT informa o total (EXISTS); outro valor depois dele = chegou
+                    # mensagem durante a leitura. Lê de novo em vez de esperar no IDLE
+                    if len(set(conn.untagged_responses.pop('EXISTS', None) or [])) > 1:
+                        continue
+                    if can_idle:
+                        idle(conn, idle_seconds, stop)
+                    else:
+                        stop.wait(poll_seconds)
+            except Exception:
+                app.logger.exception('Falha na conexão IMAP; reconectando em ~%ss', backoff)
+                # jitter para várias instâncias não reconectarem juntas
+                stop.wait(backoff * random.uniform(0.5, 1.0))
+                backoff = min(backoff * 2, max_backoff)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.logout()
+                    except Exception:
+                        pass
+    finally:
+        stop_parse_pool()
@@ -0,0 +1,59 @@
+"""Decodificação MIME de e-mails recebidos (roda em processos do pool).
+
+Sem Flask/banco aqui: recebe os bytes da mensagem, devolve o texto e grava
+os anexos decodificados num diretório de spool; quem chamou move os arquivos
+para uploads/<ticket_id>/ e cria os registros Attachment.
+"""
+import email
+import os
+import uuid
+
+
+def message_text(msg):
+    body = ''
+    if msg.is_multipart():
+        for part in msg.walk():
+            ctype = part.get_content_type()
+            disp = part.get('Content-Disposition', '') or ''
+            if ctype == 'text/plain' and 'attachment' not in disp:
+                charset = part.get_content_charset() or 'utf-8'
+                try:
+                    body = part.get_payload(decode=True).decode(charset, errors='ignore')
+                except Exception:
+                    body = part.get_payload(decode=True).decode('utf-8', errors='ignore')
+                break
+    else:
+        charset = msg.get_content_charset() or 'utf-8'
+        try:
+            body = msg.get_payload(decode=True).decode(charset, errors='ignore')
+        except Exception:
+            body = msg.get_payload(decode=True)
+    return body
+
+
+def parse_message(raw, spool_dir, max_bytes=None):
+    msg = email.message_from_bytes(raw)
+    attachments = []
+    skipped = 0
+    if msg.is_multipart():
+        for part in msg.walk():
+            if part.is_multipart():
+                continue
+            name = part.get_filename()
+            disp = (part.get('Content-Disposition', '') or '').lower()
+            if not name and 'attachment' not in disp:
+                continue
+            data = part.get_payload(decode=True) or b''
+            if max_bytes and len(data) > max_bytes:
+                skipped += 1
+                continue
+            path = os.path.join(spool_dir, uuid.uuid4().hex + '.part')
+            with open(path, 'wb') as f:
+                f.write(data)
+            attachments.append({
+                'name': name or 'anexo',
+                'content_type': part.get_content_type(),
+                'path': path,
+                'size': len(data),
+            })
+    return {'text': message_text(msg), 'attachments': attachments, 'skipped': skipped}
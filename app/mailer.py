@@ -0,0 +1,165 @@
+"""Entrega dos e-mails do outbox (EmailOutbox) com retentativas.
+
+As rotas só gravam a mensagem na transação (email._send); aqui um worker
+reivindica lotes pendentes com um UPDATE condicional (seguro com vários
+processos), entrega via SMTP e reagenda falhas com backoff exponencial.
+Também gera os resumos de quem usa modo resumo (flush_digests).
+Roda como thread no processo web (MAIL_OUTBOX_WORKER) ou em processo
+separado: ``python run_mailer.py``.
+"""
+import json
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import event, or_, func
+from sqlalchemy.orm import Session
+from . import db
+from .models import EmailOutbox, DigestItem, User
+
+CLAIM_SECONDS = 300
+MAX_BACKOFF_SECONDS = 3600
+
+_wake = threading.Event()
+_worker = None
+
+
+def _claim(item_id, now):
+    # Reivindica a mensagem; mensagens presas em 'sending' (worker morto) voltam após CLAIM_SECONDS
+    return (EmailOutbox.query
+            .filter(EmailOutbox.id == item_id,
+                    or_(EmailOutbox.status == 'pending',
+                        (EmailOutbox.status == 'sending') & (EmailOutbox.locked_until < now)))
+            .update({'status': 'sending', 'locked_until': now + timedelta(seconds=CLAIM_SECONDS)},
+                    synchronize_session=False))
+
+
+def process_outbox(config, limit=None):
+    """Entrega um lote de mensagens vencidas. Retorna (enviadas, falhas)."""
+    from .email import deliver_batch
+    limit = limit or config.get('MAIL_OUTBOX_BATCH', 50)
+    max_attempts = config.get('MAIL_OUTBOX_MAX_ATTEMPTS', 8)
+    backoff = config.get('MAIL_OUTBOX_BACKOFF_SECONDS', 30)
+    now = datetime.utcnow()
+    ids = [row[0] for row in (db.session.query(EmailOutbox.id)
+                              .filter(or_(EmailOutbox.status == 'pending',
+                                          (EmailOutbox.status == 'sending') & (EmailOutbox.locked_until < now)),
+                                      EmailOutbox.next_attempt_at <= now)
+                              .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+                              .limit(limit))]
+    claimed = [item_id for item_id in ids if _claim(item_id, now)]
+    db.session.commit()
+    if not claimed:
+        return 0, 0
+    items = EmailOutbox.query.filter(EmailOutbox.id.in_(claimed)).order_by(EmailOutbox.id).all()
+    # Lote inteiro pela mesma sessão SMTP (app/email.py: SMTPPool)
+    results = deliver_batch([(i.subject, json.loads(i.recipients), i.body, i.html) for i in items])
+    sent = failed = 0
+    finished = datetime.utcnow()
+    for item, error in zip(items, results):
+        item.attempts = (item.attempts or 0) + 1
+        item.locked_until = None
+        if error is None:
+            item.status = 'sent'
+            item.sent_at = finished
+            sent += 1
+            continue
+        item.last_error = str(error)[:1000]
+        if item.attempts >= max_attempts:
+            item.status = 'failed'
+        else:
+            item.status = 'pending'
+            delay = min(backoff * (2 ** (item.attempts - 1)), MAX_BACKOFF_SECONDS)
+            item.next_attempt_at = finished + timedelta(seconds=delay)
+        failed += 1
+    db.session.commit()
+    return sent, failed
+
+
+def flush_digests(config, now=None, limit=None):
+    """Junta os itens vencidos de cada usuário em modo resumo num único e-mail
+    do outbox. Retorna quantos resumos foram gerados."""
+    from .email import _send, _wrap_html
+    now = now or datetime.utcnow()
+    limit = limit or config.get('MAIL_OUTBOX_BATCH', 50)
+    pending = (db.session.query(DigestItem.user_id, func.min(DigestItem.created_at), User.notify_digest_minutes)
+               .join(User, User.id == DigestItem.user_id)
+               .group_by(DigestItem.user_id, User.notify_digest_minutes)
+               .all())
+    # Vence quando o item mais antigo completa a janela do usuário (ou se ele saiu do modo resumo)
+    due = [user_id for user_id, oldest, minutes in pending
+           if oldest is None or oldest + timedelta(minutes=minutes or 0) <= now][:limit]
+    flushed = 0
+    for user_id in due:
+        user = db.session.get(User, user_id)
+        items = DigestItem.query.filter_by(user_id=user_id).order_by(DigestItem.id).all()
+        if not user or not items:
+            continue
+        # DELETE condicional: se outro worker já levou estes itens, não envia em dobro
+        deleted = (DigestItem.query.filter(DigestItem.id.in_([i.id for i in items]))
+                   .delete(synchronize_session=False))
+        if deleted != len(items):
+            db.session.rollback()
+            continue
+        if len(items) == 1:
+            subject, body = items[0].subject, items[0].body
+        else:
+            tickets = len({i.ticket_id for i in items})
+            subject = f"Resumo: {len(items)} atualizações em {tickets} chamado(s)"
+            body = "\n\n".join(f"{i.subject}\n{i.body or ''}".strip() for i in items)
+        try:
+            html = _wrap_html(subject, user.company_id, body)
+        except Exception:
+            html = None  # fora de requisição o logo pode não ter URL: segue só texto
+        _send(subject, [user.email], body, html)
+        db.session.commit()
+        flushed += 1
+    return flushed
+
+
+def run_worker(app, stop=None):
+    poll = app.config.get('MAIL_OUTBOX_POLL_SECONDS', 5)
+    from .email import smtp_pool
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        busy = False
+        try:
+            with app.app_context():
+                flush_digests(app.config)
+                sent, failed = process_outbox(app.config)
+                busy = (sent + failed) >= app.config.get('MAIL_OUTBOX_BATCH', 50)
+        except Exception:
+            app.logger.exception('Falha ao processar o outbox de e-mail')
+        if not busy:
+            # Fila vazia: libera a sessão SMTP em vez de mantê-la ociosa
+            smtp_pool.close()
+            _wake.wait(poll)
+            _wake.clear()
+
+
+def init_mailer(app):
+    global _worker
+    if not app.config.get('MAIL_OUTBOX_ENABLED', True) or not app.config.get('MAIL_OUTBOX_WORKER', True):
+        return
+    if app.config.get('TESTING') or (_worker is not None and _worker.is_alive()):
+        return
+    _worker = threading.Thread(target=run_worker, args=(app,), name='mail-outbox', daemon=True)
+    _worker.start()
+
+
+# Acorda o worker logo após o commit que gravou mensagens (sem esperar o poll)
+def _note_outbox(session, flush_context):
+    if any(isinstance(obj, EmailOutbox) for obj in session.new):
+        session.info['_outbox_dirty'] = True
+
+
+def _wake_worker(session):
+    if session.info.pop('_outbox_dirty', None):
+        _wake.set()
+
+
+def _forget_outbox(session):
+    session.info.pop('_outbox_dirty', None)
+
+
+event.listen(Session, 'after_flush', _note_outbox)
+event.listen(Session, 'after_commit', _wake_worker)
+event.listen(Session, 'after_rollback', _forget_outbox)
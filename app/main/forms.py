@@ -1,5 +1,5 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, SubmitField
+from wtforms import StringField, PasswordField, SubmitField, SelectField
 from wtforms.validators import DataRequired, Email, Length, Optional, EqualTo
 from flask_wtf.file import FileField
 
@@ -10,6 +10,9 @@ class ProfileForm(FlaskForm):
     password = PasswordField('Nova senha (opcional)', validators=[Optional(), Length(min=6)])
     confirm_password = PasswordField('Confirmar Senha', validators=[Optional(), EqualTo('password')])
     avatar_file = FileField('Foto de perfil (opcional)')
+    notify_digest_minutes = SelectField('Notificações de chamados', coerce=int, default=0, choices=[
+        (0, 'Imediatas'), (15, 'Resumo a cada 15 minutos'), (60, 'Resumo a cada hora'), (240, 'Resumo a cada 4 horas'),
+    ])
     submit = SubmitField('Salvar alterações')
 
 
@@ -46,6 +46,7 @@ def profile():
         current_user.email = email
         if form.password.data:
             current_user.set_password(form.password.data)
+        current_user.notify_digest_minutes = form.notify_digest_minutes.data or 0
         # Avatar upload
         f = request.files.get('avatar_file')
         if f and getattr(f, 'filename', ''):
@@ -0,0 +1,194 @@
+"""Métricas em processo no formato texto do Prometheus (endpoint /metrics).
+
+Contadores e histogramas com buckets pré-alocados; cada série é uma lista
+indexada pela tupla de valores dos labels, sem dicionários por requisição.
+"""
+import hmac
+import threading
+import time
+import ipaddress
+from bisect import bisect_left
+from contextlib import contextmanager
+from flask import current_app, g, has_request_context, request, Response, abort
+from sqlalchemy import event
+from . import db
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOW_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            yield f'{self.name}{_labels(self.labelnames, labels)} {value}'
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value=0):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # série: [contagem por bucket..., +Inf, soma]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[idx] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def collect(self):
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._series.items()]
+        for labels, series in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, series):
+                cumulative += n
+                le = _labels(self.labelnames, labels, 'le="%s"' % bound)
+                yield f'{self.name}_bucket{le} {cumulative}'
+            cumulative += series[len(self.buckets)]
+            le = _labels(self.labelnames, labels, 'le="+Inf"')
+            yield f'{self.name}_bucket{le} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.labelnames, labels)} {series[-1]}'
+            yield f'{self.name}_count{_labels(self.labelnames, labels)} {cumulative}'
+
+
+HTTP_REQUESTS = Counter('servicedesk_http_requests_total', 'Requisições HTTP atendidas', ('blueprint', 'endpoint', 'status'))
+HTTP_LATENCY = Histogram('servicedesk_http_request_duration_seconds', 'Latência das requisições HTTP', ('blueprint', 'endpoint'))
+DB_QUERIES = Counter('servicedesk_db_queries_total', 'Consultas SQL executadas', ('endpoint',))
+SSE_ACTIVE = Gauge('servicedesk_sse_active_connections', 'Conexões SSE abertas', ('stream',))
+EMAIL_LATENCY = Histogram('servicedesk_email_send_duration_seconds', 'Tempo de envio de e-mail', ('outcome',), buckets=SLOW_BUCKETS)
+IMAP_POLL_LATENCY = Histogram('servicedesk_imap_poll_duration_seconds', 'Duração da leitura da caixa IMAP', (), buckets=SLOW_BUCKETS)
+AUDIT_RECORDS = Counter('servicedesk_audit_records_total', 'Registros de auditoria gravados (batch, sync, dropped)', ('path',))
+
+REGISTRY = [HTTP_REQUESTS, HTTP_LATENCY, DB_QUERIES, SSE_ACTIVE, EMAIL_LATENCY, IMAP_POLL_LATENCY, AUDIT_RECORDS]
+
+
+@contextmanager
+def track_stream(name):
+    SSE_ACTIVE.inc(name)
+    try:
+        yield
+    finally:
+        SSE_ACTIVE.dec(name)
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        lines.extend(metric.collect())
+    return '\n'.join(lines) + '\n'
+
+
+def init_metrics(app):
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'after_cursor_execute', _count_query)
+
+    @app.before_request
+    def _metrics_start():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _metrics_finish(response):
+        start = g.pop('_metrics_start', None)
+        endpoint = request.endpoint or 'unknown'
+        blueprint = request.blueprint or ''
+        if start is not None:
+            HTTP_LATENCY.observe(time.perf_counter() - start, blueprint, endpoint)
+        HTTP_REQUESTS.inc(blueprint, endpoint, response.status_code)
+        queries = g.pop('_metrics_queries', 0)
+        if queries:
+            DB_QUERIES.inc(endpoint, amount=queries)
+        return response
+
+    allowed = []
+    for item in app.config.get('METRICS_ALLOWED_IPS', []):
+        try:
+            allowed.append(ipaddress.ip_network(item, strict=False))
+        except ValueError:
+            continue
+
+    def metrics_view():
+        # Sem METRICS_TOKEN o endpoint fica desligado: atrás de um proxy local
+        # todo acesso chega de 127.0.0.1 e um filtro só por IP o deixaria público
+        token = current_app.config.get('METRICS_TOKEN')
+        if not token:
+            abort(404)
+        supplied = request.headers.get('Authorization', '').encode()
+        if not hmac.compare_digest(supplied, f'Bearer {token}'.encode()):
+            abort(403)
+        if allowed:
+            try:
+                ip = ipaddress.ip_address(request.remote_addr or '')
+            except ValueError:
+                abort(403)
+            if not any(ip in net for net in allowed):
+                abort(403)
+        return Response(render(), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g._metrics_queries = g.get('_metrics_queries', 0) + 1
+    else:
+        DB_QUERIES.inc('')
@@ -3,6 +3,8 @@ from flask_login import UserMixin
 from itsdangerous import URLSafeTimedSerializer
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 from . import db
 
 
@@ -51,6 +53,10 @@ class User(UserMixin, db.Model):
     last_login_at = db.Column(db.DateTime)
     avatar_filename = db.Column(db.String(255))
     consent_accepted_at = db.Column(db.DateTime)
+    # Contador denormalizado de notificações não lidas; NULL = ainda não calculado
+    unread_notifications = db.Column(db.Integer)
+    # Modo resumo: 0 = imediato; N = agrupa e-mails/notificações de tickets em janelas de N minutos
+    notify_digest_minutes = db.Column(db.Integer, default=0)
 
     tickets_created = db.relationship('Ticket', backref='creator', foreign_keys='Ticket.created_by_id', lazy=True)
     tickets_assigned = db.relationship('Ticket', backref='assignee', foreign_keys='Ticket.assigned_to_id', lazy=True)
@@ -246,6 +252,13 @@ class Ticket(db.Model):
 
     participants = db.relationship('TicketParticipant', backref='ticket', lazy=True, cascade='all, delete-orphan')
 
+    __table_args__ = (
+        # Paginação keyset da listagem (created_at, id)
+        db.Index('ix_ticket_created_at_id', 'created_at', 'id'),
+        # Avaliações recentes e tendência diária dos relatórios
+        db.Index('ix_ticket_user_rating_at', 'user_rating_at'),
+    )
+
     def apply_sla(self, sla_plan: 'SLAPlan'):
         self.sla_plan = sla_plan
         if sla_plan:
@@ -315,10 +328,92 @@ class Notification(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     seen_at = db.Column(db.DateTime)
     read_at = db.Column(db.DateTime)
+    group_count = db.Column(db.Integer, default=1)  # eventos agrupados (modo resumo)
 
     user = db.relationship('User')
 
 
+class EmailOutbox(db.Model):
+    # Fila transacional de e-mails: gravada na mesma transação da alteração do
+    # ticket e entregue pelo worker (app/mailer.py / run_mailer.py)
+    __tablename__ = 'email_outbox'
+    id = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(255), nullable=False)
+    recipients = db.Column(db.Text, nullable=False)  # JSON list
+    body = db.Column(db.Text)
+    html = db.Column(db.Text)
+    status = db.Column(db.String(16), default='pending', nullable=False)  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_until = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_email_outbox_status_next', 'status', 'next_attempt_at'),
+    )
+
+
+class Checkpoint(db.Model):
+    # Estado de rotinas incrementais (ex.: último UID lido por caixa IMAP), JSON em value
+    __tablename__ = 'checkpoint'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(190), unique=True, nullable=False)
+    value = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class InboundMessage(db.Model):
+    # E-mail já transformado em ticket/comentário; Message-ID único evita duplicatas
+    __tablename__ = 'inbound_message'
+    id = db.Column(db.Integer, primary_key=True)
+    message_id = db.Column(db.String(255), unique=True, nullable=False)
+    mailbox = db.Column(db.String(190))
+    uid = db.Column(db.Integer)
+    ticket_id = db.Column(db.Integer, db.ForeignKey('ticket.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class DigestItem(db.Model):
+    # E-mail adiado de um usuário em modo resumo; o worker do outbox junta os
+    # itens vencidos numa única mensagem (mailer.flush_digests)
+    __tablename__ = 'digest_item'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    ticket_id = db.Column(db.Integer, db.ForeignKey('ticket.id'))
+    kind = db.Column(db.String(32), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# Mantém User.unread_notifications na mesma transação do INSERT da notificação,
+# qualquer que seja o caminho que a criou (tickets, e-mail, automações).
+def _bump_unread_counters(session, flush_context):
+    counts = {}
+    for obj in session.new:
+        if isinstance(obj, Notification) and obj.read_at is None:
+            counts[obj.user_id] = counts.get(obj.user_id, 0) + 1
+    for obj in session.deleted:
+        if isinstance(obj, Notification) and obj.read_at is None:
+            counts[obj.user_id] = counts.get(obj.user_id, 0) - 1
+    counts = {k: v for k, v in counts.items() if v}
+    if not counts:
+        return
+    users = User.__table__
+    conn = session.connection()
+    for user_id, n in counts.items():
+        conn.execute(
+            users.update()
+            .where(users.c.id == user_id, users.c.unread_notifications.isnot(None))
+            .values(unread_notifications=users.c.unread_notifications + n)
+        )
+
+
+event.listen(Session, 'after_flush', _bump_unread_counters)
+
+
 class LGPDRevision(db.Model):
     __tablename__ = 'lgpd_revision'
     id = db.Column(db.Integer, primary_key=True)
@@ -343,6 +438,13 @@ class AuditLog(db.Model):
     data = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Histórico por entidade/usuário (keyset em id) e corte por data do arquivamento
+        db.Index('ix_audit_log_entity', 'entity', 'entity_id', 'id'),
+        db.Index('ix_audit_log_user', 'user_id', 'id'),
+        db.Index('ix_audit_log_created_at', 'created_at', 'id'),
+    )
+
 
 class GameScore(db.Model):
     __tablename__ = 'game_score'
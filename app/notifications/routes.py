@@ -1,14 +1,87 @@
-from flask import Blueprint, jsonify, request, Response, stream_with_context
+from flask import Blueprint, jsonify, request, Response, stream_with_context, current_app
 from flask_login import login_required, current_user
-from datetime import datetime
-from ..models import Notification
+from datetime import datetime, timedelta
+from ..models import Notification, User
+from sqlalchemy import select, func, case
 from .. import db
-import json
+from ..broker import broker
+from ..metrics import track_stream
+from ..realtime.sse import sse_message, sse_retry, last_event_id, parse_cursor, KEEPALIVE
 import time
 
 notify_bp = Blueprint('notify', __name__)
 
 
+def add_notification(user, company_id, kind, title, body=None, link=None):
+    # Modo resumo (User.notify_digest_minutes): eventos do mesmo tipo/ticket dentro
+    # da janela substituem a notificação ainda não lida, em vez de somar linhas.
+    # Troca (DELETE + INSERT) para o stream enxergar um id novo; o contador de
+    # não lidas fica igual (models._bump_unread_counters)
+    count = 1
+    minutes = (user.notify_digest_minutes or 0) if user is not None else 0
+    if minutes > 0 and link:
+        since = datetime.utcnow() - timedelta(minutes=minutes)
+        prev = (Notification.query
+                .filter(Notification.user_id == user.id, Notification.kind == kind, Notification.link == link,
+                        Notification.read_at.is_(None), Notification.created_at >= since)
+                .order_by(Notification.id.desc())
+                .first())
+        if prev is not None:
+            count = (prev.group_count or 1) + 1
+            db.session.delete(prev)
+            title = f"{title} (+{count - 1})"[:200]
+    note = Notification(user_id=user.id, company_id=company_id, kind=kind, title=title,
+                        body=body, link=link, group_count=count)
+    db.session.add(note)
+    return note
+
+
+def unread_count(user_id):
+    # Leitura O(1) pela PK; na primeira vez (NULL) calcula e grava num único UPDATE
+    users = User.__table__
+    value = db.session.execute(select(users.c.unread_notifications).where(users.c.id == user_id)).scalar()
+    if value is not None:
+        return value
+    pending = (select(func.count(Notification.id))
+               .where(Notification.user_id == user_id, Notification.read_at.is_(None))
+               .scalar_subquery())
+    db.session.execute(users.update()
+                       .where(users.c.id == user_id, users.c.unread_notifications.is_(None))
+                       .values(unread_notifications=pending))
+    db.session.commit()
+    return db.session.execute(select(users.c.unread_notifications).where(users.c.id == user_id)).scalar() or 0
+
+
+def _adjust_unread(user_id, delta=None):
+    # delta=None zera o contador; senão soma (sem ficar negativo)
+    users = User.__table__
+    col = users.c.unread_notifications
+    if delta is None:
+        db.session.execute(users.update().where(users.c.id == user_id).values(unread_notifications=0))
+        return
+    value = case((col + delta < 0, 0), else_=col + delta)
+    db.session.execute(users.update().where(users.c.id == user_id, col.isnot(None)).values(unread_notifications=value))
+
+
+def _mark_delivered(user_id, items):
+    # Confirma a entrega com um único UPDATE na faixa de ids entregue. A faixa
+    # contém exatamente os itens buscados (ids consecutivos do usuário no filtro),
+    # então não marca nada que não foi enviado; commit só se algo mudou.
+    if not items:
+        return 0
+    ids = [n.id for n in items if not n.seen_at]
+    if not ids:
+        return 0
+    changed = (Notification.query
+               .filter(Notification.user_id == user_id,
+                       Notification.id.between(min(ids), max(ids)),
+                       Notification.seen_at.is_(None))
+               .update({'seen_at': datetime.utcnow()}, synchronize_session=False))
+    if changed:
+        db.session.commit()
+    return changed
+
+
 @notify_bp.route('/notify/poll')
 @login_required
 def poll():
@@ -20,7 +93,7 @@ def poll():
         # Primeira carga: só trazer não vistas para evitar repetir toasts a cada refresh
         q = base.filter(Notification.seen_at == None)  # type: ignore
     items = q.limit(20).all()
-    unread = Notification.query.filter_by(user_id=current_user.id, read_at=None).count()
+    unread = unread_count(current_user.id)
     data = [
         {
             'id': n.id,
@@ -31,12 +104,7 @@ def poll():
         }
         for n in items
     ]
-    # mark delivered (seen)
-    now = datetime.utcnow()
-    for n in items:
-        if not n.seen_at:
-            n.seen_at = now
-    db.session.commit()
+    _mark_delivered(current_user.id, items)
     return jsonify({'ok': True, 'unread': unread, 'items': data})
 
 
@@ -49,48 +117,77 @@ def mark_seen():
     return jsonify({'ok': True})
 
 
+def fetch_stream_notifications(user_id, last):
+    # Usado pelo stream Flask e pelo gateway ASGI (app/sse_gateway.py)
+    base = Notification.query.filter_by(user_id=user_id)
+    if last:
+        # Depois do cursor (retomada por Last-Event-ID): em ordem, em lotes de
+        # SSE_BACKFILL_LIMIT; página cheia (more=True) = quem chamou busca de novo
+        limit = current_app.config.get('SSE_BACKFILL_LIMIT', 200)
+        items = base.filter(Notification.id > last).order_by(Notification.id.asc()).limit(limit).all()
+        more = len(items) == limit
+    else:
+        # Primeira conexão: apenas as não vistas mais recentes
+        items = base.filter(Notification.seen_at == None).order_by(Notification.id.desc()).limit(20).all()  # type: ignore
+        more = False
+    unread = unread_count(user_id)
+    data = [{
+        'id': n.id,
+        'title': n.title,
+        'body': n.body or '',
+        'link': n.link or '',
+        'created_at': n.created_at.isoformat() if n.created_at else None,
+    } for n in items]
+    if items:
+        last = max(last, max(n.id for n in items))
+        _mark_delivered(user_id, items)
+    # Libera a conexão enquanto o stream aguarda o próximo evento
+    db.session.close()
+    return {'unread': unread, 'items': data}, last, more
+
+
 @notify_bp.route('/notify/stream')
 @login_required
 def stream():
     after_id = request.args.get('after_id', type=int) or 0
+    # Reconexão: Last-Event-ID tem precedência sobre ?after_id
+    resume = last_event_id(request.headers, request.args)
+    if resume:
+        after_id = parse_cursor(resume)[0] or after_id
+    user_id = current_user.id
+    config = current_app.config
+    keepalive = config.get('SSE_KEEPALIVE_SECONDS', 25)
+    max_seconds = config.get('SSE_MAX_SECONDS', 3600)
     def gen():
-        last = after_id
-        for _ in range(600):  # ~50 min @5s
-            base = Notification.query.filter_by(user_id=current_user.id).order_by(Notification.id.desc())
-            if last:
-                q = base.filter(Notification.id > last)
-            else:
-                # Primeira conexão: apenas não vistas
-                q = base.filter(Notification.seen_at == None)  # type: ignore
-            items = q.limit(20).all()
-            unread = Notification.query.filter_by(user_id=current_user.id, read_at=None).count()
-            data = [{
-                'id': n.id,
-                'title': n.title,
-                'body': n.body or '',
-                'link': n.link or '',
-                'created_at': n.created_at.isoformat() if n.created_at else None,
-            } for n in items]
-            if items:
-                last = max(last, max(n.id for n in items))
-                now = datetime.utcnow()
-                for n in items:
-                    if not n.seen_at:
-                        n.seen_at = now
-                db.session.commit()
-            payload = json.dumps({'unread': unread, 'items': data})
-            yield f"data: {payload}\n\n"
-            time.sleep(5)
+        with track_stream('notify.stream'):
+            sub = broker.subscribe([f'user:{user_id}'])
+            try:
+                last = after_id
+                deadline = time.monotonic() + max_seconds
+                changed = True
+                yield sse_retry(config)
+                while time.monotonic() < deadline:
+                    more = False
+                    if changed:
+                        payload, last, more = fetch_stream_notifications(user_id, last)
+                        yield sse_message(payload, id=last)
+                    else:
+                        yield KEEPALIVE
+                    # Backfill incompleto: próximo lote já, sem esperar um evento novo
+                    changed = bool(sub.wait(0 if more else keepalive)) or more
+            finally:
+                sub.close()
     return Response(stream_with_context(gen()), mimetype='text/event-stream')
 
 
 @notify_bp.route('/notify/read_all', methods=['POST'])
 @login_required
 def mark_all_read():
-    from datetime import datetime
     now = datetime.utcnow()
     Notification.query.filter_by(user_id=current_user.id).update({'read_at': now, 'seen_at': now})
+    _adjust_unread(current_user.id)
     db.session.commit()
+    broker.publish(f'user:{current_user.id}', {'type': 'unread'})
     return jsonify({'ok': True})
 
 
@@ -99,8 +196,11 @@ def mark_all_read():
 def mark_read(nid):
     n = Notification.query.filter_by(id=nid, user_id=current_user.id).first_or_404()
     now = datetime.utcnow()
-    n.read_at = now
-    if not n.seen_at:
-        n.seen_at = now
+    # UPDATE condicional: só decrementa quem efetivamente passou de não lida para lida
+    changed = Notification.query.filter_by(id=n.id, read_at=None).update(
+        {'read_at': now, 'seen_at': db.func.coalesce(Notification.seen_at, now)}, synchronize_session=False)
+    if changed:
+        _adjust_unread(current_user.id, -1)
     db.session.commit()
+    broker.publish(f'user:{current_user.id}', {'type': 'unread'})
     return jsonify({'ok': True})
@@ -0,0 +1,80 @@
+"""Contador de consultas SQL por requisição e detector de N+1 (opcional).
+
+Ativado por SQL_QUERY_STATS=1. Cada requisição recebe os cabeçalhos
+X-DB-Queries / X-DB-Time-ms e gera uma linha de log JSON; consultas com o
+mesmo formato repetidas SQL_N_PLUS_ONE_THRESHOLD vezes ou mais são
+sinalizadas como suspeitas de N+1.
+"""
+import json
+import time
+from flask import g, has_request_context, request, current_app
+from sqlalchemy import event
+from . import db
+
+
+def init_query_stats(app):
+    if not app.config.get('SQL_QUERY_STATS'):
+        return
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('_qs_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('_qs_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    if not has_request_context():
+        return
+    stats = g.get('_query_stats')
+    if stats is None:
+        return
+    stats['count'] += 1
+    stats['time'] += elapsed
+    # O texto já vem parametrizado pelo SQLAlchemy: mesmo texto = mesmo formato
+    shapes = stats['shapes']
+    shapes[statement] = shapes.get(statement, 0) + 1
+
+
+def _start_request():
+    g._query_stats = {'count': 0, 'time': 0.0, 'shapes': {}}
+
+
+def _finish_request(response):
+    stats = g.pop('_query_stats', None)
+    if stats is None:
+        return response
+    threshold = current_app.config.get('SQL_N_PLUS_ONE_THRESHOLD', 5)
+    repeated = sorted(
+        ((stmt, n) for stmt, n in stats['shapes'].items() if n >= threshold),
+        key=lambda x: x[1], reverse=True,
+    )
+    db_ms = round(stats['time'] * 1000, 2)
+    response.headers['X-DB-Queries'] = str(stats['count'])
+    response.headers['X-DB-Time-ms'] = str(db_ms)
+    if repeated:
+        response.headers['X-DB-N-Plus-One'] = str(len(repeated))
+    record = {
+        'event': 'sql_stats',
+        'endpoint': request.endpoint,
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'queries': stats['count'],
+        'db_ms': db_ms,
+        'repeated': [{'statement': stmt[:300], 'count': n} for stmt, n in repeated],
+    }
+    line = json.dumps(record, ensure_ascii=False)
+    if repeated:
+        current_app.logger.warning(line)
+    else:
+        current_app.logger.info(line)
+    return response
@@ -0,0 +1,156 @@
+from flask import Blueprint, jsonify, request, Response, stream_with_context, current_app
+from flask_login import login_required, current_user
+from .. import db
+from ..models import Ticket
+from ..broker import broker
+from ..metrics import track_stream
+from ..notifications.routes import fetch_stream_notifications
+from ..tickets.routes import fetch_stream_comments, is_comment_event, can_access_ticket
+from .sse import sse_message, sse_retry, last_event_id, parse_cursor, KEEPALIVE
+import re
+import time
+
+realtime_bp = Blueprint('realtime', __name__)
+
+# Um único stream por aba: eventos tipados (notification, comment, reaction,
+# status) dos tópicos assinados. A página assina/cancela tópicos via POST sem
+# reconectar; o comando chega ao stream pelo próprio broker (tópico
+# stream:<user>:<sid>), então funciona também com vários processos (redis).
+
+_SID_RE = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+
+
+def _control_topic(user_id, sid):
+    return f'stream:{user_id}:{sid}'
+
+
+def _ticket_topic_allowed(ticket_id):
+    ticket = db.session.get(Ticket, ticket_id)
+    return ticket is not None and can_access_ticket(current_user, ticket)
+
+
+def _parse_topic(value):
+    # Tópicos aceitos do cliente: ticket:<id>
+    m = re.match(r'^ticket:(\d+)$', value or '')
+    return int(m.group(1)) if m else None
+
+
+@realtime_bp.route('/events')
+@login_required
+def events():
+    sid = request.args.get('sid', '')
+    if not _SID_RE.match(sid):
+        return jsonify({'ok': False, 'error': 'sid inválido'}), 400
+    user_id = current_user.id
+    is_client = current_user.role == 'client'
+    after_id = request.args.get('after_id', type=int) or 0
+    # Reconexão: Last-Event-ID "<última notificação>-<último comentário>"
+    resume_notif, resume_comment = parse_cursor(last_event_id(request.headers, request.args), 2)
+    after_id = resume_notif or after_id
+    # Tópicos iniciais: ?ticket=<id>&after=<último comentário>
+    tickets = {}
+    ticket_id = request.args.get('ticket', type=int)
+    if ticket_id:
+        if not _ticket_topic_allowed(ticket_id):
+            return jsonify({'ok': False, 'error': 'forbidden'}), 403
+        tickets[ticket_id] = max(request.args.get('after', type=int) or 0, resume_comment)
+    config = current_app.config
+    keepalive = config.get('SSE_KEEPALIVE_SECONDS', 25)
+    max_seconds = config.get('SSE_MAX_SECONDS', 3600)
+    control = _control_topic(user_id, sid)
+
+    def gen():
+        with track_stream('realtime.events'):
+            topics = [f'user:{user_id}', control] + [f'ticket:{t}' for t in tickets]
+            sub = broker.subscribe(topics)
+            try:
+                last_notif = after_id
+                last_comment = delivered = resume_comment
+                deadline = time.monotonic() + max_seconds
+                notify_changed = True
+                changed_tickets = set(tickets)
+                # Página cheia (backfill incompleto): busca de novo sem esperar evento
+                notify_more = False
+                pending = set()
+                yield sse_retry(config)
+                out = [('ready', {'sid': sid, 'topics': [f'ticket:{t}' for t in tickets]})]
+                while time.monotonic() < deadline:
+                    if notify_changed:
+                        payload, last_notif, notify_more = fetch_stream_notifications(user_id, last_notif)
+                        out.append(('notification', payload))
+                    for tid in sorted(changed_tickets):
+                        if tid not in tickets:
+                            continue
+                        payload, tickets[tid], more = fetch_stream_comments(tid, tickets[tid], is_client)
+                        if more:
+                            pending.add(tid)
+                        else:
+                            pending.discard(tid)
+                        if payload['items']:
+                            payload['ticket_id'] = tid
+                            delivered = max(delivered, tickets[tid])
+                            out.append(('comment', payload))
+                    # O cursor é um só para todos os tickets e vira o after do ticket na
+                    # retomada: só avança quando nenhum ticket tem página pendente
+                    if not pending:
+                        last_comment = delivered
+                    if out:
+                        cursor = f'{last_notif}-{last_comment}'
+                        yield ''.join(sse_message(data, event=kind, id=cursor) for kind, data in out)
+                    else:
+                        yield KEEPALIVE
+                    out = []
+                    notify_changed = notify_more
+                    changed_tickets = set(pending)
+                    for topic, m in sub.wait(0 if notify_more or pending else keepalive):
+                        kind = m.get('type')
+                        if topic == control:
+                            tid = m.get('ticket_id')
+                            if kind == 'subscribe' and tid:
+                                tickets.setdefault(tid, m.get('after') or 0)
+                                sub.add(f'ticket:{tid}')
+                                changed_tickets.add(tid)
+                            elif kind == 'unsubscribe' and tid:
+                                tickets.pop(tid, None)
+                                pending.discard(tid)
+                                sub.remove(f'ticket:{tid}')
+                        elif topic.startswith('user:'):
+                            notify_changed = True
+                        elif topic.startswith('ticket:'):
+                            tid = int(topic.split(':', 1)[1])
+                            if tid not in tickets:
+                                continue
+                            if is_comment_event(m, is_client):
+                                changed_tickets.add(tid)
+                            elif kind == 'reaction':
+                                out.append(('reaction', {'ticket_id': tid, 'comment_id': m.get('comment_id'), 'counts': m.get('counts') or {}}))
+                            elif kind == 'status':
+                                out.append(('status', {'ticket_id': tid, 'status': m.get('status')}))
+            finally:
+                sub.close()
+    return Response(stream_with_context(gen()), mimetype='text/event-stream')
+
+
+@realtime_bp.route('/events/subscribe', methods=['POST'])
+@login_required
+def subscribe():
+    sid = request.form.get('sid', '')
+    ticket_id = _parse_topic(request.form.get('topic'))
+    if not _SID_RE.match(sid) or not ticket_id:
+        return jsonify({'ok': False, 'error': 'parâmetros inválidos'}), 400
+    if not _ticket_topic_allowed(ticket_id):
+        return jsonify({'ok': False, 'error': 'forbidden'}), 403
+    after = request.form.get('after', type=int) or 0
+    broker.publish(_control_topic(current_user.id, sid), {'type': 'subscribe', 'ticket_id': ticket_id, 'after': after})
+    return jsonify({'ok': True})
+
+
+@realtime_bp.route('/events/unsubscribe', methods=['POST'])
+@login_required
+def unsubscribe():
+    sid = request.form.get('sid', '')
+    ticket_id = _parse_topic(request.form.get('topic'))
+    if not _SID_RE.match(sid) or not ticket_id:
+        return jsonify({'ok': False, 'error': 'parâmetros inválidos'}), 400
+    broker.publish(_control_topic(current_user.id, sid), {'type': 'unsubscribe', 'ticket_id': ticket_id})
+    return jsonify({'ok': True})
@@ -0,0 +1,45 @@
+"""Formatação de mensagens SSE e retomada por Last-Event-ID.
+
+Cada mensagem com dados leva um ``id:`` (o cursor do stream); ao reconectar,
+o navegador reenvia esse valor no cabeçalho Last-Event-ID e o stream continua
+a partir dele, com backfill limitado por SSE_BACKFILL_LIMIT, em vez de
+reprocessar as tabelas desde o início. Sem novidades, só ``: keepalive``.
+"""
+import json
+import random
+
+KEEPALIVE = ": keepalive\n\n"
+
+
+def sse_message(data, event=None, id=None):
+    lines = []
+    if event:
+        lines.append(f"event: {event}")
+    if id is not None:
+        lines.append(f"id: {id}")
+    lines.append(f"data: {json.dumps(data)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+def sse_retry(config):
+    # Espalha as reconexões (p.ex. após um deploy) entre retry e 2x retry
+    base = int(config.get('SSE_RETRY_MS', 5000))
+    return f"retry: {base + random.randint(0, base)}\n\n"
+
+
+def last_event_id(headers, query=None):
+    # EventSource reenvia o cabeçalho; o parâmetro serve a clientes que reabrem a conexão manualmente
+    value = headers.get('Last-Event-ID') or (query or {}).get('last_event_id') or ''
+    return value.strip()
+
+
+def parse_cursor(value, parts=1):
+    """Converte "12" ou "12-40" em uma tupla de inteiros (0 quando ausente/inválido)."""
+    items = (value or '').split('-')
+    out = []
+    for i in range(parts):
+        try:
+            out.append(max(int(items[i]), 0))
+        except (IndexError, ValueError):
+            out.append(0)
+    return tuple(out)
@@ -1,6 +1,9 @@
 from flask import Blueprint, render_template, Response, request
 from flask_login import login_required
-from ..models import Ticket
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+from .. import db
+from ..models import Ticket, Company
 import csv
 import io
 from datetime import datetime, timedelta
@@ -9,74 +12,93 @@ from datetime import datetime, timedelta
 reports_bp = Blueprint('reports', __name__, template_folder='../templates')
 
 
+def _period_start(period):
+    now = datetime.utcnow()
+    if period == 'today':
+        return now - timedelta(days=1)
+    if period == 'week':
+        return now - timedelta(days=7)
+    if period == 'month':
+        return now - timedelta(days=30)
+    return None
+
+
 @reports_bp.route('/')
 @login_required
 def index():
     period = request.args.get('period', 'all')  # all|today|week|month
-    now = datetime.utcnow()
-    start = None
-    if period == 'today':
-        start = now - timedelta(days=1)
-    elif period == 'week':
-        start = now - timedelta(days=7)
-    elif period == 'month':
-        start = now - timedelta(days=30)
+    start = _period_start(period)
+    # Tudo agregado no banco (GROUP BY): só as contagens/somas trafegam, nunca os tickets
+    in_period = [Ticket.created_at >= start] if start is not None else []
 
-    q = Ticket.query
-    if start is not None:
-        q = q.filter(Ticket.created_at >= start)
-    tickets = q.all()
-    total = len(tickets)
-    by_status = {}
-    by_priority = {}
+    count = func.count(Ticket.id)
+    rating_aggs = (func.count(Ticket.user_rating), func.sum(Ticket.user_rating))
+    if start is None:
+        # Sem período: status e prioridade saem dos próprios índices (varre só o índice)
+        by_status = dict(db.session.query(Ticket.status, count).group_by(Ticket.status))
+        by_priority = dict(db.session.query(Ticket.priority, count).group_by(Ticket.priority))
+        company_rows = db.session.query(Ticket.company_id, count, *rating_aggs).group_by(Ticket.company_id).all()
+    else:
+        # Com período: uma passada pelo índice de created_at agrupa tudo de uma vez
+        by_status, by_priority, per_company = {}, {}, {}
+        rows = (db.session.query(Ticket.company_id, Ticket.status, Ticket.priority, count, *rating_aggs)
+                .filter(*in_period).group_by(Ticket.company_id, Ticket.status, Ticket.priority))
+        for cid, status, priority, n, rated, rating_sum in rows:
+            by_status[status] = by_status.get(status, 0) + n
+            by_priority[priority] = by_priority.get(priority, 0) + n
+            agg = per_company.setdefault(cid, [0, 0, 0])
+            agg[0] += n
+            agg[1] += rated
+            agg[2] += rating_sum or 0
+        company_rows = [(cid, n, rated, rating_sum) for cid, (n, rated, rating_sum) in per_company.items()]
+    by_status = dict(sorted(by_status.items(), key=lambda kv: -kv[1]))
+    by_priority = dict(sorted(by_priority.items(), key=lambda kv: -kv[1]))
+    total = sum(by_status.values())
+
+    # Nome das empresas só das presentes no resultado
+    company_ids = [cid for cid, _, _, _ in company_rows if cid is not None]
+    names = dict(db.session.query(Company.id, Company.name).filter(Company.id.in_(company_ids))) if company_ids else {}
     by_company = {}
     rating_sum_by_company = {}
     rating_count_by_company = {}
-    rating_sum_all = 0
-    rating_count_all = 0
-    for t in tickets:
-        by_status[t.status] = by_status.get(t.status, 0) + 1
-        by_priority[t.priority] = by_priority.get(t.priority, 0) + 1
-        company_name = t.company.name if getattr(t, 'company', None) else '—'
-        by_company[company_name] = by_company.get(company_name, 0) + 1
-        if t.user_rating is not None:
-            rating_sum_by_company[company_name] = rating_sum_by_company.get(company_name, 0) + (t.user_rating or 0)
-            rating_count_by_company[company_name] = rating_count_by_company.get(company_name, 0) + 1
-            rating_sum_all += t.user_rating or 0
-            rating_count_all += 1
-    avg_overall = (rating_sum_all / rating_count_all) if rating_count_all else None
+    for cid, n, rated, rating_sum in company_rows:
+        company_name = names.get(cid, '—')
+        by_company[company_name] = by_company.get(company_name, 0) + n
+        if rated:
+            rating_sum_by_company[company_name] = rating_sum_by_company.get(company_name, 0) + (rating_sum or 0)
+            rating_count_by_company[company_name] = rating_count_by_company.get(company_name, 0) + rated
+    by_company = dict(sorted(by_company.items()))
+    rating_count_all = sum(rating_count_by_company.values())
+    avg_overall = (sum(rating_sum_by_company.values()) / rating_count_all) if rating_count_all else None
     ratings_by_company = {}
     for cname, cnt in rating_count_by_company.items():
         ratings_by_company[cname] = {
             'avg': (rating_sum_by_company.get(cname, 0) / cnt) if cnt else None,
             'count': cnt,
         }
-    recent_ratings = [t for t in tickets if t.user_rating_at is not None and (start is None or t.user_rating_at >= start)]
-    recent_ratings.sort(key=lambda x: x.user_rating_at, reverse=True)
-    recent_ratings = recent_ratings[:10]
+
+    rated_in_period = [Ticket.user_rating_at.isnot(None)] + in_period
+    if start is not None:
+        rated_in_period.append(Ticket.user_rating_at >= start)
+    recent_ratings = (Ticket.query.options(joinedload(Ticket.company))
+                      .filter(*rated_in_period)
+                      .order_by(Ticket.user_rating_at.desc(), Ticket.id.desc())
+                      .limit(10).all())
 
     # Prepare chart data: company ratings (avg) arrays
     company_labels = []
     company_avgs = []
-    for cname in sorted(by_company.keys()):
+    for cname in by_company.keys():
         company_labels.append(cname)
         r = ratings_by_company.get(cname)
         company_avgs.append(round(r['avg'], 2) if r and r.get('avg') is not None else 0)
 
     # Trend by day: average rating per day within period
-    trend = {}
-    for t in tickets:
-        if t.user_rating_at is None:
-            continue
-        if start is not None and t.user_rating_at < start:
-            continue
-        day = t.user_rating_at.strftime('%Y-%m-%d')
-        if day not in trend:
-            trend[day] = {'sum': 0, 'count': 0}
-        trend[day]['sum'] += t.user_rating or 0
-        trend[day]['count'] += 1
-    trend_labels = sorted(trend.keys())
-    trend_avgs = [round(trend[d]['sum'] / trend[d]['count'], 2) if trend[d]['count'] else 0 for d in trend_labels]
+    day = func.date(Ticket.user_rating_at)
+    trend = (db.session.query(day, func.count(Ticket.id), func.sum(func.coalesce(Ticket.user_rating, 0)))
+             .filter(*rated_in_period).group_by(day).order_by(day).all())
+    trend_labels = [str(d) for d, _, _ in trend]
+    trend_avgs = [round((rating_sum or 0) / n, 2) if n else 0 for _, n, rating_sum in trend]
 
     return render_template(
         'reports/index.html',
@@ -99,14 +121,7 @@ def index():
 @login_required
 def export_csv():
     period = request.args.get('period', 'all')
-    now = datetime.utcnow()
-    start = None
-    if period == 'today':
-        start = now - timedelta(days=1)
-    elif period == 'week':
-        start = now - timedelta(days=7)
-    elif period == 'month':
-        start = now - timedelta(days=30)
+    start = _period_start(period)
     q = Ticket.query
     if start is not None:
         q = q.filter(Ticket.created_at >= start)
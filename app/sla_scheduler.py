@@ -0,0 +1,232 @@
+"""Agendador de prazos de SLA em processo.
+
+Em vez de varrer a tabela de tickets periodicamente, mantém um heap com os
+prazos pendentes (due_first_response_at / due_resolution_at) e dorme até o
+próximo vencimento. Cada commit que altera prazos, pausa/retoma o SLA,
+responde ou resolve um ticket publica o estado novo no tópico ``sla`` do
+broker; o agendador só atualiza o prazo daquele ticket (O(log n)).
+
+Entradas antigas não são removidas do heap: um mapa (ticket, tipo) -> prazo
+vigente descarta as obsoletas quando chegam ao topo. No vencimento a ação é
+revalidada no banco (UPDATE condicional), então disparos duplicados ou
+atrasados não têm efeito.
+
+Ative em um único processo (SLA_SCHEDULER_ENABLED); com EVENTS_BACKEND=redis
+ele recebe as alterações feitas por todos os processos web.
+"""
+import heapq
+import threading
+from datetime import datetime
+from sqlalchemy import event, or_, select
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+from . import db
+from .models import Ticket, AuditLog
+
+TOPIC = 'sla'
+FIRST_RESPONSE = 'first_response'
+RESOLUTION = 'resolution'
+CLOSED_STATUSES = ('Resolvido', 'Fechado')
+WATCHED = ('due_first_response_at', 'due_resolution_at', 'sla_paused',
+           'first_response_at', 'resolved_at', 'status')
+
+_worker = None
+
+
+class SLAScheduler:
+    def __init__(self):
+        self._heap = []
+        self._current = {}
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return len(self._current)
+
+    def set(self, ticket_id, kind, deadline):
+        """Agenda (ou cancela, com deadline=None) o prazo de um ticket."""
+        key = (ticket_id, kind)
+        with self._cond:
+            if deadline is None:
+                self._current.pop(key, None)
+                return
+            if self._current.get(key) == deadline:
+                return
+            self._current[key] = deadline
+            heapq.heappush(self._heap, (deadline, ticket_id, kind))
+            # Muitas entradas obsoletas: reconstrói para não crescer sem limite
+            if len(self._heap) > 2 * len(self._current) + 1024:
+                self._heap = [(d, t, k) for (t, k), d in self._current.items()]
+                heapq.heapify(self._heap)
+            if self._heap[0] == (deadline, ticket_id, kind):
+                self._cond.notify()
+
+    def update(self, message):
+        ticket_id = message.get('ticket')
+        if not ticket_id:
+            return
+        for kind in (FIRST_RESPONSE, RESOLUTION):
+            value = message.get(kind)
+            self.set(ticket_id, kind, datetime.fromisoformat(value) if value else None)
+
+    def pop_due(self, now):
+        """Remove e devolve os (ticket_id, tipo) vencidos até ``now``."""
+        due = []
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                deadline, ticket_id, kind = heapq.heappop(self._heap)
+                if self._current.get((ticket_id, kind)) == deadline:
+                    del self._current[(ticket_id, kind)]
+                    due.append((ticket_id, kind))
+        return due
+
+    def wait(self, stop, max_seconds):
+        """Dorme até o próximo prazo, um prazo mais cedo ser agendado ou ``stop``."""
+        with self._cond:
+            timeout = max_seconds
+            if self._heap:
+                timeout = min(timeout, max((self._heap[0][0] - datetime.utcnow()).total_seconds(), 0))
+            if timeout > 0 and not stop.is_set():
+                self._cond.wait(timeout)
+
+    def wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def clear(self):
+        with self._cond:
+            self._heap = []
+            self._current.clear()
+
+
+scheduler = SLAScheduler()
+
+
+def _deadlines(ticket):
+    # Prazo que ainda pode vencer; None se já cumprido, pausado ou encerrado
+    if ticket.sla_paused or ticket.resolved_at is not None or ticket.status in CLOSED_STATUSES:
+        return None, None
+    first = ticket.due_first_response_at if ticket.first_response_at is None else None
+    return first, ticket.due_resolution_at
+
+
+def deadline_message(ticket):
+    first, resolution = _deadlines(ticket)
+    return {'type': 'deadlines', 'ticket': ticket.id,
+            FIRST_RESPONSE: first.isoformat() if first else None,
+            RESOLUTION: resolution.isoformat() if resolution else None}
+
+
+def load_pending(now=None):
+    """Carrega no heap os prazos em aberto (uma vez, ao iniciar)."""
+    now = now or datetime.utcnow()
+    t = Ticket.__table__
+    rows = db.session.execute(
+        select(t.c.id, t.c.due_first_response_at, t.c.due_resolution_at, t.c.first_response_at)
+        .where(t.c.resolved_at.is_(None),
+               or_(t.c.sla_paused.is_(None), t.c.sla_paused == False),  # noqa: E712
+               or_(t.c.status.is_(None), t.c.status.notin_(CLOSED_STATUSES)),
+               or_(t.c.due_resolution_at.isnot(None),
+                   t.c.first_response_at.is_(None) & t.c.due_first_response_at.isnot(None)))
+    ).all()
+    for ticket_id, first, resolution, responded in rows:
+        # Primeira resposta já vencida antes de subir: foi tratada (ou perdida) antes, não repete
+        if first and responded is None and first > now:
+            scheduler.set(ticket_id, FIRST_RESPONSE, first)
+        if resolution:
+            scheduler.set(ticket_id, RESOLUTION, resolution)
+    return len(rows)
+
+
+def fire_due(now=None):
+    """Executa as ações dos prazos vencidos. Retorna (escalonados, alertas)."""
+    from .utils import escalate_tickets
+    now = now or datetime.utcnow()
+    due = scheduler.pop_due(now)
+    if not due:
+        return 0, 0
+    resolution = [tid for tid, kind in due if kind == RESOLUTION]
+    first = [tid for tid, kind in due if kind == FIRST_RESPONSE]
+    escalated = escalate_tickets(resolution, now) if resolution else 0
+    breached = 0
+    if first:
+        t = Ticket.__table__
+        ids = [r[0] for r in db.session.execute(
+            select(t.c.id).where(t.c.id.in_(first),
+                                 t.c.first_response_at.is_(None),
+                                 t.c.resolved_at.is_(None),
+                                 t.c.due_first_response_at <= now,
+                                 or_(t.c.sla_paused.is_(None), t.c.sla_paused == False)))]  # noqa: E712
+        if ids:
+            db.session.execute(AuditLog.__table__.insert(), [
+                {'entity': 'ticket', 'entity_id': ticket_id, 'action': 'sla_first_response_breach',
+                 'user_id': None, 'data': None, 'created_at': now} for ticket_id in ids])
+            db.session.commit()
+            breached = len(ids)
+    return escalated, breached
+
+
+def run_scheduler(app, stop=None):
+    from .broker import broker
+    stop = stop or threading.Event()
+    max_wait = app.config.get('SLA_SCHEDULER_MAX_WAIT_SECONDS', 60)
+    callback = lambda topic, message: scheduler.update(message)  # noqa: E731
+    # Assina antes de carregar: alterações durante a carga não se perdem
+    broker.backend.subscribe(TOPIC, callback)
+    try:
+        with app.app_context():
+            loaded = load_pending()
+        app.logger.info('SLA: %s ticket(s) com prazo em aberto carregado(s)', loaded)
+        while not stop.is_set():
+            try:
+                with app.app_context():
+                    escalated, breached = fire_due()
+                if escalated or breached:
+                    app.logger.info('SLA: %s escalonado(s), %s primeira(s) resposta(s) vencida(s)', escalated, breached)
+            except Exception:
+                app.logger.exception('Falha ao processar prazos de SLA')
+                stop.wait(1)
+            scheduler.wait(stop, max_wait)
+    finally:
+        broker.backend.unsubscribe(TOPIC, callback)
+
+
+def init_sla_scheduler(app):
+    global _worker
+    if not app.config.get('SLA_SCHEDULER_ENABLED', False) or app.config.get('TESTING'):
+        return
+    if _worker is not None and _worker.is_alive():
+        return
+    _worker = threading.Thread(target=run_scheduler, args=(app,), name='sla-scheduler', daemon=True)
+    _worker.start()
+
+
+# Publica os prazos novos de cada ticket alterado, somente após o commit
+def _collect_deadlines(session, flush_context):
+    pending = None
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, Ticket) or obj.id is None:
+            continue
+        if obj not in session.new and not any(get_history(obj, name).added for name in WATCHED):
+            continue
+        if pending is None:
+            pending = session.info.setdefault('_sla_events', {})
+        pending[obj.id] = deadline_message(obj)
+
+
+def _publish_deadlines(session):
+    from .broker import broker
+    pending = session.info.pop('_sla_events', None)
+    for message in (pending or {}).values():
+        try:
+            broker.publish(TOPIC, message)
+        except Exception:
+            pass
+
+
+def _discard_deadlines(session):
+    session.info.pop('_sla_events', None)
+
+
+event.listen(Session, 'after_flush', _collect_deadlines)
+event.listen(Session, 'after_commit', _publish_deadlines)
+event.listen(Session, 'after_rollback', _discard_deadlines)
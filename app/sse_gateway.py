@@ -0,0 +1,202 @@
+"""Gateway ASGI para os streams SSE (notificações, comentários e chat).
+
+Cada cliente é uma corrotina aguardando o broker de eventos, sem ocupar uma
+thread do servidor WSGI; conexões ociosas custam poucos kilobytes. A sessão
+é a mesma do Flask (cookie assinado com SECRET_KEY) e as consultas ao banco
+rodam no executor padrão, dentro do app context, reutilizando as mesmas
+funções dos streams WSGI. O formato das mensagens é idêntico.
+
+Rotas: /notify/stream, /tickets/<id>/comments/stream e /chat/stream.
+Requisições fora dessas rotas vão para ``fallback`` (outra app ASGI, p.ex.
+o Flask via asgiref) ou recebem 404. Veja run_events.py.
+"""
+import asyncio
+import json
+import re
+import time
+from urllib.parse import parse_qs
+from werkzeug.datastructures import Headers
+from .broker import broker
+from .metrics import track_stream
+from .realtime.sse import sse_message, sse_retry, last_event_id, parse_cursor, KEEPALIVE
+
+
+_COMMENTS_RE = re.compile(r'^/tickets/(\d+)/comments/stream$')
+
+
+def _int_arg(query, name):
+    try:
+        return int(query.get(name, ['0'])[0] or 0)
+    except (ValueError, TypeError):
+        return 0
+
+
+class SSEGateway:
+    def __init__(self, flask_app, fallback=None):
+        self.app = flask_app
+        self.fallback = fallback
+        self.keepalive = flask_app.config.get('SSE_KEEPALIVE_SECONDS', 25)
+        self.max_seconds = flask_app.config.get('SSE_MAX_SECONDS', 3600)
+        self.cookie_name = flask_app.config.get('SESSION_COOKIE_NAME', 'session')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            if self.fallback is not None:
+                return await self.fallback(scope, receive, send)
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+        path = scope.get('path', '')
+        if path == '/notify/stream':
+            return await self._serve(scope, receive, send, 'notify')
+        m = _COMMENTS_RE.match(path)
+        if m:
+            return await self._serve(scope, receive, send, 'comments', int(m.group(1)))
+        if path == '/chat/stream':
+            return await self._serve(scope, receive, send, 'chat')
+        if self.fallback is not None:
+            return await self.fallback(scope, receive, send)
+        await self._reply(send, 404, {'ok': False, 'error': 'not found'})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _reply(self, send, status, payload):
+        body = json.dumps(payload).encode()
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'application/json'),
+                                (b'content-length', str(len(body)).encode())]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    def _session_user_id(self, scope):
+        cookies = {}
+        for name, value in scope.get('headers', []):
+            if name == b'cookie':
+                for part in value.decode('latin-1').split(';'):
+                    k, _, v = part.strip().partition('=')
+                    cookies[k] = v
+        raw = cookies.get(self.cookie_name)
+        if not raw:
+            return None
+        serializer = self.app.session_interface.get_signing_serializer(self.app)
+        if serializer is None:
+            return None
+        try:
+            data = serializer.loads(raw, max_age=int(self.app.permanent_session_lifetime.total_seconds()))
+        except Exception:
+            return None
+        try:
+            return int(data.get('_user_id'))
+        except (TypeError, ValueError):
+            return None
+
+    def _run(self, fn, *args):
+        # Consultas síncronas no executor, dentro do app context
+        def call():
+            with self.app.app_context():
+                return fn(*args)
+        return asyncio.get_running_loop().run_in_executor(None, call)
+
+    def _authorize(self, user_id, kind, ticket_id):
+        from . import db
+        from .models import User, Ticket
+        from .tickets.routes import can_access_ticket
+        try:
+            user = db.session.get(User, user_id)
+            if user is None or not user.is_active:
+                return 401, None
+            if kind == 'notify':
+                return 200, False
+            ticket = db.session.get(Ticket, ticket_id) if ticket_id else None
+            if ticket is None:
+                return 404, None
+            if not can_access_ticket(user, ticket):
+                return 403, None
+            return 200, user.role == 'client'
+        finally:
+            db.session.remove()
+
+    async def _serve(self, scope, receive, send, kind, ticket_id=None):
+        from .notifications.routes import fetch_stream_notifications
+        from .tickets.routes import fetch_stream_comments, is_comment_event
+
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        # Nomes de cabeçalho chegam em minúsculas no ASGI; Headers compara sem diferenciar caixa
+        headers = Headers([(k.decode('latin-1'), v.decode('latin-1')) for k, v in scope.get('headers', [])])
+        resume = parse_cursor(last_event_id(headers, {k: v[0] for k, v in query.items()}))[0]
+        if kind == 'chat':
+            ticket_id = _int_arg(query, 'ticket_id')
+            if not ticket_id:
+                return await self._reply(send, 200, {'ok': True, 'items': []})
+        user_id = self._session_user_id(scope)
+        if user_id is None:
+            return await self._reply(send, 401, {'ok': False, 'error': 'unauthorized'})
+        status, is_client = await self._run(self._authorize, user_id, kind, ticket_id)
+        if status != 200:
+            return await self._reply(send, status, {'ok': False, 'error': 'forbidden' if status == 403 else 'unauthorized'})
+
+        if kind == 'notify':
+            topic = f'user:{user_id}'
+            last = resume or _int_arg(query, 'after_id')
+            fetch = lambda last: fetch_stream_notifications(user_id, last)
+            relevant = lambda m: True
+            name = 'gateway.notify'
+            skip_empty = False
+        else:
+            topic = f'ticket:{ticket_id}'
+            last = resume or _int_arg(query, 'after')
+            fetch = lambda last: fetch_stream_comments(ticket_id, last, is_client)
+            relevant = lambda m: is_comment_event(m, is_client)
+            name = 'gateway.' + kind
+            skip_empty = True
+
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'text/event-stream'),
+                                (b'cache-control', b'no-cache'),
+                                (b'x-accel-buffering', b'no')]})
+
+        disconnected = asyncio.Event()
+
+        async def watch_disconnect():
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    disconnected.set()
+                    return
+
+        watcher = asyncio.ensure_future(watch_disconnect())
+        sub = broker.subscribe_async([topic])
+        try:
+            with track_stream(name):
+                deadline = time.monotonic() + self.max_seconds
+                changed = True
+                await send({'type': 'http.response.body', 'body': sse_retry(self.app.config).encode(), 'more_body': True})
+                while not disconnected.is_set() and time.monotonic() < deadline:
+                    chunk = KEEPALIVE
+                    more = False
+                    if changed:
+                        payload, last, more = await self._run(fetch, last)
+                        if payload['items'] or not skip_empty:
+                            chunk = sse_message(payload, id=last)
+                    await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+                    # Backfill incompleto: próximo lote já, sem esperar um evento novo
+                    waiter = asyncio.ensure_future(sub.wait(0 if more else self.keepalive))
+                    stopper = asyncio.ensure_future(disconnected.wait())
+                    done, pending = await asyncio.wait({waiter, stopper}, return_when=asyncio.FIRST_COMPLETED)
+                    for task in pending:
+                        task.cancel()
+                    events = waiter.result() if waiter in done else []
+                    changed = more or any(relevant(m) for _, m in events)
+                if not disconnected.is_set():
+                    await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        except OSError:
+            pass
+        finally:
+            sub.close()
+            watcher.cancel()
@@ -290,6 +290,82 @@ document.addEventListener('DOMContentLoaded', () => {
   });
 });
 
+// Stream único de eventos (/events) compartilhado pelos blocos abaixo.
+// Os blocos registram handlers e tópicos no DOMContentLoaded; a conexão é
+// aberta logo depois, já com os tópicos iniciais. Tópicos novos são assinados
+// via POST sem reconectar.
+const SDEvents = (() => {
+  if (!window.EventSource) return null;
+  const handlers = {};
+  const tickets = {}; // ticketId -> função que devolve o último comentário conhecido
+  const sid = (window.crypto && crypto.randomUUID)
+    ? crypto.randomUUID().replace(/-/g, '')
+    : (Date.now().toString(36) + Math.random().toString(36).slice(2));
+  let es = null;
+  let scheduled = false;
+
+  const csrf = () => document.querySelector('meta[name="csrf-token"]')?.getAttribute('content') || '';
+  const post = (url, ticketId) => {
+    const body = new URLSearchParams();
+    body.set('sid', sid);
+    body.set('topic', `ticket:${ticketId}`);
+    if (tickets[ticketId]) body.set('after', tickets[ticketId]());
+    body.set('csrf_token', csrf());
+    return fetch(url, {
+      method: 'POST',
+      credentials: 'same-origin',
+      headers: { 'Content-Type': 'application/x-www-form-urlencoded', 'X-CSRFToken': csrf() },
+      body: body.toString()
+    }).catch(() => {});
+  };
+  const dispatch = (type) => (e) => {
+    let data;
+    try { data = JSON.parse(e.data || '{}'); } catch { return; }
+    (handlers[type] || []).forEach(fn => { try { fn(data); } catch {} });
+  };
+  const connect = () => {
+    const params = new URLSearchParams({ sid });
+    const ids = Object.keys(tickets);
+    if (ids.length) {
+      params.set('ticket', ids[0]);
+      params.set('after', tickets[ids[0]]());
+    }
+    es = new EventSource('/events?' + params.toString());
+    ['notification', 'comment', 'reaction', 'status'].forEach(t => es.addEventListener(t, dispatch(t)));
+    // A cada (re)conexão, reassina os demais tópicos desta aba
+    es.addEventListener('ready', (e) => {
+      let inUrl = [];
+      try { inUrl = (JSON.parse(e.data || '{}').topics || []); } catch {}
+      Object.keys(tickets).forEach(id => {
+        if (!inUrl.includes(`ticket:${id}`)) post('/events/subscribe', id);
+      });
+    });
+    es.onerror = () => { /* keep connection; browser will retry */ };
+  };
+  const schedule = () => {
+    if (scheduled) return;
+    scheduled = true;
+    setTimeout(connect, 0);
+  };
+  return {
+    on(type, fn) {
+      (handlers[type] = handlers[type] || []).push(fn);
+      schedule();
+    },
+    subscribe(ticketId, getAfter) {
+      const known = ticketId in tickets;
+      tickets[ticketId] = getAfter || (() => 0);
+      if (es && !known) post('/events/subscribe', ticketId);
+      schedule();
+    },
+    unsubscribe(ticketId) {
+      if (!(ticketId in tickets)) return;
+      delete tickets[ticketId];
+      if (es) post('/events/unsubscribe', ticketId);
+    },
+  };
+})();
+
 // Notifications polling and UI
 document.addEventListener('DOMContentLoaded', () => {
   let lastId = 0;
@@ -394,31 +470,24 @@ document.addEventListener('DOMContentLoaded', () => {
     });
   };
 
-  // SSE for notifications (fallback to polling)
+  // Notificações pelo stream único (fallback to polling)
   let usedSSE = false;
-  if (window.EventSource) {
-    try {
-      const es = new EventSource('/notify/stream');
-      usedSSE = true;
-      es.onmessage = (e) => {
-        try {
-          const data = JSON.parse(e.data || '{}');
-          applyUnread(data.unread);
-          const items = data.items || [];
-          if (items.length) {
-            items.forEach(n => {
-              lastId = Math.max(lastId, n.id || lastId);
-              showToast(n.title, n.body);
-              notifCache.unshift(n);
-            });
-            notifCache = notifCache.slice(0, 20);
-            if (listBox) renderNotifList();
-            beep();
-          }
-        } catch {}
-      };
-      es.onerror = () => { /* keep connection; browser will retry */ };
-    } catch {}
+  if (SDEvents && bellBadge) {
+    usedSSE = true;
+    SDEvents.on('notification', (data) => {
+      applyUnread(data.unread);
+      const items = (data.items || []).filter(n => !notifCache.some(c => c.id === n.id));
+      if (items.length) {
+        items.forEach(n => {
+          lastId = Math.max(lastId, n.id || lastId);
+          showToast(n.title, n.body);
+          notifCache.unshift(n);
+        });
+        notifCache = notifCache.slice(0, 20);
+        if (listBox) renderNotifList();
+        beep();
+      }
+    });
   }
 
   if (!usedSSE) {
@@ -560,14 +629,25 @@ document.addEventListener('DOMContentLoaded', () => {
     });
   };
   let usedSSE2 = false;
-  if (window.EventSource) {
-    try {
-      const es2 = new EventSource(`/tickets/${ticketId}/comments/stream?after=${encodeURIComponent(lastId)}`);
-      usedSSE2 = true;
-      es2.onmessage = (e) => {
-        try { const data = JSON.parse(e.data||'{}'); appendItems(data.items||[]); } catch {}
-      };
-    } catch {}
+  if (SDEvents) {
+    usedSSE2 = true;
+    SDEvents.subscribe(ticketId, () => lastId);
+    SDEvents.on('comment', (data) => {
+      if (Number(data.ticket_id) !== ticketId) return;
+      appendItems((data.items || []).filter(it => it.id > lastId));
+    });
+    SDEvents.on('reaction', (data) => {
+      if (Number(data.ticket_id) !== ticketId) return;
+      const box = thread.querySelector(`[data-comment-id="${data.comment_id}"] .reaction-counts`);
+      if (!box) return;
+      const entries = Object.entries(data.counts || {}).filter(([, n]) => n > 0);
+      box.innerHTML = entries.map(([e, n]) => `<span class="badge bg-light text-dark me-1">${e} ${n}</span>`).join('');
+    });
+    SDEvents.on('status', (data) => {
+      if (Number(data.ticket_id) !== ticketId) return;
+      const el = document.querySelector('[data-ticket-status]');
+      if (el && data.status) el.textContent = data.status;
+    });
   }
   if (!usedSSE2) {
     const poll = () => {
@@ -605,12 +685,13 @@ document.addEventListener('DOMContentLoaded', () => {
     });
   };
   let usedSSE3 = false;
-  if (window.EventSource) {
-    try {
-      const es3 = new EventSource(`/chat/stream?ticket_id=${encodeURIComponent(ticketId)}&after=${encodeURIComponent(lastId)}`);
-      usedSSE3 = true;
-      es3.onmessage = (e) => { try { const data = JSON.parse(e.data||'{}'); appendChat(data.items||[]); } catch {} };
-    } catch {}
+  if (SDEvents) {
+    usedSSE3 = true;
+    SDEvents.subscribe(ticketId, () => lastId);
+    SDEvents.on('comment', (data) => {
+      if (Number(data.ticket_id) !== ticketId) return;
+      appendChat((data.items || []).filter(it => it.id > lastId));
+    });
   }
   if (!usedSSE3) {
     const poll = () => {
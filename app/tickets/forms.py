@@ -5,6 +5,7 @@ from flask_wtf.file import FileAllowed, MultipleFileField
 
 
 PRIORITY_CHOICES = [('Baixa', 'Baixa'), ('Média', 'Média'), ('Alta', 'Alta'), ('Crítica', 'Crítica')]
+STATUS_CHOICES = [('Novo','Novo'),('Em atendimento','Em atendimento'),('Aguardando','Aguardando'),('Resolvido','Resolvido'),('Fechado','Fechado')]
 
 
 class TicketCreateForm(FlaskForm):
@@ -29,7 +30,7 @@ class CommentForm(FlaskForm):
 
 class AssignForm(FlaskForm):
     assignee_id = SelectField('Atribuir a', coerce=int)
-    status = SelectField('Status', choices=[('Novo','Novo'),('Em atendimento','Em atendimento'),('Aguardando','Aguardando'),('Resolvido','Resolvido'),('Fechado','Fechado')])
+    status = SelectField('Status', choices=STATUS_CHOICES)
     queue_id = SelectField('Fila/Equipe', coerce=int)
     submit = SubmitField('Aplicar')
 
@@ -5,14 +5,18 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request,
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 from .. import db
-from ..models import Ticket, Attachment, TicketComment, Contract, Category, User, Queue, Asset, CommentReaction, Notification, TicketParticipant
-from .forms import TicketCreateForm, CommentForm, AssignForm, ResolveForm, CloseForm
+from ..broker import broker
+from ..metrics import track_stream
+from ..realtime.sse import sse_message, sse_retry, last_event_id, parse_cursor, KEEPALIVE
+from ..models import Company, Ticket, Attachment, TicketComment, Contract, Category, User, Queue, Asset, CommentReaction, TicketParticipant
+from .forms import TicketCreateForm, CommentForm, AssignForm, ResolveForm, CloseForm, PRIORITY_CHOICES, STATUS_CHOICES
 from ..utils import choose_sla_plan, audit
 from ..email import send_ticket_created, send_ticket_comment, send_ticket_status, send_ticket_closed
+from ..notifications.routes import add_notification
 import secrets
-import json
 import time
-from sqlalchemy import or_, inspect as sqla_inspect
+from sqlalchemy import and_, or_, inspect as sqla_inspect
+from sqlalchemy.orm import joinedload, selectinload
 
 
 tickets_bp = Blueprint('tickets', __name__, template_folder='../templates')
@@ -24,20 +28,47 @@ def _ticket_number():
     return f'TCK-{date}-{seq}'
 
 
+def can_access_ticket(user, ticket):
+    if user.role in ('admin', 'supervisor', 'tech'):
+        return True
+    # client: only own tickets in same company
+    return ticket.company_id == user.company_id and ticket.created_by_id == user.id
+
+
 def _ensure_ticket_access(ticket):
-    if current_user.role in ('admin', 'supervisor', 'tech'):
-        return
-    else:
-        # client: only own tickets in same company
-        if ticket.company_id != current_user.company_id or ticket.created_by_id != current_user.id:
-            abort(403)
+    if not can_access_ticket(current_user, ticket):
+        abort(403)
+
+
+_participants_table_exists = False
 
 
 def _participants_enabled():
+    # Cacheia o resultado positivo: evita uma consulta ao catálogo a cada chamada
+    global _participants_table_exists
+    if _participants_table_exists:
+        return True
     try:
-        return sqla_inspect(db.engine).has_table('ticket_participant')
+        _participants_table_exists = sqla_inspect(db.engine).has_table('ticket_participant')
     except Exception:
         return False
+    return _participants_table_exists
+
+
+def _load_ticket_for_detail(ticket_id):
+    # Carrega de uma vez as relações usadas por tickets/detail.html (evita N+1)
+    options = [
+        joinedload(Ticket.company),
+        joinedload(Ticket.creator).joinedload(User.company),
+        joinedload(Ticket.assignee),
+        joinedload(Ticket.queue),
+        joinedload(Ticket.asset),
+        selectinload(Ticket.attachments),
+        selectinload(Ticket.comments).joinedload(TicketComment.user),
+    ]
+    if _participants_enabled():
+        options.append(selectinload(Ticket.participants).joinedload(TicketParticipant.user))
+    return Ticket.query.options(*options).filter_by(id=ticket_id).first_or_404()
 
 
 def _is_participant(ticket, user):
@@ -49,12 +80,76 @@ def _is_participant(ticket, user):
         return False
 
 
+TICKET_BUCKETS = ('unassigned', 'in_progress', 'closed')
+CLOSED_STATUSES = ('Resolvido', 'Fechado')
+
+
+def _encode_cursor(ticket):
+    # Cursor de paginação (keyset) sobre (created_at, id)
+    ts = ticket.created_at.isoformat() if ticket.created_at else ''
+    return f"{ts}_{ticket.id}"
+
+
+def _decode_cursor(value):
+    if not value:
+        return None
+    try:
+        ts, _, tid = value.rpartition('_')
+        return datetime.fromisoformat(ts), int(tid)
+    except (ValueError, TypeError):
+        return None
+
+
+def _bucket_query(bucket, filters):
+    q = Ticket.query.options(joinedload(Ticket.company), joinedload(Ticket.assignee))
+    if bucket == 'unassigned':
+        q = q.filter(Ticket.assigned_to_id.is_(None))
+    elif bucket == 'in_progress':
+        q = q.filter(Ticket.assigned_to_id.isnot(None), Ticket.status.notin_(CLOSED_STATUSES))
+    elif bucket == 'closed':
+        q = q.filter(Ticket.status.in_(CLOSED_STATUSES))
+    if filters.get('company_id'):
+        q = q.filter(Ticket.company_id == filters['company_id'])
+    if filters.get('status'):
+        q = q.filter(Ticket.status == filters['status'])
+    if filters.get('priority'):
+        q = q.filter(Ticket.priority == filters['priority'])
+    if filters.get('queue_id'):
+        q = q.filter(Ticket.queue_id == filters['queue_id'])
+    return q
+
+
+def _bucket_page(bucket, filters, cursor=None, page_size=50):
+    """Retorna (tickets, next_cursor) de um grupo usando keyset em (created_at, id)."""
+    q = _bucket_query(bucket, filters)
+    after = _decode_cursor(cursor)
+    if after:
+        ts, tid = after
+        q = q.filter(or_(Ticket.created_at < ts, and_(Ticket.created_at == ts, Ticket.id < tid)))
+    items = q.order_by(Ticket.created_at.desc(), Ticket.id.desc()).limit(page_size + 1).all()
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        next_cursor = _encode_cursor(items[-1])
+    return items, next_cursor
+
+
 @tickets_bp.route('/')
 @login_required
 def list_tickets():
     if current_user.role in ('admin', 'supervisor', 'tech'):
-        # Staff: visão global (técnicos são gerais do sistema)
-        tickets_all = Ticket.query.order_by(Ticket.created_at.desc()).all()
+        # Staff: visão global (técnicos são gerais do sistema), paginada e filtrada no banco
+        filters = {
+            'company_id': request.args.get('company_id', type=int) or None,
+            'status': (request.args.get('status') or '').strip() or None,
+            'priority': (request.args.get('priority') or '').strip() or None,
+            'queue_id': request.args.get('queue_id', type=int) or None,
+        }
+        bucket = request.args.get('bucket')
+        if bucket not in TICKET_BUCKETS:
+            bucket = None
+        cursor = request.args.get('cursor') if bucket else None
+        page_size = current_app.config.get('TICKETS_PAGE_SIZE', 50)
         # Agrupamentos
         def group_by_company(items):
             groups = {}
@@ -62,17 +157,26 @@ def list_tickets():
                 key = t.company.name if t.company else '—'
                 groups.setdefault(key, []).append(t)
             return groups
-        # Para todos os perfis de staff (tech/supervisor/admin), usar visão global
-        unassigned = [t for t in tickets_all if t.assigned_to_id is None]
-        in_progress = [t for t in tickets_all if (t.assigned_to_id is not None and t.status not in ('Resolvido', 'Fechado'))]
-        closed = [t for t in tickets_all if t.status in ('Resolvido', 'Fechado')]
-        tickets = tickets_all
+        groups = {}
+        next_cursors = {}
+        for b in TICKET_BUCKETS:
+            if bucket and b != bucket:
+                continue
+            items, next_cursors[b] = _bucket_page(b, filters, cursor=cursor, page_size=page_size)
+            groups[b] = group_by_company(items)
         return render_template(
             'tickets/list.html',
-            tickets=tickets,
-            unassigned_by_company=group_by_company(unassigned),
-            in_progress_by_company=group_by_company(in_progress),
-            closed_by_company=group_by_company(closed),
+            bucket=bucket,
+            filters=filters,
+            filter_args={k: v for k, v in filters.items() if v},
+            next_cursors=next_cursors,
+            unassigned_by_company=groups.get('unassigned'),
+            in_progress_by_company=groups.get('in_progress'),
+            closed_by_company=groups.get('closed'),
+            companies=Company.query.order_by(Company.name).all(),
+            queues=Queue.query.order_by(Queue.name).all(),
+            status_choices=[c[0] for c in STATUS_CHOICES],
+            priority_choices=[c[0] for c in PRIORITY_CHOICES],
         )
     else:
         tickets = Ticket.query.filter_by(company_id=current_user.company_id, created_by_id=current_user.id).order_by(Ticket.created_at.desc()).all()
@@ -132,7 +236,7 @@ def create_ticket():
         # Optional catalog category
         selected_cat_id = (child_cat.id if child_cat else (parent_cat.id if parent_cat else None))
         db.session.add(ticket)
-        db.session.commit()
+        db.session.flush()
 
         # save attachments
         files = form.attachments.data or []
@@ -151,16 +255,14 @@ def create_ticket():
                 f.save(path)
                 att = Attachment(ticket_id=ticket.id, filename=stored, original_name=original, content_type=f.mimetype, size=os.path.getsize(path))
                 db.session.add(att)
-            db.session.commit()
         # Apply SLA
         plan = choose_sla_plan(company_id=current_user.company_id, contract_id=ticket.contract_id, category_id=selected_cat_id, priority=ticket.priority)
         if plan:
             ticket.sla_plan_id = plan.id
             ticket.due_first_response_at = ticket.created_at + timedelta(minutes=plan.first_response_minutes or 0)
             ticket.due_resolution_at = ticket.created_at + timedelta(minutes=plan.resolution_minutes or 0)
-        db.session.commit()
-        audit('ticket', ticket.id, 'create', user_id=current_user.id)
         # Notify creator and company admins (+ extra recipients via env)
+        # O e-mail vai para o outbox e é gravado no mesmo commit do ticket
         try:
             admin_emails = [u.email for u in User.query.filter_by(company_id=current_user.company_id, role='admin').all()]
             # Remove creator from watchers and dedupe
@@ -174,6 +276,8 @@ def create_ticket():
             send_ticket_created(ticket, creator=current_user, watchers=watchers)
         except Exception as e:
             current_app.logger.warning(f"Failed to send ticket created email: {e}")
+        db.session.commit()
+        audit('ticket', ticket.id, 'create', user_id=current_user.id)
         flash('Chamado criado com sucesso.', 'success')
         return redirect(url_for('tickets.detail', ticket_id=ticket.id))
     # GET inicial ou POST inválido
@@ -277,51 +381,94 @@ def poll_comments(ticket_id):
     return jsonify({'ok': True, 'items': data})
 
 
+def fetch_stream_comments(ticket_id, last, is_client):
+    # Usado pelos streams de comentários/chat e pelo gateway ASGI (app/sse_gateway.py)
+    q = TicketComment.query.filter_by(ticket_id=ticket_id)
+    if is_client:
+        q = q.filter_by(internal=False)
+    if last:
+        q = q.filter(TicketComment.id > last)
+    # Backfill limitado: numa reconexão com lacuna grande entrega em lotes;
+    # página cheia (more=True) = há mais, quem chamou busca de novo sem esperar
+    limit = current_app.config.get('SSE_BACKFILL_LIMIT', 200)
+    items = q.options(joinedload(TicketComment.user)).order_by(TicketComment.id.asc()).limit(limit).all()
+    more = len(items) == limit
+    if items:
+        last = max(last, max(c.id for c in items))
+    def fmt(dt):
+        try:
+            return dt.strftime('%d/%m/%Y %H:%M') if dt else ''
+        except Exception:
+            return ''
+    data = [{
+        'id': c.id,
+        'user_id': c.user_id,
+        'user_name': getattr(c.user, 'name', 'Usuário'),
+        'content': c.content,
+        'created_at': fmt(c.created_at),
+        'internal': c.internal,
+    } for c in items]
+    # Libera a conexão enquanto o stream aguarda o próximo evento
+    db.session.close()
+    return {'ok': True, 'items': data}, last, more
+
+
+def is_comment_event(message, is_client):
+    return message.get('type') == 'comment' and not (is_client and message.get('internal'))
+
+
 @tickets_bp.route('/<int:ticket_id>/comments/stream')
 @login_required
 def stream_comments(ticket_id):
     ticket = Ticket.query.get_or_404(ticket_id)
     _ensure_ticket_access(ticket)
     after = request.args.get('after', type=int) or 0
-    def gen():
-        last = after
-        for _ in range(720):  # ~60 min @5s
-            q = TicketComment.query.filter_by(ticket_id=ticket.id)
-            if current_user.role == 'client':
-                q = q.filter_by(internal=False)
-            if last:
-                q = q.filter(TicketComment.id > last)
-            items = q.order_by(TicketComment.id.asc()).all()
-            if items:
-                last = max(last, max(c.id for c in items))
-            def fmt(dt):
-                try:
-                    return dt.strftime('%d/%m/%Y %H:%M') if dt else ''
-                except Exception:
-                    return ''
-            data = [{
-                'id': c.id,
-                'user_id': c.user_id,
-                'user_name': getattr(c.user, 'name', 'Usuário'),
-                'content': c.content,
-                'created_at': fmt(c.created_at),
-                'internal': c.internal,
-            } for c in items]
-            payload = json.dumps({'ok': True, 'items': data})
-            yield f"data: {payload}\n\n"
-            time.sleep(5)
-    return Response(stream_with_context(gen()), mimetype='text/event-stream')
+    resume = last_event_id(request.headers, request.args)
+    if resume:
+        after = parse_cursor(resume)[0] or after
+    is_client = current_user.role == 'client'
+    config = current_app.config
+    return Response(stream_with_context(comment_events(ticket_id, after, is_client, config, 'tickets.stream_comments')),
+                    mimetype='text/event-stream')
+
+
+def comment_events(ticket_id, after, is_client, config, stream_name):
+    # Gerador compartilhado por tickets.stream_comments e chat.stream
+    keepalive = config.get('SSE_KEEPALIVE_SECONDS', 25)
+    max_seconds = config.get('SSE_MAX_SECONDS', 3600)
+    with track_stream(stream_name):
+        sub = broker.subscribe([f'ticket:{ticket_id}'])
+        try:
+            last = after
+            deadline = time.monotonic() + max_seconds
+            changed = True
+            yield sse_retry(config)
+            while time.monotonic() < deadline:
+                payload = None
+                more = False
+                if changed:
+                    payload, last, more = fetch_stream_comments(ticket_id, last, is_client)
+                if payload and payload['items']:
+                    yield sse_message(payload, id=last)
+                else:
+                    yield KEEPALIVE
+                # Backfill incompleto: próximo lote já, sem esperar um evento novo
+                events = sub.wait(0 if more else keepalive)
+                changed = more or any(is_comment_event(m, is_client) for _, m in events)
+        finally:
+            sub.close()
 
 
 @tickets_bp.route('/<int:ticket_id>', methods=['GET', 'POST'])
 @login_required
 def detail(ticket_id):
-    ticket = Ticket.query.get_or_404(ticket_id)
+    ticket = _load_ticket_for_detail(ticket_id)
     _ensure_ticket_access(ticket)
     form = CommentForm()
     assign_form = None
     resolve_form = None
     close_form = None
+    staff = None
     if current_user.role in ('admin', 'supervisor', 'tech'):
         assign_form = AssignForm()
         staff = User.query.filter(User.role.in_(['tech','supervisor','admin'])).order_by(User.name).all()
@@ -351,6 +498,10 @@ def detail(ticket_id):
         # First response timestamp (by staff, public or internal) if not set
         if not ticket.first_response_at and current_user.role in ('admin','supervisor','tech'):
             ticket.first_response_at = datetime.utcnow()
+        try:
+            send_ticket_comment(ticket, author=current_user, public=not form.internal.data)
+        except Exception as e:
+            current_app.logger.warning(f"Failed to send ticket comment email: {e}")
         db.session.commit()
         files = form.attachments.data or []
         if files:
@@ -369,34 +520,30 @@ def detail(ticket_id):
                 att = Attachment(ticket_id=ticket.id, filename=stored, original_name=original, content_type=f.mimetype, size=os.path.getsize(path))
                 db.session.add(att)
             db.session.commit()
-        try:
-            send_ticket_comment(ticket, author=current_user, public=not form.internal.data)
-        except Exception as e:
-            current_app.logger.warning(f"Failed to send ticket comment email: {e}")
         # In-app notifications: notify counterpart on public comments
         try:
             if not form.internal.data:
                 if current_user.role in ('admin','supervisor','tech'):
                     # notify creator
-                    db.session.add(Notification(
-                        user_id=ticket.created_by_id,
+                    add_notification(
+                        ticket.creator,
                         company_id=ticket.company_id,
                         kind='ticket_comment',
                         title=f"Novo comentário em {ticket.number}",
                         body=f"{current_user.name}: {form.content.data[:120]}",
                         link=url_for('tickets.detail', ticket_id=ticket.id)
-                    ))
+                    )
                 else:
                     # notify assignee (if any)
                     if ticket.assigned_to_id:
-                        db.session.add(Notification(
-                            user_id=ticket.assigned_to_id,
+                        add_notification(
+                            ticket.assignee,
                             company_id=ticket.company_id,
                             kind='ticket_comment',
                             title=f"Novo comentário do cliente em {ticket.number}",
                             body=f"{current_user.name}: {form.content.data[:120]}",
                             link=url_for('tickets.detail', ticket_id=ticket.id)
-                        ))
+                        )
                 db.session.commit()
         except Exception:
             pass
@@ -419,7 +566,8 @@ def detail(ticket_id):
     candidates = []
     transfer_candidates = []
     if current_user.role in ('admin','supervisor') or (current_user.role == 'tech' and (ticket.assigned_to_id == current_user.id)):
-        staff = User.query.filter(User.role.in_(['tech','supervisor','admin'])).order_by(User.name).all()
+        if staff is None:
+            staff = User.query.filter(User.role.in_(['tech','supervisor','admin'])).order_by(User.name).all()
         existing_ids = {p.user_id for p in participants}
         if ticket.assigned_to_id:
             existing_ids.add(ticket.assigned_to_id)
@@ -475,6 +623,10 @@ def react_comment(ticket_id, comment_id):
     counts = {}
     for r in comment.reactions:
         counts[r.emoji] = counts.get(r.emoji, 0) + 1
+    try:
+        broker.publish(f'ticket:{ticket_id}', {'type': 'reaction', 'comment_id': comment.id, 'counts': counts})
+    except Exception:
+        pass
     return jsonify({'ok': True, 'counts': counts})
 
 
@@ -511,23 +663,24 @@ def assign(ticket_id):
         ticket.assigned_to_id = form.assignee_id.data or None
         ticket.status = form.status.data
         ticket.queue_id = form.queue_id.data or None
-        db.session.commit()
-        audit('ticket', ticket.id, 'assign/status', user_id=current_user.id, data=f"assignee={ticket.assigned_to_id}; status={ticket.status}")
         if old_status != ticket.status:
             try:
                 send_ticket_status(ticket, actor=current_user, old_status=old_status, new_status=ticket.status)
             except Exception as e:
                 current_app.logger.warning(f"Failed to send status email: {e}")
+        db.session.commit()
+        audit('ticket', ticket.id, 'assign/status', user_id=current_user.id, data=f"assignee={ticket.assigned_to_id}; status={ticket.status}")
+        if old_status != ticket.status:
             # Notify creator about status change
             try:
-                db.session.add(Notification(
-                    user_id=ticket.created_by_id,
+                add_notification(
+                    ticket.creator,
                     company_id=ticket.company_id,
                     kind='ticket_status',
                     title=f"Status atualizado: {ticket.number}",
                     body=f"{old_status} 806 {ticket.status}",
                     link=url_for('tickets.detail', ticket_id=ticket.id)
-                ))
+                )
                 db.session.commit()
             except Exception:
                 pass
@@ -552,22 +705,22 @@ def resolve(ticket_id):
         ticket.solution = form.solution.data
         ticket.status = 'Resolvido'
         ticket.resolved_at = datetime.utcnow()
-        db.session.commit()
-        audit('ticket', ticket.id, 'resolve', user_id=current_user.id)
         try:
             send_ticket_status(ticket, actor=current_user, old_status=old_status, new_status=ticket.status)
         except Exception as e:
             current_app.logger.warning(f"Failed to send status email: {e}")
+        db.session.commit()
+        audit('ticket', ticket.id, 'resolve', user_id=current_user.id)
         # Notify creator about resolution
         try:
-            db.session.add(Notification(
-                user_id=ticket.created_by_id,
+            add_notification(
+                ticket.creator,
                 company_id=ticket.company_id,
                 kind='ticket_status',
                 title=f"Ticket resolvido: {ticket.number}",
                 body=f"{ticket.title}",
                 link=url_for('tickets.detail', ticket_id=ticket.id)
-            ))
+            )
             db.session.commit()
         except Exception:
             pass
@@ -598,8 +751,6 @@ def close(ticket_id):
         # Generate rating token for user feedback
         if not ticket.user_rating_at:
             ticket.user_rating_token = secrets.token_hex(16)
-        db.session.commit()
-        audit('ticket', ticket.id, 'close', user_id=current_user.id)
         try:
             # Status email
             send_ticket_status(ticket, actor=current_user, old_status=old_status, new_status=ticket.status)
@@ -614,22 +765,23 @@ def close(ticket_id):
                 lines.append(f"[{when}] {who}: {c.content}")
             rating_link = url_for('tickets.rate_by_token', token=ticket.user_rating_token, _external=True)
             send_ticket_closed(ticket, actor=current_user, transcript_lines=lines, rating_link=rating_link)
-            # Create in-app notification for creator
-            try:
-                note = Notification(
-                    user_id=ticket.created_by_id,
-                    company_id=ticket.company_id,
-                    kind='ticket_closed',
-                    title=f"Ticket encerrado: {ticket.number}",
-                    body=f"{ticket.title}",
-                    link=url_for('tickets.detail', ticket_id=ticket.id)
-                )
-                db.session.add(note)
-                db.session.commit()
-            except Exception:
-                pass
         except Exception as e:
             current_app.logger.warning(f"Failed to send close email: {e}")
+        db.session.commit()
+        audit('ticket', ticket.id, 'close', user_id=current_user.id)
+        # Create in-app notification for creator
+        try:
+            add_notification(
+                ticket.creator,
+                company_id=ticket.company_id,
+                kind='ticket_closed',
+                title=f"Ticket encerrado: {ticket.number}",
+                body=f"{ticket.title}",
+                link=url_for('tickets.detail', ticket_id=ticket.id)
+            )
+            db.session.commit()
+        except Exception:
+            pass
         flash('Chamado encerrado.', 'success')
     return redirect(url_for('tickets.detail', ticket_id=ticket.id))
 
@@ -695,12 +847,12 @@ def reopen(ticket_id):
     ticket.status = 'Em atendimento'
     ticket.closed_at = None
     ticket.closed_reason = None
-    db.session.commit()
-    audit('ticket', ticket.id, 'reopen', user_id=current_user.id)
     try:
         send_ticket_status(ticket, actor=current_user, old_status=old_status, new_status=ticket.status)
     except Exception as e:
         current_app.logger.warning(f"Failed to send status email: {e}")
+    db.session.commit()
+    audit('ticket', ticket.id, 'reopen', user_id=current_user.id)
     flash('Chamado reaberto.', 'success')
     return redirect(url_for('tickets.detail', ticket_id=ticket.id))
 
@@ -2,13 +2,22 @@ from functools import wraps
 from flask import abort, current_app
 from .models import SLAPlan, Company, Ticket, TicketComment
 from . import db
+from .metrics import IMAP_POLL_LATENCY
+from .inbound_mime import parse_message
 import imaplib
 from email.header import decode_header
 from email.utils import parseaddr
 import email
 import re
+import json
+import time
+import uuid
 import ipaddress
+import multiprocessing
 from datetime import datetime, timedelta
+from sqlalchemy import select, or_
+from concurrent.futures import ProcessPoolExecutor
+from werkzeug.utils import secure_filename
 import os
 
 
@@ -26,39 +35,68 @@ def role_required(*roles):
     return decorator
 
 
+# Índice de planos de SLA por empresa: {(contrato, categoria, prioridade): id}, com
+# None como coringa. Montado uma vez (só colunas, sem objetos) e reaproveitado
+# até o admin salvar um plano (invalidate_sla_index) ou expirar SLA_INDEX_CACHE_SECONDS.
+_sla_index = {}
+
+
+def _build_sla_index(company_id):
+    index = {}
+    rows = (db.session.query(SLAPlan.id, SLAPlan.contract_id, SLAPlan.category_id, SLAPlan.priority)
+            .filter(SLAPlan.company_id == company_id, SLAPlan.active == True)  # noqa: E712
+            .order_by(SLAPlan.id))
+    for plan_id, contract_id, category_id, priority in rows:
+        # empate (mesma chave): vence o menor id, como na varredura
+        index.setdefault((contract_id or None, category_id or None, priority or None), plan_id)
+    return index
+
+
+def invalidate_sla_index(company_id=None):
+    if company_id is None:
+        _sla_index.clear()
+    else:
+        _sla_index.pop(company_id, None)
+
+
+def _match_sla_plan(index, contract_id, category_id, priority):
+    # Mesma pontuação da varredura (contrato 4, categoria 2, prioridade 1): testa as
+    # chaves da mais específica (7) à mais genérica (0); plano com campo preenchido
+    # que não bate nunca é candidato, e coringa só casa com coringa.
+    for score in range(7, -1, -1):
+        if (score & 4 and not contract_id) or (score & 2 and not category_id) or (score & 1 and not priority):
+            continue
+        plan_id = index.get((
+            contract_id if score & 4 else None,
+            category_id if score & 2 else None,
+            priority if score & 1 else None,
+        ))
+        if plan_id is not None:
+            return plan_id
+    return None
+
+
 def choose_sla_plan(company_id, contract_id=None, category_id=None, priority=None):
-    q = SLAPlan.query.filter_by(company_id=company_id, active=True)
-    candidates = q.all()
-    def score(p: SLAPlan):
-        s = 0
-        if p.contract_id and contract_id and p.contract_id == contract_id:
-            s += 4
-        elif p.contract_id and p.contract_id != contract_id:
-            return -1
-        if p.category_id and category_id and p.category_id == category_id:
-            s += 2
-        elif p.category_id and p.category_id != category_id:
-            return -1
-        if p.priority and priority and p.priority == priority:
-            s += 1
-        elif p.priority and p.priority != priority:
-            return -1
-        return s
-    best = None
-    best_score = -1
-    for p in candidates:
-        sc = score(p)
-        if sc > best_score:
-            best = p
-            best_score = sc
-    return best
+    for attempt in range(2):
+        now = time.monotonic()
+        hit = _sla_index.get(company_id)
+        if attempt or hit is None or hit[0] <= now:
+            hit = (now + current_app.config.get('SLA_INDEX_CACHE_SECONDS', 300), _build_sla_index(company_id))
+            _sla_index[company_id] = hit
+        plan_id = _match_sla_plan(hit[1], contract_id, category_id, priority)
+        if plan_id is None:
+            return None
+        plan = db.session.get(SLAPlan, plan_id)
+        if plan is not None and plan.active:
+            return plan
+        # índice velho (plano removido/inativado em outro processo): remonta uma vez
+    return None
 
 
 def audit(entity: str, entity_id: int, action: str, user_id=None, data: str=None):
-    from .models import AuditLog
-    log = AuditLog(entity=entity, entity_id=entity_id, action=action, user_id=user_id, data=data)
-    db.session.add(log)
-    db.session.commit()
+    # Enfileirado para o gravador em lote (app/audit.py); não faz commit da sessão do chamador
+    from .audit import write
+    write({'entity': entity, 'entity_id': entity_id, 'action': action, 'user_id': user_id, 'data': data})
 
 
 def ip_allowed(company: Company, ip: str) -> bool:
@@ -86,6 +124,297 @@ TICKET_PATTERN = re.compile(r"TCK-\d{8}-[0-9A-F]{6}")
 
 
 def poll_imap_and_process():
+    with IMAP_POLL_LATENCY.time():
+        return _poll_imap_and_process()
+
+
+def load_checkpoint(name, default=None):
+    from .models import Checkpoint
+    cp = Checkpoint.query.filter_by(name=name).first()
+    if cp is None or not cp.value:
+        return default
+    try:
+        return json.loads(cp.value)
+    except Exception:
+        return default
+
+
+def save_checkpoint(name, value):
+    # Sem commit: o checkpoint entra na mesma transação do trabalho que ele registra
+    from .models import Checkpoint
+    cp = Checkpoint.query.filter_by(name=name).first() or Checkpoint(name=name)
+    cp.value = json.dumps(value)
+    db.session.add(cp)
+    return cp
+
+
+IMAP_HEADER_FIELDS = 'BODY.PEEK[HEADER.FIELDS (MESSAGE-ID FROM SUBJECT)]'
+_UID_RE = re.compile(rb'UID (\d+)')
+
+
+def _imap_fetch(conn, uids, what):
+    # UID FETCH de um conjunto de UIDs; devolve {uid: bytes}. Alguns servidores
+    # mandam o "UID n" depois do literal, na linha seguinte.
+    typ, data = conn.uid('FETCH', ','.join(str(u) for u in uids), f'(UID {what})')
+    out = {}
+    if typ != 'OK':
+        return out
+    pending = None
+    for item in data or []:
+        if isinstance(item, tuple):
+            m = _UID_RE.search(item[0])
+            if m:
+                out[int(m.group(1))] = item[1]
+                pending = None
+            else:
+                pending = item[1]
+        elif pending is not None and isinstance(item, bytes):
+            m = _UID_RE.search(item)
+            if m:
+                out[int(m.group(1))] = pending
+            pending = None
+    return out
+
+
+def _imap_int(conn, name):
+    try:
+        value = (conn.response(name)[1] or [None])[0]
+        return int(value) if value else None
+    except Exception:
+        return None
+
+
+def _decode_subject(msg):
+    subj = decode_header(msg.get('Subject') or '')
+    return ' '.join([ (str(t[0], t[1] or 'utf-8') if isinstance(t[0], bytes) else str(t[0])) for t in subj ])
+
+
+def _ingest_email(body, subject, user, company):
+    # Comentário no ticket citado no assunto ou ticket novo; devolve o id do ticket
+    m = TICKET_PATTERN.search(subject or '')
+    ticket = None
+    if m:
+        ticket = Ticket.query.filter_by(number=m.group(0)).first()
+    if ticket:
+        db.session.add(TicketComment(ticket_id=ticket.id, user_id=user.id, content=body, internal=False))
+        return ticket.id
+    new_t = Ticket(
+        number=f"TCK-{datetime.utcnow().strftime('%Y%m%d')}-{__import__('uuid').uuid4().hex[:6].upper()}",
+        title=subject[:200] if subject else 'Chamado via e-mail',
+        description=body or subject or 'Sem conteúdo',
+        priority='Média',
+        company_id=company.id,
+        created_by_id=user.id,
+        status='Novo'
+    )
+    db.session.add(new_t)
+    db.session.flush()
+    return new_t.id
+
+
+# Sem IMAP_PARSE_WORKERS: um processo por CPU, até este limite
+IMAP_PARSE_MAX_WORKERS = 4
+_PARSE_POOL = None
+
+
+def start_parse_pool(config):
+    """Pool de processos para a decodificação MIME (CPU). Só o listener
+    (run_imap.py) cria o pool; nas requisições web (admin) decodifica inline."""
+    global _PARSE_POOL
+    workers = config.get('IMAP_PARSE_WORKERS')
+    if workers is None:
+        workers = min(os.cpu_count() or 1, IMAP_PARSE_MAX_WORKERS)
+    if workers > 1 and _PARSE_POOL is None:
+        # forkserver/spawn: o filho não herda conexões do banco, locks nem threads do processo
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        _PARSE_POOL = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+    return _PARSE_POOL
+
+
+def stop_parse_pool():
+    global _PARSE_POOL
+    pool, _PARSE_POOL = _PARSE_POOL, None
+    if pool is not None:
+        pool.shutdown(cancel_futures=True)
+
+
+def _store_attachments(ticket_id, attachments, moved):
+    from .models import Attachment
+    upload_dir = os.path.join(current_app.root_path, 'uploads', str(ticket_id))
+    os.makedirs(upload_dir, exist_ok=True)
+    for att in attachments:
+        original = secure_filename(att['name']) or 'anexo'
+        stored = uuid.uuid4().hex + os.path.splitext(original)[1]
+        target = os.path.join(upload_dir, stored)
+        os.replace(att['path'], target)  # mesmo disco: só renomeia
+        moved.append(target)
+        db.session.add(Attachment(ticket_id=ticket_id, filename=stored, original_name=original,
+                                  content_type=att['content_type'], size=att['size']))
+
+
+def _write_imap_batch(name, checkpoint, wanted, parsed):
+    # Etapa de banco: tickets/comentários, anexos, InboundMessage e checkpoint num commit
+    from .models import InboundMessage
+    done = []
+    moved = []
+    try:
+        for uid in sorted(parsed):
+            msg_id, subject, user, company = wanted[uid]
+            try:
+                result = parsed[uid].result() if hasattr(parsed[uid], 'result') else parsed[uid]
+            except Exception:
+                # mensagem que não decodifica não pode travar a caixa: registra e segue
+                current_app.logger.exception('Falha ao decodificar e-mail UID %s', uid)
+                continue
+            ticket_id = _ingest_email(result['text'], subject, user, company)
+            _store_attachments(ticket_id, result['attachments'], moved)
+            db.session.add(InboundMessage(message_id=msg_id, mailbox=name, uid=uid, ticket_id=ticket_id))
+            done.append(uid)
+        if checkpoint:
+            save_checkpoint(name, checkpoint)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        for path in moved:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        raise
+    finally:
+        # Sobras do spool (mensagens puladas ou lote que falhou)
+        for item in parsed.values():
+            try:
+                result = item.result() if hasattr(item, 'result') else item
+            except Exception:
+                continue
+            for att in result['attachments']:
+                if os.path.exists(att['path']):
+                    try:
+                        os.remove(att['path'])
+                    except OSError:
+                        pass
+    return done
+
+
+def _imap_sender(from_value, cache):
+    from .models import User
+    sender_email = (parseaddr(from_value or '')[1] or '').lower()
+    if sender_email not in cache:
+        user = company = None
+        domain = sender_email.split('@')[-1]
+        if domain:
+            company = Company.query.filter(Company.domain.ilike(domain)).first()
+        if company:
+            user = User.query.filter_by(email=sender_email).first()
+        cache[sender_email] = (user, company) if user else None
+    return cache[sender_email]
+
+
+def ingest_imap_mailbox(conn, name, mailbox='INBOX', batch=50):
+    """Lê só o que chegou depois do checkpoint (UIDVALIDITY + último UID).
+
+    Cabeçalhos primeiro (BODY.PEEK, não marca como lida); corpo só para remetentes
+    conhecidos e Message-ID inédito. Em pipeline: enquanto o pool decodifica o
+    MIME de um lote, o próximo já está sendo baixado. Tickets, anexos,
+    InboundMessage e checkpoint vão no mesmo commit por lote: uma queda no meio
+    não duplica tickets.
+    """
+    from .models import InboundMessage
+    config = current_app.config
+    typ, _ = conn.select(mailbox)
+    if typ != 'OK':
+        return 0
+    uidvalidity = _imap_int(conn, 'UIDVALIDITY') or 0
+    uidnext = _imap_int(conn, 'UIDNEXT')
+    state = load_checkpoint(name) or {}
+    if state.get('uidvalidity') == uidvalidity:
+        last = int(state.get('last_uid') or 0)
+        typ, data = conn.uid('SEARCH', None, f'UID {last + 1}:*')
+    else:
+        # Primeira leitura (ou caixa recriada): só as não lidas, como antes
+        last = 0
+        typ, data = conn.uid('SEARCH', None, 'UNSEEN')
+    if typ != 'OK':
+        return 0
+    # "N:*" sempre devolve ao menos o maior UID, mesmo se já lido
+    uids = sorted(u for u in (int(x) for x in (data[0] or b'').split()) if u > last)
+    first_run = state.get('uidvalidity') != uidvalidity
+    if first_run and uidnext:
+        last = uidnext - 1
+    pool = _PARSE_POOL
+    spool_dir = os.path.join(current_app.root_path, 'uploads', '_spool')
+    os.makedirs(spool_dir, exist_ok=True)
+    max_bytes = config.get('IMAP_MAX_ATTACHMENT_BYTES')
+    count = 0
+    senders = {}
+    seen_ids = set()
+    pending = None
+
+    def flush(pending):
+        checkpoint, wanted, parsed, duplicates = pending
+        done = _write_imap_batch(name, checkpoint, wanted, parsed)
+        # Duplicatas também: já viraram ticket, não devem aparecer como não lidas
+        seen = sorted(done + duplicates)
+        if seen:
+            try:
+                conn.uid('STORE', ','.join(str(u) for u in seen), '+FLAGS', '(\\Seen)')
+            except Exception:
+                pass
+        return len(done)
+
+    for i in range(0, len(uids), batch):
+        chunk = uids[i:i + batch]
+        # 1) busca: cabeçalhos, filtro e corpos do lote
+        headers = _imap_fetch(conn, chunk, IMAP_HEADER_FIELDS)
+        wanted = {}
+        duplicates = []
+        for uid in chunk:
+            raw = headers.get(uid)
+            if raw is None:
+                continue
+            hdr = email.message_from_bytes(raw)
+            sender = _imap_sender(hdr.get('From'), senders)
+            if not sender:
+                # remetente desconhecido: ignorado, sem baixar o corpo
+                continue
+            msg_id = (hdr.get('Message-ID') or '').strip()[:255] or f'<uid-{uidvalidity}-{uid}@{name}>'
+            if msg_id in seen_ids:
+                # já lido nesta execução (inclusive repetido no mesmo lote)
+                duplicates.append(uid)
+                continue
+            seen_ids.add(msg_id)
+            wanted[uid] = (msg_id, _decode_subject(hdr), sender[0], sender[1])
+        if wanted:
+            known = {row[0] for row in db.session.query(InboundMessage.message_id)
+                     .filter(InboundMessage.message_id.in_([w[0] for w in wanted.values()]))}
+            duplicates.extend(uid for uid, w in wanted.items() if w[0] in known)
+            wanted = {uid: w for uid, w in wanted.items() if w[0] not in known}
+        bodies = _imap_fetch(conn, sorted(wanted), 'BODY.PEEK[]') if wanted else {}
+        # 2) decodificação: no pool (assíncrona) ou aqui mesmo
+        if pool is not None and len(bodies) > 1:
+            parsed = {uid: pool.submit(parse_message, raw, spool_dir, max_bytes) for uid, raw in bodies.items()}
+        else:
+            parsed = {uid: parse_message(raw, spool_dir, max_bytes) for uid, raw in bodies.items()}
+        # 3) gravação do lote anterior enquanto este decodifica
+        if pending is not None:
+            count += flush(pending)
+        # Na primeira leitura (UNSEEN, UIDs esparsos) o checkpoint só é gravado no
+        # fim: se cair no meio, a próxima repete o UNSEEN e o Message-ID evita duplicatas
+        if first_run:
+            checkpoint = None if i + batch < len(uids) else {'uidvalidity': uidvalidity, 'last_uid': max(chunk[-1], last)}
+        else:
+            checkpoint = {'uidvalidity': uidvalidity, 'last_uid': chunk[-1]}
+        pending = (checkpoint, wanted, parsed, duplicates)
+    if pending is not None:
+        count += flush(pending)
+    if not uids and first_run:
+        save_checkpoint(name, {'uidvalidity': uidvalidity, 'last_uid': last})
+        db.session.commit()
+    return count
+
+
+def _poll_imap_and_process():
     host = current_app.config.get('IMAP_HOST')
     if not host:
         return 0
@@ -95,124 +424,346 @@ def poll_imap_and_process():
     password = current_app.config.get('IMAP_PASSWORD')
     if not username or not password:
         return 0
+    mailbox = current_app.config.get('IMAP_MAILBOX', 'INBOX')
     conn = imaplib.IMAP4_SSL(host, port) if use_ssl else imaplib.IMAP4(host, port)
-    conn.login(username, password)
-    conn.select('INBOX')
-    typ, data = conn.search(None, 'UNSEEN')
-    if typ != 'OK':
+    try:
+        conn.login(username, password)
+        return ingest_imap_mailbox(conn, f'imap:{username}@{host}/{mailbox}', mailbox,
+                                   current_app.config.get('IMAP_FETCH_BATCH', 50))
+    finally:
+        try:
+            conn.logout()
+        except Exception:
+            pass
+
+
+# Status que a escalonação não toca (encerrados ou já aguardando)
+ESCALATION_SKIP_STATUSES = ('Resolvido', 'Fechado', 'Aguardando')
+
+
+def _overdue_clause(tickets, now):
+    # Resolução vencida, ticket aberto e SLA não pausado
+    return (tickets.c.due_resolution_at.isnot(None),
+            tickets.c.resolved_at.is_(None),
+            tickets.c.due_resolution_at <= now,
+            or_(tickets.c.sla_paused.is_(None), tickets.c.sla_paused == False),  # noqa: E712
+            or_(tickets.c.status.is_(None), tickets.c.status.notin_(ESCALATION_SKIP_STATUSES)))
+
+
+def _escalate_rows(rows, now, stats):
+    """UPDATE condicional por status de origem + AuditLog em massa (sem commit).
+    Retorna [(ticket_id, status_anterior)] efetivamente alterados."""
+    from .models import AuditLog
+    tickets = Ticket.__table__
+    returning = db.engine.dialect.update_returning
+    by_status = {}
+    for ticket_id, status in rows:
+        by_status.setdefault(status, []).append(ticket_id)
+    t0 = time.perf_counter()
+    changed = []
+    for old, ids in by_status.items():
+        # condicional: se alguém mudou o status entre o SELECT e aqui, não sobrescreve
+        stmt = (tickets.update()
+                .where(tickets.c.id.in_(ids),
+                       tickets.c.status.is_(None) if old is None else tickets.c.status == old)
+                .values(status='Aguardando'))
+        if returning:
+            done = [r[0] for r in db.session.execute(stmt.returning(tickets.c.id))]
+        elif db.session.execute(stmt).rowcount == len(ids):
+            done = ids
+        else:
+            # Sem RETURNING e só parte alterada: relê quais ficaram com o status novo
+            done = [r[0] for r in db.session.execute(
+                select(tickets.c.id).where(tickets.c.id.in_(ids), tickets.c.status == 'Aguardando'))]
+        changed.extend((ticket_id, old) for ticket_id in done)
+    stats['update'] += time.perf_counter() - t0
+    t0 = time.perf_counter()
+    if changed:
+        db.session.execute(AuditLog.__table__.insert(), [
+            {'entity': 'ticket', 'entity_id': ticket_id, 'action': 'escalate_overdue',
+             'user_id': None, 'data': f'status {old} -> Aguardando', 'created_at': now}
+            for ticket_id, old in changed
+        ])
+    stats['audit'] += time.perf_counter() - t0
+    return changed
+
+
+def _publish_escalations(changed):
+    # UPDATE direto não passa pelos hooks do ORM: avisa as telas abertas aqui
+    from .broker import broker
+    for ticket_id, _ in changed:
+        broker.publish(f'ticket:{ticket_id}', {'type': 'status', 'status': 'Aguardando'})
+
+
+def escalate_tickets(ticket_ids, now=None):
+    """Escalona apenas os tickets informados que ainda estejam vencidos
+    (usado pelo agendador de SLA no momento exato do prazo)."""
+    now = now or datetime.utcnow()
+    tickets = Ticket.__table__
+    rows = db.session.execute(
+        select(tickets.c.id, tickets.c.status)
+        .where(tickets.c.id.in_(list(ticket_ids)), *_overdue_clause(tickets, now))
+    ).all()
+    if not rows:
         return 0
-    count = 0
-    for num in data[0].split():
-        typ, msg_data = conn.fetch(num, '(RFC822)')
-        if typ != 'OK':
-            continue
-        msg = email.message_from_bytes(msg_data[0][1])
-        subj = decode_header(msg.get('Subject') or '')
-        subject = ' '.join([ (str(t[0], t[1] or 'utf-8') if isinstance(t[0], bytes) else str(t[0])) for t in subj ])
-        from_hdr = parseaddr(msg.get('From'))
-        sender_email = (from_hdr[1] or '').lower()
-        domain = sender_email.split('@')[-1]
-        company = Company.query.filter(Company.domain.ilike(domain)).first()
-        if not company:
+    changed = _escalate_rows(rows, now, {'update': 0.0, 'audit': 0.0})
+    db.session.commit()
+    _publish_escalations(changed)
+    return len(changed)
+
+
+def run_automations(chunk_size=None):
+    """Escalona tickets com resolução vencida para 'Aguardando'.
+
+    Em lotes por id (memória limitada): um UPDATE condicional por status de
+    origem, AuditLog inserido em massa e um commit por lote. Retorna as
+    estatísticas (tickets, lotes e tempo de cada fase, em segundos).
+    """
+    size = chunk_size or current_app.config.get('AUTOMATION_CHUNK_SIZE', 500)
+    stats = {'tickets': 0, 'chunks': 0, 'select': 0.0, 'update': 0.0, 'audit': 0.0, 'commit': 0.0}
+    started = time.perf_counter()
+    now = datetime.utcnow()
+    tickets = Ticket.__table__
+    last_id = 0
+    while True:
+        t0 = time.perf_counter()
+        rows = db.session.execute(
+            select(tickets.c.id, tickets.c.status)
+            .where(tickets.c.id > last_id, *_overdue_clause(tickets, now))
+            .order_by(tickets.c.id)
+            .limit(size)
+        ).all()
+        stats['select'] += time.perf_counter() - t0
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        changed = _escalate_rows(rows, now, stats)
+        t0 = time.perf_counter()
+        db.session.commit()
+        stats['commit'] += time.perf_counter() - t0
+        _publish_escalations(changed)
+        stats['tickets'] += len(changed)
+        stats['chunks'] += 1
+        if len(rows) < size:
+            break
+    stats['total'] = time.perf_counter() - started
+    current_app.logger.info('Automações: %(tickets)s ticket(s) escalonado(s) em %(chunks)s lote(s), %(total).3fs', stats)
+    return stats
+
+
+_FILE_POOL = None
+FILE_DELETE_CHUNK = 64
+
+
+def _file_pool():
+    # os.remove/os.stat liberam o GIL: threads bastam para paralelizar o disco
+    global _FILE_POOL
+    if _FILE_POOL is None:
+        from concurrent.futures import ThreadPoolExecutor
+        workers = max(1, current_app.config.get('UPLOAD_DELETE_WORKERS', 8))
+        _FILE_POOL = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='file-delete')
+    return _FILE_POOL
+
+
+def _remove_paths(paths):
+    removed = reclaimed = 0
+    for path in paths:
+        try:
+            size = os.stat(path).st_size
+            os.remove(path)
+        except OSError:
             continue
-        from .models import User
-        user = User.query.filter_by(email=sender_email).first()
-        if not user:
-            # ignore unknown user for now
+        removed += 1
+        reclaimed += size
+    return removed, reclaimed
+
+
+def remove_files(paths):
+    """Agenda a remoção dos arquivos no pool; chame somente depois do commit
+    que apagou os registros. Devolve futures para collect_removed()."""
+    paths = list(paths)
+    pool = _file_pool()
+    return [pool.submit(_remove_paths, paths[i:i + FILE_DELETE_CHUNK])
+            for i in range(0, len(paths), FILE_DELETE_CHUNK)]
+
+
+def collect_removed(futures):
+    """Aguarda as remoções e devolve (arquivos, bytes) liberados."""
+    removed = reclaimed = 0
+    for fut in futures:
+        try:
+            n, size = fut.result()
+        except Exception:
             continue
-        # get body text
-        body = ''
-        if msg.is_multipart():
-            for part in msg.walk():
-                ctype = part.get_content_type()
-                disp = part.get('Content-Disposition', '') or ''
-                if ctype == 'text/plain' and 'attachment' not in disp:
-                    charset = part.get_content_charset() or 'utf-8'
-                    try:
-                        body = part.get_payload(decode=True).decode(charset, errors='ignore')
-                    except Exception:
-                        body = part.get_payload(decode=True).decode('utf-8', errors='ignore')
-                    break
-        else:
-            charset = msg.get_content_charset() or 'utf-8'
+        removed += n
+        reclaimed += size
+    return removed, reclaimed
+
+
+def sweep_orphan_uploads(grace_seconds=None, dry_run=False):
+    """Remove de uploads/<ticket_id>/ os arquivos sem registro Attachment.
+
+    Arquivos mais novos que UPLOAD_SWEEP_GRACE_SECONDS são ignorados (o upload
+    grava o arquivo antes do commit do registro); em uploads/_spool só sobram
+    restos de decodificações interrompidas, removidos pela mesma regra. Pastas
+    vazias antigas também são removidas. Retorna as estatísticas.
+    """
+    from .models import Attachment
+    if grace_seconds is None:
+        grace_seconds = current_app.config.get('UPLOAD_SWEEP_GRACE_SECONDS', 3600)
+    cutoff = time.time() - grace_seconds
+    root = os.path.join(current_app.root_path, 'uploads')
+    started = time.perf_counter()
+    stats = {'dirs': 0, 'files': 0, 'bytes': 0, 'orphans': 0, 'empty_dirs': 0}
+    attachments = Attachment.__table__
+    futures = []
+
+    def sweep(batch):
+        # batch: [(ticket_id, DirEntry)]; uma consulta por lote de pastas
+        known = set()
+        if batch:
+            known = {(t, f) for t, f in db.session.execute(
+                select(attachments.c.ticket_id, attachments.c.filename)
+                .where(attachments.c.ticket_id.in_([t for t, _ in batch if t is not None])))}
+        for ticket_id, entry in batch:
+            orphans = []
+            remaining = 0
             try:
-                body = msg.get_payload(decode=True).decode(charset, errors='ignore')
-            except Exception:
-                body = msg.get_payload(decode=True)
-
-        # find ticket number
-        m = TICKET_PATTERN.search(subject or '')
-        ticket = None
-        if m:
-            ticket = Ticket.query.filter_by(number=m.group(0)).first()
-        if ticket:
-            # comment
-            comment = TicketComment(ticket_id=ticket.id, user_id=user.id, content=body, internal=False)
-            db.session.add(comment)
-            db.session.commit()
-        else:
-            # create new ticket
-            new_t = Ticket(
-                number=f"TCK-{datetime.utcnow().strftime('%Y%m%d')}-{__import__('uuid').uuid4().hex[:6].upper()}",
-                title=subject[:200] if subject else 'Chamado via e-mail',
-                description=body or subject or 'Sem conteúdo',
-                priority='Média',
-                company_id=company.id,
-                created_by_id=user.id,
-                status='Novo'
-            )
-            db.session.add(new_t)
-            db.session.commit()
-        conn.store(num, '+FLAGS', '\\Seen')
-        count += 1
-    conn.logout()
-    return count
+                dir_old = entry.stat().st_mtime < cutoff
+                with os.scandir(entry.path) as it:
+                    for f in it:
+                        remaining += 1
+                        if not f.is_file(follow_symlinks=False):
+                            continue
+                        stats['files'] += 1
+                        if ticket_id is not None and (ticket_id, f.name) in known:
+                            continue
+                        st = f.stat(follow_symlinks=False)
+                        if st.st_mtime >= cutoff:
+                            continue
+                        orphans.append(f.path)
+                        stats['orphans'] += 1
+                        stats['bytes'] += st.st_size
+            except OSError:
+                continue
+            if not dry_run and orphans:
+                futures.extend(remove_files(orphans))
+            elif not dry_run and remaining == 0 and dir_old and ticket_id is not None:
+                try:
+                    os.rmdir(entry.path)
+                    stats['empty_dirs'] += 1
+                except OSError:
+                    pass
 
+    batch = []
+    try:
+        with os.scandir(root) as it:
+            for entry in it:
+                if not entry.is_dir(follow_symlinks=False):
+                    continue
+                if entry.name.isdigit():
+                    ticket_id = int(entry.name)
+                elif entry.name == '_spool':
+                    ticket_id = None
+                else:
+                    continue
+                stats['dirs'] += 1
+                batch.append((ticket_id, entry))
+                if len(batch) >= 500:
+                    sweep(batch)
+                    batch = []
+    except FileNotFoundError:
+        pass
+    sweep(batch)
+    if futures:
+        stats['files_removed'], stats['bytes'] = collect_removed(futures)
+    else:
+        stats['files_removed'] = 0
+    stats['total'] = time.perf_counter() - started
+    current_app.logger.info('Uploads: %(dirs)s pasta(s), %(files)s arquivo(s), %(orphans)s órfão(s), '
+                            '%(files_removed)s removido(s), %(bytes)s bytes, %(total).3fs', stats)
+    return stats
 
-def run_automations():
-    now = datetime.utcnow()
-    overdue = Ticket.query.filter(Ticket.due_resolution_at != None, Ticket.resolved_at == None, Ticket.due_resolution_at < now).all()  # noqa: E711
-    for t in overdue:
-        # simple escalation: set status to 'Aguardando' if not already and log
-        if t.status not in ('Resolvido', 'Fechado'):
-            old = t.status
-            t.status = 'Aguardando'
-            db.session.commit()
-            audit('ticket', t.id, 'escalate_overdue', data=f'status {old} -> {t.status}')
+
+RETENTION_MARKER = '[removido por retenção]'
+RETENTION_CHECKPOINT = 'retention'
 
 
-def run_retention():
+def run_retention(batch_size=None, max_seconds=None):
+    """Aplica a retenção por empresa em lotes de tickets encerrados.
+
+    Cada lote remove os anexos (em massa), anonimiza os comentários com um
+    UPDATE e grava o checkpoint (empresa, último ticket) no mesmo commit;
+    uma execução interrompida, ou que esgotou RETENTION_MAX_SECONDS,
+    continua de onde parou. Retorna as estatísticas, com o tempo de cada lote.
+    """
     from .models import Company, Attachment
-    companies = Company.query.all()
-    removed_files = 0
-    anonymized_comments = 0
-    for comp in companies:
-        days = comp.retention_days or 0
-        if days <= 0:
-            continue
+    size = batch_size or current_app.config.get('RETENTION_BATCH_SIZE', 200)
+    if max_seconds is None:
+        max_seconds = current_app.config.get('RETENTION_MAX_SECONDS', 0)
+    tickets = Ticket.__table__
+    attachments = Attachment.__table__
+    comments = TicketComment.__table__
+    started = time.perf_counter()
+    cp = load_checkpoint(RETENTION_CHECKPOINT, {}) or {}
+    stats = {'tickets': 0, 'files': 0, 'bytes': 0, 'comments': 0, 'batches': [], 'complete': True,
+             'resumed': bool(cp.get('company_id'))}
+    removals = []
+    companies = (db.session.query(Company.id, Company.retention_days)
+                 .filter(Company.id >= (cp.get('company_id') or 0), Company.retention_days > 0)
+                 .order_by(Company.id).all())
+    for company_id, days in companies:
         cutoff = datetime.utcnow() - timedelta(days=days)
-        old_tickets = Ticket.query.filter(
-            Ticket.company_id == comp.id,
-            Ticket.closed_at != None,  # noqa: E711
-            Ticket.closed_at < cutoff
-        ).all()
-        for t in old_tickets:
-            # remove attachments from disk and db
-            atts = list(t.attachments)
-            for att in atts:
-                upload_dir = os.path.join(current_app.root_path, 'uploads', str(t.id))
-                fpath = os.path.join(upload_dir, att.filename)
-                try:
-                    if os.path.exists(fpath):
-                        os.remove(fpath)
-                        removed_files += 1
-                except Exception:
-                    pass
-                db.session.delete(att)
-            # anonymize comments content
-            for c in t.comments:
-                if c.content and c.content != '[removido por retenção]':
-                    c.content = '[removido por retenção]'
-                    anonymized_comments += 1
+        last_id = cp.get('last_ticket_id', 0) if company_id == cp.get('company_id') else 0
+        while True:
+            if max_seconds and time.perf_counter() - started >= max_seconds:
+                stats['complete'] = False
+                break
+            t0 = time.perf_counter()
+            ids = [r[0] for r in db.session.execute(
+                select(tickets.c.id)
+                .where(tickets.c.company_id == company_id,
+                       tickets.c.closed_at.isnot(None),
+                       tickets.c.closed_at < cutoff,
+                       tickets.c.id > last_id)
+                .order_by(tickets.c.id)
+                .limit(size))]
+            if not ids:
+                break
+            files = db.session.execute(
+                select(attachments.c.ticket_id, attachments.c.filename)
+                .where(attachments.c.ticket_id.in_(ids))).all()
+            if files:
+                db.session.execute(attachments.delete().where(attachments.c.ticket_id.in_(ids)))
+            anonymized = db.session.execute(
+                comments.update()
+                .where(comments.c.ticket_id.in_(ids), comments.c.content != RETENTION_MARKER)
+                .values(content=RETENTION_MARKER)).rowcount
+            last_id = ids[-1]
+            save_checkpoint(RETENTION_CHECKPOINT, {'company_id': company_id, 'last_ticket_id': last_id})
+            db.session.commit()
+            # Arquivos só depois do commit (se o lote falhar, nenhum anexo fica sem arquivo),
+            # apagados no pool de threads enquanto o próximo lote roda no banco
+            upload_root = os.path.join(current_app.root_path, 'uploads')
+            removals.extend(remove_files([os.path.join(upload_root, str(ticket_id), filename)
+                                          for ticket_id, filename in files]))
+            elapsed = time.perf_counter() - t0
+            stats['tickets'] += len(ids)
+            stats['comments'] += anonymized
+            stats['batches'].append(round(elapsed, 4))
+            current_app.logger.info('Retenção: empresa %s, %s ticket(s) até #%s, %s arquivo(s), %s comentário(s) em %.3fs',
+                                    company_id, len(ids), last_id, len(files), anonymized, elapsed)
+            if len(ids) < size:
+                break
+        if not stats['complete']:
+            break
+    if stats['complete']:
+        # Passada completa: a próxima execução recomeça da primeira empresa
+        save_checkpoint(RETENTION_CHECKPOINT, {})
         db.session.commit()
-    current_app.logger.info(f"Retention executed: files removed={removed_files}, comments anonymized={anonymized_comments}")
+    stats['files'], stats['bytes'] = collect_removed(removals)
+    stats['total'] = time.perf_counter() - started
+    current_app.logger.info(f"Retention executed: tickets={stats['tickets']}, files removed={stats['files']} ({stats['bytes']} bytes), "
+                            f"comments anonymized={stats['comments']}, batches={len(stats['batches'])}, "
+                            f"complete={stats['complete']}, {stats['total']:.3f}s")
+    return stats
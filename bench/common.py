@@ -0,0 +1,72 @@
+"""Utilitários dos benchmarks (bench/*.py).
+
+Cada script cria a app num banco SQLite temporário (ou no DATABASE_URL
+informado em BENCH_DATABASE_URL), sem workers em segundo plano, gera os dados
+e imprime os tempos. Rode a partir da raiz do repositório:
+
+    python bench/notify_ack.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Antes de importar a app: a configuração lê o ambiente na importação
+os.environ['DATABASE_URL'] = os.environ.get('BENCH_DATABASE_URL') or \
+    'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='servicedesk-bench-'), 'bench.db')
+os.environ.setdefault('MAIL_SUPPRESS_SEND', 'true')
+os.environ['MAIL_OUTBOX_WORKER'] = 'false'
+os.environ['AUDIT_ASYNC'] = 'false'
+os.environ['METRICS_ENABLED'] = 'false'
+
+from sqlalchemy import event  # noqa: E402
+
+from app import create_app, db  # noqa: E402
+
+
+def make_app():
+    app = create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    return app
+
+
+class QueryCounter:
+    """Conta os comandos SQL (executemany conta uma vez por linha) e os commits do bloco."""
+
+    def __init__(self, engine=None):
+        self.engine = engine or db.engine
+        self.count = 0
+        self.commits = 0
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += len(parameters) if executemany else 1
+
+    def _commit(self, conn):
+        self.commits += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._count)
+        event.listen(self.engine, 'commit', self._commit)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._count)
+        event.remove(self.engine, 'commit', self._commit)
+
+
+def timed(fn, repeat=1):
+    """Executa ``fn`` ``repeat`` vezes; devolve (segundos por chamada, último resultado)."""
+    result = None
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - started) / repeat, result
+
+
+def login(client, user_id):
+    with client.session_transaction() as s:
+        s['_user_id'] = str(user_id)
+        s['_fresh'] = True
@@ -0,0 +1,74 @@
+"""Confirmação de entrega das notificações: UPDATE por linha (ORM) x UPDATE único.
+
+Um usuário com um grande acúmulo de notificações já vistas recebe ``--batch``
+novas a cada tick. Compara o caminho antigo (seen_at em cada objeto e commit
+em todo tick) com notifications.routes._mark_delivered.
+
+    python bench/notify_ack.py --notifications 100000 --batch 20 --ticks 30
+"""
+import argparse
+from datetime import datetime
+
+from common import QueryCounter, db, make_app, timed
+
+
+def per_row(user_id, items):
+    # Implementação anterior: um UPDATE por objeto na unidade de trabalho, commit sempre
+    now = datetime.utcnow()
+    for n in items:
+        if not n.seen_at:
+            n.seen_at = now
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--notifications', type=int, default=100000)
+    parser.add_argument('--batch', type=int, default=20)
+    parser.add_argument('--ticks', type=int, default=30)
+    args = parser.parse_args()
+
+    from app.models import Notification, User
+    from app.notifications.routes import _mark_delivered
+
+    app = make_app()
+    with app.app_context():
+        admin = User.query.filter_by(role='admin').first()
+        user_id, company_id = admin.id, admin.company_id
+        now = datetime.utcnow()
+        for offset in range(0, args.notifications, 50000):
+            db.session.execute(Notification.__table__.insert(), [
+                dict(user_id=user_id, company_id=company_id, kind='info', title=f'n{i}',
+                     seen_at=now, read_at=now, created_at=now)
+                for i in range(offset, min(args.notifications, offset + 50000))])
+        db.session.commit()
+        print(f'{args.notifications} notificações para o usuário {user_id}; lote de {args.batch}, {args.ticks} ticks')
+
+        def unseen():
+            return (Notification.query.filter_by(user_id=user_id).filter(Notification.seen_at.is_(None))
+                    .order_by(Notification.id.desc()).limit(args.batch).all())
+
+        def new_batch():
+            ids = [r[0] for r in db.session.query(Notification.id).filter_by(user_id=user_id)
+                   .order_by(Notification.id.desc()).limit(args.batch)]
+            Notification.query.filter(Notification.id.in_(ids)).update({'seen_at': None}, synchronize_session=False)
+            db.session.commit()
+            db.session.close()
+
+        for label, ack in (('ORM por linha', per_row), ('UPDATE único', _mark_delivered)):
+            for case, prepare in (('com novidades', new_batch), ('tick vazio', None)):
+                total = statements = commits = 0
+                for _ in range(args.ticks):
+                    if prepare:
+                        prepare()
+                    items = unseen()
+                    with QueryCounter() as counter:
+                        seconds, _ = timed(lambda: ack(user_id, items))
+                    total += seconds
+                    statements, commits = counter.count, counter.commits
+                    db.session.close()
+                print(f'{label:14} {case:14} {total / args.ticks * 1000:8.3f} ms/tick  {statements} comando(s) SQL, {commits} commit(s)')
+
+
+if __name__ == '__main__':
+    main()
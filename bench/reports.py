@@ -0,0 +1,124 @@
+"""Painel de relatórios: GROUP BY no banco x carregar todos os tickets.
+
+Gera ``--tickets`` tickets em 20 empresas ao longo de um ano (30% avaliados)
+e, para cada período, mede a rota /reports/ (agregação no banco) e a
+implementação anterior (todos os tickets como objetos ORM, contados em
+Python), conferindo que os totais são iguais. Com ``--memory`` mede também o
+pico de memória alocada (tracemalloc, deixa tudo mais lento).
+
+    python bench/reports.py --tickets 1000000 --periods all,month,week,today
+"""
+import argparse
+import random
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from flask import template_rendered
+
+from common import db, login, make_app, timed
+
+STATUSES = ['Novo', 'Em atendimento', 'Aguardando', 'Resolvido', 'Fechado']
+PRIORITIES = ['Baixa', 'Média', 'Alta', 'Crítica']
+
+
+def load_all(start):
+    # Implementação anterior: todos os tickets do período na memória
+    from app.models import Ticket
+    q = Ticket.query
+    if start is not None:
+        q = q.filter(Ticket.created_at >= start)
+    by_status, by_priority, by_company = {}, {}, {}
+    rating_sum = rating_count = 0
+    tickets = q.all()
+    for t in tickets:
+        by_status[t.status] = by_status.get(t.status, 0) + 1
+        by_priority[t.priority] = by_priority.get(t.priority, 0) + 1
+        name = t.company.name if t.company else '—'
+        by_company[name] = by_company.get(name, 0) + 1
+        if t.user_rating is not None:
+            rating_sum += t.user_rating
+            rating_count += 1
+    return {'total': len(tickets), 'by_status': by_status, 'by_priority': by_priority,
+            'by_company': by_company, 'avg_overall': rating_sum / rating_count if rating_count else None}
+
+
+def seed(total, admin_id, rnd):
+    from app.models import Company, Ticket
+    companies = [Company(name=f'Empresa {i:02d}', domain=f'empresa{i:02d}.bench') for i in range(20)]
+    db.session.add_all(companies)
+    db.session.commit()
+    company_ids = [c.id for c in companies]
+    now = datetime.utcnow()
+    for offset in range(0, total, 50000):
+        rows = []
+        for i in range(offset, min(total, offset + 50000)):
+            created = now - timedelta(minutes=rnd.random() * 525600)
+            rated = rnd.random() < 0.3
+            rows.append(dict(number=f'B{i}', title=f'Chamado {i}', description='d', status=rnd.choice(STATUSES),
+                             priority=rnd.choice(PRIORITIES), company_id=rnd.choice(company_ids),
+                             created_by_id=admin_id, created_at=created,
+                             user_rating=rnd.randint(1, 5) if rated else None,
+                             user_rating_at=min(created + timedelta(hours=rnd.random() * 72), now) if rated else None))
+        db.session.execute(Ticket.__table__.insert(), rows)
+        db.session.commit()
+    db.session.execute(db.text('ANALYZE'))
+    db.session.commit()
+
+
+def measure(fn, memory):
+    if not memory:
+        return timed(fn) + (None,)
+    tracemalloc.start()
+    try:
+        seconds, result = timed(fn)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return seconds, result, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--tickets', type=int, default=200000)
+    parser.add_argument('--periods', default='all,month,week,today')
+    parser.add_argument('--memory', action='store_true')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    from app.models import User
+    from app.reports.routes import _period_start
+
+    app = make_app()
+    contexts = []
+    template_rendered.connect(lambda sender, template, context, **kw: contexts.append(context), app, weak=False)
+    with app.app_context():
+        admin_id = User.query.filter_by(role='admin').first().id
+        started = time.perf_counter()
+        seed(args.tickets, admin_id, random.Random(args.seed))
+        print(f'{args.tickets} tickets gerados em {time.perf_counter() - started:.1f}s')
+
+    client = app.test_client()
+    login(client, admin_id)
+    for period in args.periods.split(','):
+        url = f'/reports/?period={period}'
+        client.get(url)  # aquece caches e o plano de consulta
+        seconds, response, peak = measure(lambda: client.get(url), args.memory)
+        assert response.status_code == 200
+        new = contexts[-1]
+        line = f'{period:6} GROUP BY {seconds:7.3f}s'
+        if peak is not None:
+            line += f' ({peak / 1e6:.1f} MB)'
+        with app.app_context():
+            seconds, old, peak = measure(lambda: load_all(_period_start(period)), args.memory)
+            db.session.remove()
+        line += f' | todos os tickets {seconds:7.3f}s'
+        if peak is not None:
+            line += f' ({peak / 1e6:.1f} MB)'
+        same = all(new[k] == old[k] for k in ('total', 'by_status', 'by_priority', 'by_company')) and \
+            abs((new['avg_overall'] or 0) - (old['avg_overall'] or 0)) < 1e-9
+        print(f'{line} | {old["total"]} tickets, totais {"iguais" if same else "DIFERENTES"}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""choose_sla_plan: varredura de todos os planos x índice compilado por empresa.
+
+Gera uma empresa com contratos x categorias x prioridades (com curingas,
+planos inativos e chaves repetidas), confere que as duas versões escolhem o
+mesmo plano e mede o custo por chamada com sessão nova (como na criação de
+um ticket).
+
+    python bench/sla_index.py --contracts 8 --categories 12 --calls 1000
+"""
+import argparse
+import random
+
+from common import QueryCounter, db, make_app, timed
+
+PRIORITIES = ['Baixa', 'Média', 'Alta', 'Crítica']
+
+
+def scan_sla_plan(company_id, contract_id=None, category_id=None, priority=None):
+    # Implementação anterior: carrega todos os planos ativos e pontua em Python
+    from app.models import SLAPlan
+    best, best_score = None, -1
+    for p in SLAPlan.query.filter_by(company_id=company_id, active=True).all():
+        score = 0
+        for value, wanted, weight in ((p.contract_id, contract_id, 4), (p.category_id, category_id, 2),
+                                      (p.priority, priority, 1)):
+            if value and wanted and value == wanted:
+                score += weight
+            elif value and value != wanted:
+                score = -1
+                break
+        if score > best_score:
+            best, best_score = p, score
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--contracts', type=int, default=8)
+    parser.add_argument('--categories', type=int, default=12)
+    parser.add_argument('--calls', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    from app.models import Category, Company, Contract, SLAPlan
+    from app.utils import choose_sla_plan
+
+    rnd = random.Random(args.seed)
+    app = make_app()
+    with app.app_context():
+        company_id = Company.query.first().id
+        contracts = [Contract(company_id=company_id, name=f'contrato {i}') for i in range(args.contracts)]
+        categories = [Category(company_id=company_id, name=f'categoria {i}') for i in range(args.categories)]
+        db.session.add_all(contracts + categories)
+        db.session.commit()
+        contract_ids = [c.id for c in contracts]
+        category_ids = [c.id for c in categories]
+        plans = []
+        for contract_id in contract_ids + [None]:
+            for category_id in category_ids + [None]:
+                for priority in PRIORITIES + [None]:
+                    if rnd.random() < 0.6:
+                        plans.append(dict(company_id=company_id, name='plano', first_response_minutes=60,
+                                          resolution_minutes=480, contract_id=contract_id,
+                                          category_id=category_id, priority=priority,
+                                          active=rnd.random() < 0.9))
+        # Chaves repetidas: empate fica com o menor id
+        plans += [dict(plans[0], active=True) for _ in range(2)]
+        db.session.execute(SLAPlan.__table__.insert(), plans)
+        db.session.commit()
+        print(f'{len(plans)} planos ({args.contracts} contratos x {args.categories} categorias x '
+              f'{len(PRIORITIES)} prioridades + curingas)')
+
+        lookups = [(rnd.choice(contract_ids + [None, None]), rnd.choice(category_ids + [None]),
+                    rnd.choice(PRIORITIES + [None])) for _ in range(args.calls)]
+        mismatches = 0
+        for key in lookups:
+            a, b = scan_sla_plan(company_id, *key), choose_sla_plan(company_id, *key)
+            mismatches += (a.id if a else None) != (b.id if b else None)
+        print(f'{mismatches} divergência(s) em {len(lookups)} consultas')
+
+        for label, fn in (('varredura', scan_sla_plan), ('índice', choose_sla_plan)):
+            def run():
+                for key in lookups:
+                    db.session.expunge_all()  # cada criação de ticket é uma sessão nova
+                    fn(company_id, *key)
+            with QueryCounter() as counter:
+                seconds, _ = timed(run)
+            print(f'{label:10} {seconds / len(lookups) * 1e6:8.0f} us/chamada  '
+                  f'{counter.count / len(lookups):.2f} consulta(s)/chamada')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Envio SMTP: uma conexão por mensagem x sessão reaproveitada (SMTPPool).
+
+Sobe o servidor SMTP em memória dos testes (tests/smtpsink.py) e envia
+``--messages`` mensagens de três formas: _deliver sem pool (conexão nova a
+cada mensagem, como antes), deliver_batch com SMTPPool e o worker da fila
+(mailer.process_outbox em lotes de ``--batch``) esvaziando o email_outbox.
+
+    python bench/smtp_pool.py --messages 500 --batch 50
+"""
+import argparse
+import json
+import os
+import sys
+
+from common import ROOT, db, make_app, timed
+
+sys.path.insert(0, os.path.join(ROOT, 'tests'))
+
+from smtpsink import SMTPSink, use_sink  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--batch', type=int, default=50)
+    args = parser.parse_args()
+
+    from app.email import SMTPPool, _deliver, deliver_batch, smtp_pool
+    from app.mailer import process_outbox
+    from app.models import EmailOutbox
+
+    app = make_app()
+    app.config['MAIL_OUTBOX_BATCH'] = args.batch
+    messages = [(f'Assunto {i}', [f'user{i}@bench.test'], f'Corpo {i}', f'<p>Corpo {i}</p>')
+                for i in range(args.messages)]
+    with app.app_context():
+        print(f'{args.messages} mensagens; lote do worker de {args.batch}')
+
+        def per_message():
+            for m in messages:
+                _deliver(*m)
+            return [None] * len(messages)
+
+        def pooled():
+            pool = SMTPPool()
+            try:
+                return deliver_batch(messages, pool=pool)
+            finally:
+                pool.close()
+
+        def drain():
+            db.session.execute(EmailOutbox.__table__.insert(), [
+                dict(subject=s, recipients=json.dumps(r), body=b, html=h) for s, r, b, h in messages])
+            db.session.commit()
+            sent = failed = 0
+            try:
+                while True:
+                    s, f = process_outbox(app.config)
+                    if not s + f:
+                        return [None] * sent + ['falha'] * failed
+                    sent, failed = sent + s, failed + f
+            finally:
+                smtp_pool.close()
+
+        for label, fn in (('conexão por mensagem', per_message), ('deliver_batch (pool)', pooled),
+                          ('process_outbox', drain)):
+            with SMTPSink() as sink:
+                use_sink(app, sink.port)
+                seconds, results = timed(fn)
+                errors = sum(1 for r in results if r is not None)
+                print(f'{label:22} {seconds:7.3f} s  {args.messages / seconds:8.0f} msg/s  '
+                      f'{sink.connections} conexão(ões), {len(sink.messages)} recebidas, {errors} erro(s)')
+
+
+if __name__ == '__main__':
+    main()
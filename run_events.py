@@ -0,0 +1,29 @@
+"""Servidor ASGI dos streams SSE (ver app/sse_gateway.py).
+
+Uso:
+    pip install uvicorn asgiref
+    python run_events.py
+
+Com asgiref instalado, as demais rotas são servidas pelo próprio Flask no
+mesmo processo (um único servidor). Rodando ao lado do run.py (proxy
+encaminhando /notify/stream, /tickets/<id>/comments/stream e /chat/stream
+para cá), use EVENTS_BACKEND=redis para que os eventos publicados pelo
+processo WSGI cheguem ao gateway.
+"""
+import os
+from app import create_app
+from app.sse_gateway import SSEGateway
+
+flask_app = create_app()
+
+try:
+    from asgiref.wsgi import WsgiToAsgi  # type: ignore
+    fallback = WsgiToAsgi(flask_app)
+except Exception:
+    fallback = None
+
+app = SSEGateway(flask_app, fallback=fallback)
+
+if __name__ == "__main__":
+    import uvicorn  # type: ignore
+    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get('EVENTS_PORT', 4481)))
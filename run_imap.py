@@ -0,0 +1,18 @@
+"""Ingestão de e-mails em processo separado (ver app/imap_listener.py).
+
+Uso, ao lado do run.py (requer IMAP_HOST/IMAP_USERNAME/IMAP_PASSWORD):
+    python run_imap.py
+"""
+from app import create_app
+from app.imap_listener import run_listener
+
+app = create_app()
+
+if __name__ == "__main__":
+    if not app.config.get('IMAP_HOST') or not app.config.get('IMAP_USERNAME'):
+        raise SystemExit("[IMAP] Defina IMAP_HOST, IMAP_USERNAME e IMAP_PASSWORD no .env")
+    print("[IMAP] Aguardando e-mails via IDLE (Ctrl+C para sair)")
+    try:
+        run_listener(app)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,18 @@
+"""Worker do outbox de e-mail em processo separado (ver app/mailer.py).
+
+Uso: MAIL_OUTBOX_WORKER=0 no processo web e, em paralelo:
+    python run_mailer.py
+"""
+import os
+from app import create_app
+from app.mailer import run_worker
+
+os.environ['MAIL_OUTBOX_WORKER'] = '0'  # este processo roda o loop em primeiro plano
+app = create_app()
+
+if __name__ == "__main__":
+    print("[MAILER] Processando outbox de e-mail (Ctrl+C para sair)")
+    try:
+        run_worker(app)
+    except KeyboardInterrupt:
+        pass
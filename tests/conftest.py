@@ -0,0 +1,51 @@
+import os
+import tempfile
+
+# Antes de importar a app: a configuração lê o ambiente na importação
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='servicedesk-tests-'), 'app.db')
+os.environ['MAIL_SUPPRESS_SEND'] = 'true'
+os.environ['MAIL_OUTBOX_WORKER'] = 'false'
+os.environ['AUDIT_ASYNC'] = 'false'
+
+import pytest
+
+from app import create_app, db
+from app.config import BaseConfig
+from app.models import Company, User
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # Banco novo por teste
+    monkeypatch.setattr(BaseConfig, 'SQLALCHEMY_DATABASE_URI', 'sqlite:///' + str(tmp_path / 'app.db'))
+    app = create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def admin(app):
+    with app.app_context():
+        user = User.query.filter_by(role='admin').first()
+        return {'id': user.id, 'company_id': user.company_id}
+
+
+def login(client, user_id):
+    with client.session_transaction() as s:
+        s['_user_id'] = str(user_id)
+        s['_fresh'] = True
+
+
+def make_company(name='ACME'):
+    company = Company(name=name, domain=name.lower() + '.test')
+    db.session.add(company)
+    db.session.flush()
+    return company
@@ -0,0 +1,146 @@
+"""Servidor IMAP mínimo em memória para os testes de ingestão.
+
+Implementa o suficiente para imaplib: CAPABILITY, LOGIN, SELECT (com
+UIDVALIDITY/UIDNEXT), UID SEARCH/FETCH/STORE, NOOP e LOGOUT. Os comandos
+recebidos ficam em ``mailbox.commands``.
+"""
+import re
+import socketserver
+import threading
+
+
+class Mailbox:
+    def __init__(self, uidvalidity=1):
+        self.uidvalidity = uidvalidity
+        self.messages = {}
+        self.flags = {}
+        self.next_uid = 1
+        self.commands = []
+
+    def add(self, raw, seen=False):
+        uid = self.next_uid
+        self.next_uid += 1
+        self.messages[uid] = raw
+        self.flags[uid] = {'\\Seen'} if seen else set()
+        return uid
+
+    def recreate(self, uidvalidity):
+        """Caixa apagada e recriada: UIDs recomeçam com outro UIDVALIDITY."""
+        old = [self.messages[uid] for uid in sorted(self.messages)]
+        self.__init__(uidvalidity)
+        for raw in old:
+            self.add(raw)
+
+    def seen(self, uid):
+        return '\\Seen' in self.flags[uid]
+
+
+def make_message(sender, subject, body='hello', message_id=None):
+    message_id = message_id or f'<{subject.replace(" ", "-")}@test>'
+    return (f'From: {sender}\r\nTo: suporte@test\r\nSubject: {subject}\r\n'
+            f'Message-ID: {message_id}\r\nContent-Type: text/plain; charset=utf-8\r\n\r\n{body}').encode()
+
+
+def _uid_set(spec, uids):
+    highest = max(uids) if uids else 0
+    out = set()
+    for part in spec.split(','):
+        if ':' in part:
+            a, b = part.split(':')
+            a, b = int(a), highest if b == '*' else int(b)
+            lo, hi = min(a, b), max(a, b)
+            out.update(u for u in uids if lo <= u <= hi)
+            # "n:*" inclui o maior UID mesmo quando n > maior (RFC 3501)
+            if b == highest and part.endswith('*') and uids:
+                out.add(highest)
+        else:
+            out.add(int(part))
+    return sorted(u for u in out if u in uids)
+
+
+def _header_fields(raw, names):
+    head = raw.split(b'\r\n\r\n', 1)[0]
+    lines = [line for line in head.split(b'\r\n') if line.split(b':', 1)[0].upper().decode() in names]
+    return b'\r\n'.join(lines) + b'\r\n\r\n'
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def send(self, data):
+        self.wfile.write(data if isinstance(data, bytes) else data.encode())
+        self.wfile.flush()
+
+    def handle(self):
+        box = self.server.mailbox
+        self.send('* OK fake IMAP ready\r\n')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            tag, _, rest = line.decode().rstrip('\r\n').partition(' ')
+            command, _, args = rest.partition(' ')
+            command = command.upper()
+            box.commands.append(rest)
+            if command == 'CAPABILITY':
+                self.send(f'* CAPABILITY IMAP4rev1\r\n{tag} OK done\r\n')
+            elif command in ('LOGIN', 'NOOP'):
+                self.send(f'{tag} OK done\r\n')
+            elif command == 'SELECT':
+                self.send(f'* {len(box.messages)} EXISTS\r\n'
+                          f'* OK [UIDVALIDITY {box.uidvalidity}] ok\r\n'
+                          f'* OK [UIDNEXT {box.next_uid}] ok\r\n'
+                          f'{tag} OK [READ-WRITE] done\r\n')
+            elif command == 'LOGOUT':
+                self.send(f'* BYE\r\n{tag} OK done\r\n')
+                return
+            elif command == 'UID':
+                self.uid(tag, args, box)
+            else:
+                self.send(f'{tag} BAD {command}\r\n')
+
+    def uid(self, tag, args, box):
+        sub, _, args = args.partition(' ')
+        sub = sub.upper()
+        uids = sorted(box.messages)
+        if sub == 'SEARCH':
+            if 'UNSEEN' in args.upper():
+                found = [u for u in uids if not box.seen(u)]
+            elif args.upper().startswith('UID '):
+                found = _uid_set(args[4:], uids)
+            else:
+                found = uids
+            self.send('* SEARCH ' + ' '.join(map(str, found)) + f'\r\n{tag} OK done\r\n')
+        elif sub == 'FETCH':
+            spec, _, what = args.partition(' ')
+            fields = re.search(r'HEADER\.FIELDS \(([^)]*)\)', what)
+            for uid in _uid_set(spec, uids):
+                raw = box.messages[uid]
+                if fields:
+                    data, name = _header_fields(raw, fields.group(1).upper().split()), f'BODY[HEADER.FIELDS ({fields.group(1)})]'
+                else:
+                    data, name = raw, 'BODY[]'
+                self.send(f'* {uids.index(uid) + 1} FETCH (UID {uid} {name} {{{len(data)}}}\r\n'.encode() + data + b')\r\n')
+            self.send(f'{tag} OK done\r\n')
+        elif sub == 'STORE':
+            for uid in _uid_set(args.split(' ')[0], uids):
+                box.flags[uid].add('\\Seen')
+            self.send(f'{tag} OK done\r\n')
+        else:
+            self.send(f'{tag} BAD UID {sub}\r\n')
+
+
+class FakeIMAPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, mailbox=None):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.mailbox = mailbox or Mailbox()
+        self.port = self.server_address[1]
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
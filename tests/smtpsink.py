@@ -0,0 +1,95 @@
+"""Servidor SMTP mínimo em memória para os testes de envio.
+
+Guarda as mensagens recebidas e conta as conexões. ``drop_after`` derruba a
+conexão (sem resposta) no MAIL FROM seguinte à N-ésima mensagem da sessão,
+simulando um servidor que encerra sessões longas; endereços em ``reject``
+são recusados no RCPT TO (550).
+"""
+import socketserver
+import threading
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write((line + '\r\n').encode())
+        self.wfile.flush()
+
+    def handle(self):
+        sink = self.server
+        with sink.lock:
+            sink.connections += 1
+        sent = 0
+        recipients = []
+        self.reply('220 sink ready')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('latin-1').strip().split(' ', 1)[0].upper()
+            if command in ('EHLO', 'HELO'):
+                self.reply('250 sink')
+            elif command == 'MAIL':
+                if sink.drop_after is not None and sent >= sink.drop_after:
+                    with sink.lock:
+                        sink.drops += 1
+                    return
+                recipients = []
+                self.reply('250 OK')
+            elif command == 'RCPT':
+                address = line.decode('latin-1').split(':', 1)[1].strip().strip('<>')
+                if address in sink.reject:
+                    self.reply('550 mailbox unavailable')
+                    continue
+                recipients.append(address)
+                self.reply('250 OK')
+            elif command == 'DATA':
+                self.reply('354 end with .')
+                data = []
+                for raw in iter(self.rfile.readline, b''):
+                    if raw in (b'.\r\n', b'.\n'):
+                        break
+                    data.append(raw)
+                with sink.lock:
+                    sink.messages.append((recipients, b''.join(data)))
+                sent += 1
+                self.reply('250 queued')
+            elif command == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, drop_after=None, reject=()):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.port = self.server_address[1]
+        self.drop_after = drop_after
+        self.reject = set(reject)
+        self.lock = threading.Lock()
+        self.messages = []
+        self.connections = 0
+        self.drops = 0
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+def use_sink(app, port):
+    """Aponta o Flask-Mail da app para o sink (a config é lida no init_app)."""
+    state = app.extensions['mail']
+    state.server = '127.0.0.1'
+    state.port = port
+    state.use_tls = state.use_ssl = False
+    state.username = state.password = None
+    state.suppress = False
+    state.debug = 0
+    app.config['MAIL_SUPPRESS_SEND'] = False
@@ -0,0 +1,102 @@
+import glob
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import audit, db
+from app.models import AuditLog
+
+
+@pytest.fixture
+def archive_app(app, tmp_path):
+    app.config.update(AUDIT_ARCHIVE_DIR=str(tmp_path / 'archive'), AUDIT_ARCHIVE_DAYS=30)
+    with app.app_context():
+        now = datetime.utcnow()
+        db.session.execute(AuditLog.__table__.insert(), [
+            {'entity': 'ticket', 'entity_id': i, 'action': 'update', 'user_id': None, 'data': None,
+             'created_at': now - timedelta(days=60 if i < 25 else 1)} for i in range(30)])
+        db.session.commit()
+    return app
+
+
+def archived_ids(folder):
+    ids = []
+    for path in sorted(glob.glob(os.path.join(folder, 'audit-*.jsonl.gz'))):
+        with gzip.open(path, 'rt', encoding='utf-8') as fh:
+            ids.extend(json.loads(line)['entity_id'] for line in fh)
+    return ids
+
+
+def files(folder):
+    return sorted(os.listdir(folder))
+
+
+def test_archive_moves_old_rows_to_indexed_segments(archive_app):
+    with archive_app.app_context():
+        stats = audit.archive_audit_log(segment_rows=10)
+        assert (stats['segments'], stats['rows']) == (3, 25)
+        assert AuditLog.query.count() == 5
+        folder = archive_app.config['AUDIT_ARCHIVE_DIR']
+        assert archived_ids(folder) == list(range(25))
+        segments = audit.archived_segments()
+        assert [s['rows'] for s in segments] == [5, 10, 10]
+        assert all(os.path.exists(os.path.join(folder, s['segment'])) for s in segments)
+
+
+def test_crash_before_index_rewrites_same_segment(archive_app, monkeypatch):
+    replace = audit._durable_replace
+
+    def crash_on_index(tmp, path):
+        if path.endswith('.idx.json'):
+            raise OSError('queda simulada')
+        replace(tmp, path)
+
+    with archive_app.app_context():
+        folder = archive_app.config['AUDIT_ARCHIVE_DIR']
+        monkeypatch.setattr(audit, '_durable_replace', crash_on_index)
+        with pytest.raises(OSError):
+            audit.archive_audit_log(segment_rows=100)
+        db.session.rollback()
+        orphan = [f for f in files(folder) if f.endswith('.jsonl.gz')]
+        assert len(orphan) == 1
+        assert AuditLog.query.count() == 30
+
+        # Até a próxima execução mais registros passam do corte: o intervalo muda
+        db.session.execute(AuditLog.__table__.insert(), [
+            {'entity': 'ticket', 'entity_id': i, 'action': 'update', 'user_id': None, 'data': None,
+             'created_at': datetime.utcnow() - timedelta(days=45)} for i in range(30, 33)])
+        db.session.commit()
+        monkeypatch.setattr(audit, '_durable_replace', replace)
+        stats = audit.archive_audit_log(segment_rows=100)
+        assert (stats['segments'], stats['rows']) == (1, 28)
+        # Mesmo nome: o segmento sem índice foi regravado, não duplicado
+        assert archived_ids(folder) == list(range(25)) + [30, 31, 32]
+        assert [f for f in files(folder) if f.endswith('.jsonl.gz')] == orphan
+        assert not [f for f in files(folder) if 'partial' in f or f.endswith('.tmp')]
+
+
+def test_crash_after_index_finishes_delete_on_next_run(archive_app, monkeypatch):
+    delete = audit._delete_archived
+    calls = []
+
+    def crash_once(idx):
+        calls.append(idx)
+        if len(calls) == 1:
+            raise RuntimeError('queda simulada')
+        return delete(idx)
+
+    with archive_app.app_context():
+        monkeypatch.setattr(audit, '_delete_archived', crash_once)
+        with pytest.raises(RuntimeError):
+            audit.archive_audit_log(segment_rows=10)
+        db.session.rollback()
+        assert AuditLog.query.count() == 30
+
+        stats = audit.archive_audit_log(segment_rows=10)
+        assert stats['recovered'] == 10
+        assert stats['rows'] == 15
+        assert AuditLog.query.count() == 5
+        assert archived_ids(archive_app.config['AUDIT_ARCHIVE_DIR']) == list(range(25))
@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.models import AuditLog, Ticket
+from app.utils import _escalate_rows, escalate_tickets
+
+
+def _overdue(admin, number, status):
+    ticket = Ticket(number=number, title=number, description='d', status=status,
+                    company_id=admin['company_id'], created_by_id=admin['id'],
+                    due_resolution_at=datetime.utcnow() - timedelta(hours=1))
+    db.session.add(ticket)
+    return ticket
+
+
+@pytest.mark.parametrize('returning', [True, False])
+def test_only_rows_still_in_old_status_are_escalated(app, admin, monkeypatch, returning):
+    with app.app_context():
+        monkeypatch.setattr(db.engine.dialect, 'update_returning', returning)
+        tickets = [_overdue(admin, f'T-{i}', 'Novo') for i in range(3)]
+        db.session.commit()
+        ids = [t.id for t in tickets]
+        # Alterado por outra sessão entre o SELECT e o UPDATE
+        db.session.execute(Ticket.__table__.update().where(Ticket.id == ids[1]).values(status='Em atendimento'))
+
+        stats = {'update': 0, 'audit': 0}
+        changed = _escalate_rows([(i, 'Novo') for i in ids], datetime.utcnow(), stats)
+        db.session.commit()
+
+        assert sorted(changed) == [(ids[0], 'Novo'), (ids[2], 'Novo')]
+        statuses = dict(db.session.query(Ticket.id, Ticket.status).filter(Ticket.id.in_(ids)))
+        assert statuses == {ids[0]: 'Aguardando', ids[1]: 'Em atendimento', ids[2]: 'Aguardando'}
+        logged = {a.entity_id for a in AuditLog.query.filter_by(action='escalate_overdue')}
+        assert logged == {ids[0], ids[2]}
+
+
+def test_escalate_tickets_skips_closed_and_not_due(app, admin):
+    with app.app_context():
+        due = _overdue(admin, 'T-due', 'Em atendimento')
+        closed = _overdue(admin, 'T-closed', 'Fechado')
+        later = _overdue(admin, 'T-later', 'Novo')
+        later.due_resolution_at = datetime.utcnow() + timedelta(hours=1)
+        db.session.commit()
+        assert escalate_tickets([due.id, closed.id, later.id]) == 1
+        assert db.session.get(Ticket, due.id).status == 'Aguardando'
+        assert db.session.get(Ticket, closed.id).status == 'Fechado'
+        assert db.session.get(Ticket, later.id).status == 'Novo'
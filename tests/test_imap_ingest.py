@@ -0,0 +1,147 @@
+import imaplib
+
+import pytest
+
+from app import db, utils
+from app.models import Company, InboundMessage, Ticket, User
+from app.utils import ingest_imap_mailbox, load_checkpoint
+
+from fakeimap import FakeIMAPServer, Mailbox, make_message
+
+NAME = 'imap:test/INBOX'
+KNOWN = 'ana@cliente.test'
+
+
+@pytest.fixture
+def imap_app(app, tmp_path):
+    # Spool e anexos em pasta temporária; decodificação no próprio processo
+    app.root_path = str(tmp_path)
+    app.config['IMAP_PARSE_WORKERS'] = 0
+    with app.app_context():
+        company = Company(name='Cliente', domain='cliente.test')
+        db.session.add(company)
+        db.session.flush()
+        user = User(email=KNOWN, name='Ana', role='client', company_id=company.id, confirmed=True)
+        user.set_password('x')
+        db.session.add(user)
+        db.session.commit()
+    return app
+
+
+def ingest(app, server, batch=50):
+    conn = imaplib.IMAP4('127.0.0.1', server.port)
+    try:
+        conn.login('u', 'p')
+        with app.app_context():
+            return ingest_imap_mailbox(conn, NAME, 'INBOX', batch)
+    finally:
+        conn.logout()
+
+
+def titles(app):
+    with app.app_context():
+        return sorted(t.title for t in Ticket.query.all())
+
+
+def test_first_run_reads_unseen_and_saves_checkpoint(imap_app):
+    box = Mailbox(uidvalidity=7)
+    box.add(make_message(KNOWN, 'antigo'), seen=True)
+    box.add(make_message(KNOWN, 'novo 1'))
+    box.add(make_message('x@desconhecido.test', 'spam'))
+    box.add(make_message(KNOWN, 'novo 2'))
+    with FakeIMAPServer(box) as server:
+        assert ingest(imap_app, server) == 2
+    assert titles(imap_app) == ['novo 1', 'novo 2']
+    assert box.seen(2) and box.seen(4)
+    assert not box.seen(3)  # remetente desconhecido: nem o corpo é baixado
+    assert not any('BODY.PEEK[]' in c and ' 3 ' in c for c in box.commands)
+    with imap_app.app_context():
+        assert load_checkpoint(NAME) == {'uidvalidity': 7, 'last_uid': 4}
+
+
+def test_resume_fetches_only_after_checkpoint(imap_app):
+    box = Mailbox(uidvalidity=7)
+    for i in range(3):
+        box.add(make_message(KNOWN, f'lote {i}'))
+    with FakeIMAPServer(box) as server:
+        assert ingest(imap_app, server) == 3
+        # Lida fora do sistema, mas depois do checkpoint: entra mesmo assim
+        box.add(make_message(KNOWN, 'nova 1'), seen=True)
+        box.add(make_message(KNOWN, 'nova 2'))
+        del box.commands[:]
+        assert ingest(imap_app, server, batch=1) == 2
+    assert 'UID SEARCH UID 4:*' in box.commands
+    fetched = [c for c in box.commands if c.startswith('UID FETCH')]
+    assert all(c.split()[2] in ('4', '5') for c in fetched)
+    assert len(titles(imap_app)) == 5
+    with imap_app.app_context():
+        assert load_checkpoint(NAME) == {'uidvalidity': 7, 'last_uid': 5}
+    with FakeIMAPServer(box) as server:
+        assert ingest(imap_app, server) == 0
+
+
+def test_duplicate_message_id_is_skipped_and_marked_seen(imap_app):
+    box = Mailbox(uidvalidity=7)
+    box.add(make_message(KNOWN, 'original', message_id='<m1@test>'))
+    with FakeIMAPServer(box) as server:
+        assert ingest(imap_app, server) == 1
+        # Reenvio com o mesmo Message-ID e duplicata dentro do mesmo lote
+        dup = box.add(make_message(KNOWN, 'reenvio', message_id='<m1@test>'))
+        box.add(make_message(KNOWN, 'outro', message_id='<m2@test>'))
+        dup2 = box.add(make_message(KNOWN, 'outro de novo', message_id='<m2@test>'))
+        assert ingest(imap_app, server) == 1
+    assert titles(imap_app) == ['original', 'outro']
+    assert box.seen(dup) and box.seen(dup2)
+    with imap_app.app_context():
+        assert InboundMessage.query.count() == 2
+
+
+def test_uidvalidity_change_rescans_without_duplicates(imap_app):
+    box = Mailbox(uidvalidity=7)
+    box.add(make_message(KNOWN, 'um'))
+    box.add(make_message(KNOWN, 'dois'))
+    with FakeIMAPServer(box) as server:
+        assert ingest(imap_app, server) == 2
+        # Caixa recriada: mesmos e-mails com UIDs novos e sem \Seen, mais um novo
+        box.recreate(uidvalidity=8)
+        new = box.add(make_message(KNOWN, 'tres'))
+        assert ingest(imap_app, server) == 1
+    assert titles(imap_app) == ['dois', 'tres', 'um']
+    assert all(box.seen(uid) for uid in box.messages)
+    with imap_app.app_context():
+        assert load_checkpoint(NAME) == {'uidvalidity': 8, 'last_uid': new}
+
+
+def test_web_requests_parse_inline(imap_app):
+    imap_app.config['IMAP_PARSE_WORKERS'] = 2
+    box = Mailbox()
+    for i in range(3):
+        box.add(make_message(KNOWN, f'inline {i}'))
+    with FakeIMAPServer(box) as server:
+        assert ingest(imap_app, server) == 3
+    assert utils._PARSE_POOL is None
+
+
+def test_listener_pool_uses_forkserver(imap_app):
+    imap_app.config['IMAP_PARSE_WORKERS'] = 2
+    pool = utils.start_parse_pool(imap_app.config)
+    try:
+        assert pool._mp_context.get_start_method() == 'forkserver'
+        box = Mailbox()
+        for i in range(3):
+            box.add(make_message(KNOWN, f'pool {i}'))
+        with FakeIMAPServer(box) as server:
+            assert ingest(imap_app, server) == 3
+    finally:
+        utils.stop_parse_pool()
+    assert titles(imap_app) == ['pool 0', 'pool 1', 'pool 2']
+    assert utils._PARSE_POOL is None
+
+
+def test_default_parse_workers_are_capped(imap_app, monkeypatch):
+    monkeypatch.setattr(utils.os, 'cpu_count', lambda: 64)
+    imap_app.config['IMAP_PARSE_WORKERS'] = None
+    try:
+        assert utils.start_parse_pool(imap_app.config)._max_workers == utils.IMAP_PARSE_MAX_WORKERS
+    finally:
+        utils.stop_parse_pool()
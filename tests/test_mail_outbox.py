@@ -0,0 +1,74 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.email import smtp_pool
+from app.mailer import process_outbox
+from app.models import EmailOutbox
+
+from smtpsink import SMTPSink, use_sink
+
+BLOCKED = 'bloqueado@cliente.test'
+
+
+def _queue(subject, recipient, **fields):
+    item = EmailOutbox(subject=subject, recipients=json.dumps([recipient]), body='corpo', **fields)
+    db.session.add(item)
+    return item
+
+
+@pytest.fixture
+def outbox_app(app):
+    app.config.update(MAIL_OUTBOX_MAX_ATTEMPTS=3, MAIL_OUTBOX_BACKOFF_SECONDS=30)
+    yield app
+    smtp_pool.close()
+
+
+def test_one_pass_marks_rows_sent_or_failed(outbox_app):
+    app = outbox_app
+    with SMTPSink(reject=[BLOCKED]) as sink, app.app_context():
+        use_sink(app, sink.port)
+        retry = _queue('recusada', BLOCKED)
+        ok = [_queue(f'ok {i}', f'user{i}@cliente.test') for i in range(5)]
+        last = _queue('última tentativa', BLOCKED, attempts=2)
+        later = _queue('agendada', 'user9@cliente.test', next_attempt_at=datetime.utcnow() + timedelta(hours=1))
+        db.session.commit()
+        ids = {name: item.id for name, item in
+               [('retry', retry), ('last', last), ('later', later)] + [(f'ok{i}', o) for i, o in enumerate(ok)]}
+
+        started = datetime.utcnow()
+        assert process_outbox(app.config) == (5, 2)
+        db.session.expire_all()
+        rows = {name: db.session.get(EmailOutbox, item_id) for name, item_id in ids.items()}
+
+        for i in range(5):
+            assert (rows[f'ok{i}'].status, rows[f'ok{i}'].attempts) == ('sent', 1)
+            assert rows[f'ok{i}'].sent_at is not None
+        # Recusa de um destinatário não derruba o resto do lote
+        assert (rows['retry'].status, rows['retry'].attempts) == ('pending', 1)
+        assert rows['retry'].next_attempt_at >= started + timedelta(seconds=30)
+        assert '550' in rows['retry'].last_error
+        assert (rows['last'].status, rows['last'].attempts) == ('failed', 3)
+        assert (rows['later'].status, rows['later'].attempts) == ('pending', 0)
+
+        # Nada vencido na segunda passada: a falha espera o backoff
+        assert process_outbox(app.config) == (0, 0)
+    assert sorted(r for rcpts, _ in sink.messages for r in rcpts) == [f'user{i}@cliente.test' for i in range(5)]
+    assert sink.connections == 1
+
+
+def test_server_down_reschedules_whole_batch(outbox_app):
+    app = outbox_app
+    with SMTPSink() as sink:
+        port = sink.port
+    with app.app_context():
+        use_sink(app, port)
+        for i in range(3):
+            _queue(f'ok {i}', f'user{i}@cliente.test')
+        db.session.commit()
+        assert process_outbox(app.config) == (0, 3)
+        rows = EmailOutbox.query.all()
+        assert {(r.status, r.attempts) for r in rows} == {('pending', 1)}
+        assert all(r.last_error and r.locked_until is None for r in rows)
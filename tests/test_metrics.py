@@ -0,0 +1,14 @@
+def test_metrics_disabled_without_token(app, client):
+    app.config['METRICS_TOKEN'] = None
+    # Sem token nem o acesso local (p.ex. via proxy) é atendido
+    assert client.get('/metrics', environ_base={'REMOTE_ADDR': '127.0.0.1'}).status_code == 404
+
+
+def test_metrics_requires_bearer_token(app, client):
+    app.config['METRICS_TOKEN'] = 's3cret'
+    assert client.get('/metrics').status_code == 403
+    assert client.get('/metrics', headers={'Authorization': 'Bearer errado'}).status_code == 403
+    response = client.get('/metrics', headers={'Authorization': 'Bearer s3cret'})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    assert b'# TYPE' in response.data
@@ -0,0 +1,98 @@
+import pytest
+from sqlalchemy import event
+
+from app import db
+from app.models import Attachment, Company, Ticket, TicketComment, TicketParticipant, User
+
+from conftest import login
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._count)
+
+
+def _queries(app, client, url):
+    with app.app_context():
+        engine = db.engine
+    with QueryCounter(engine) as counter:
+        response = client.get(url)
+    assert response.status_code == 200
+    return counter.count
+
+
+@pytest.fixture
+def staff(app):
+    with app.app_context():
+        ids = []
+        for i in range(6):
+            company = Company(name=f'Empresa {i}', domain=f'empresa{i}.test')
+            db.session.add(company)
+            db.session.flush()
+            user = User(email=f'tech{i}@empresa{i}.test', name=f'Tech {i}', role='tech', company_id=company.id)
+            user.set_password('x')
+            db.session.add(user)
+            db.session.flush()
+            ids.append((company.id, user.id))
+        db.session.commit()
+    return ids
+
+
+def _add_comments(ticket_id, users, total):
+    have = TicketComment.query.filter_by(ticket_id=ticket_id).count()
+    for k in range(have, total):
+        db.session.add(TicketComment(ticket_id=ticket_id, user_id=users[k % len(users)], content=f'c{k}'))
+        db.session.add(Attachment(ticket_id=ticket_id, filename=f'f{k}', original_name=f'f{k}.txt'))
+    db.session.commit()
+
+
+def test_ticket_detail_queries_do_not_grow_with_comments(app, client, admin, staff):
+    users = [uid for _, uid in staff]
+    with app.app_context():
+        ticket = Ticket(number='T-1', title='t', description='d', company_id=staff[0][0],
+                        created_by_id=users[0], assigned_to_id=admin['id'])
+        db.session.add(ticket)
+        db.session.flush()
+        for uid in users[1:4]:
+            db.session.add(TicketParticipant(ticket_id=ticket.id, user_id=uid))
+        db.session.commit()
+        ticket_id = ticket.id
+    login(client, admin['id'])
+    # Primeira requisição faz verificações de esquema únicas (PRAGMA); fora da contagem
+    client.get(f'/tickets/{ticket_id}')
+
+    with app.app_context():
+        _add_comments(ticket_id, users, 2)
+    few = _queries(app, client, f'/tickets/{ticket_id}')
+    with app.app_context():
+        _add_comments(ticket_id, users, 40)
+    many = _queries(app, client, f'/tickets/{ticket_id}')
+    assert few == many
+
+
+def test_ticket_list_queries_do_not_grow_with_page_size(app, client, admin, staff):
+    with app.app_context():
+        for i in range(60):
+            company_id, uid = staff[i % len(staff)]
+            db.session.add(Ticket(number=f'L-{i}', title='t', description='d', company_id=company_id,
+                                  created_by_id=uid, assigned_to_id=uid if i % 3 else None,
+                                  status=('Fechado', 'Em Atendimento', 'Novo')[i % 3]))
+        db.session.commit()
+    login(client, admin['id'])
+
+    app.config['TICKETS_PAGE_SIZE'] = 5
+    small = _queries(app, client, '/tickets/')
+    app.config['TICKETS_PAGE_SIZE'] = 50
+    large = _queries(app, client, '/tickets/')
+    assert small == large
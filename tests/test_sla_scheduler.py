@@ -0,0 +1,131 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.broker import broker
+from app.models import Ticket
+from app.sla_scheduler import (FIRST_RESPONSE, RESOLUTION, TOPIC, SLAScheduler, fire_due,
+                               load_pending, scheduler)
+
+NOW = datetime(2026, 1, 1, 12, 0)
+
+
+@pytest.fixture(autouse=True)
+def clean_scheduler():
+    scheduler.clear()
+    yield
+    scheduler.clear()
+
+
+@pytest.fixture
+def escalated(monkeypatch):
+    calls = []
+
+    def fake(ids, now=None):
+        calls.append(sorted(ids))
+        return len(ids)
+    monkeypatch.setattr('app.utils.escalate_tickets', fake)
+    return calls
+
+
+def _ticket(admin, number, status='Novo', **fields):
+    ticket = Ticket(number=number, title=number, description='d', status=status,
+                    company_id=admin['company_id'], created_by_id=admin['id'], **fields)
+    db.session.add(ticket)
+    return ticket
+
+
+def _published(sub):
+    # Última mensagem de prazos publicada por ticket
+    return {m['ticket']: m for _, m in sub.wait(1)}
+
+
+def test_set_replaces_and_pop_due_skips_stale_entries():
+    s = SLAScheduler()
+    s.set(1, RESOLUTION, NOW)
+    s.set(1, RESOLUTION, NOW + timedelta(hours=1))  # reagendado: a entrada antiga fica no heap
+    s.set(2, RESOLUTION, NOW)
+    s.set(3, FIRST_RESPONSE, NOW)
+    s.set(3, FIRST_RESPONSE, None)  # cancelado
+    assert len(s) == 2
+    assert s.pop_due(NOW) == [(2, RESOLUTION)]
+    assert s.pop_due(NOW + timedelta(minutes=59)) == []
+    assert s.pop_due(NOW + timedelta(hours=1)) == [(1, RESOLUTION)]
+    assert len(s) == 0 and s._heap == []
+
+
+def test_heap_is_rebuilt_when_stale_entries_pile_up():
+    s = SLAScheduler()
+    for minute in range(3000):
+        s.set(1, RESOLUTION, NOW + timedelta(minutes=minute))
+    assert len(s) == 1
+    assert len(s._heap) <= 2 * len(s) + 1024
+    assert s.pop_due(NOW + timedelta(days=3)) == [(1, RESOLUTION)]
+
+
+def test_load_pending_skips_past_first_response(app, admin):
+    with app.app_context():
+        now = datetime.utcnow()
+        late = _ticket(admin, 'T-late', due_first_response_at=now - timedelta(minutes=5),
+                       due_resolution_at=now + timedelta(hours=4))
+        upcoming = _ticket(admin, 'T-next', due_first_response_at=now + timedelta(minutes=5))
+        _ticket(admin, 'T-closed', status='Fechado', due_resolution_at=now + timedelta(hours=1))
+        _ticket(admin, 'T-paused', sla_paused=True, due_resolution_at=now + timedelta(hours=1))
+        db.session.commit()
+        scheduler.clear()
+
+        assert load_pending(now) == 2
+        assert scheduler._current == {
+            (late.id, RESOLUTION): now + timedelta(hours=4),
+            (upcoming.id, FIRST_RESPONSE): now + timedelta(minutes=5),
+        }
+
+
+def test_commit_publishes_deadlines_and_due_resolution_escalates(app, admin, escalated):
+    sub = broker.subscribe([TOPIC])
+    try:
+        with app.app_context():
+            due = datetime.utcnow() + timedelta(hours=2)
+            ticket = _ticket(admin, 'T-1', due_resolution_at=due)
+            db.session.commit()
+            message = _published(sub)[ticket.id]
+            assert message == {'type': 'deadlines', 'ticket': ticket.id,
+                               FIRST_RESPONSE: None, RESOLUTION: due.isoformat()}
+
+            scheduler.update(message)
+            assert fire_due(due - timedelta(seconds=1)) == (0, 0)
+            assert fire_due(due) == (1, 0)
+            assert escalated == [[ticket.id]]
+            # Já disparado: não repete
+            assert fire_due(due + timedelta(hours=1)) == (0, 0)
+    finally:
+        sub.close()
+
+
+def test_reschedule_and_pause_suppress_fire(app, admin, escalated):
+    sub = broker.subscribe([TOPIC])
+    try:
+        with app.app_context():
+            due = datetime.utcnow() + timedelta(hours=1)
+            moved = _ticket(admin, 'T-moved', due_resolution_at=due)
+            paused = _ticket(admin, 'T-paused', due_resolution_at=due)
+            db.session.commit()
+            for message in _published(sub).values():
+                scheduler.update(message)
+            assert len(scheduler) == 2
+
+            moved.due_resolution_at = due + timedelta(hours=3)
+            paused.sla_paused = True
+            db.session.commit()
+            published = _published(sub)
+            assert published[paused.id][RESOLUTION] is None
+            for message in published.values():
+                scheduler.update(message)
+
+            assert fire_due(due + timedelta(minutes=1)) == (0, 0)
+            assert escalated == []
+            assert fire_due(due + timedelta(hours=3)) == (1, 0)
+            assert escalated == [[moved.id]]
+    finally:
+        sub.close()
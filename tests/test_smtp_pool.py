@@ -0,0 +1,46 @@
+from app.email import SMTPPool, deliver_batch
+
+from smtpsink import SMTPSink, use_sink
+
+
+def _messages(n):
+    return [(f'assunto {i}', [f'user{i}@cliente.test'], 'corpo', None) for i in range(n)]
+
+
+def test_batch_reuses_one_connection(app):
+    with SMTPSink() as sink, app.app_context():
+        use_sink(app, sink.port)
+        pool = SMTPPool()
+        try:
+            assert deliver_batch(_messages(10), pool=pool) == [None] * 10
+            assert deliver_batch(_messages(5), pool=pool) == [None] * 5
+        finally:
+            pool.close()
+    assert len(sink.messages) == 15
+    assert sink.connections == 1
+    assert sink.messages[3][0] == ['user3@cliente.test']
+
+
+def test_dropped_connection_is_reopened_and_message_retried(app):
+    # O servidor encerra a sessão a cada 3 mensagens
+    with SMTPSink(drop_after=3) as sink, app.app_context():
+        use_sink(app, sink.port)
+        pool = SMTPPool()
+        try:
+            assert deliver_batch(_messages(7), pool=pool) == [None] * 7
+        finally:
+            pool.close()
+    assert sink.drops == 2
+    assert sink.connections == 3
+    subjects = [data.split(b'Subject: ', 1)[1].split(b'\r\n', 1)[0].decode() for _, data in sink.messages]
+    assert subjects == [f'assunto {i}' for i in range(7)]
+
+
+def test_server_down_fails_rest_of_batch(app):
+    with SMTPSink() as sink:
+        port = sink.port
+    with app.app_context():
+        use_sink(app, port)  # porta fechada: conexão recusada
+        results = deliver_batch(_messages(4), pool=SMTPPool())
+    assert len(results) == 4
+    assert all(isinstance(r, OSError) for r in results)
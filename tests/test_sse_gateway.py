@@ -0,0 +1,103 @@
+import asyncio
+import json
+
+from app import db
+from app.models import Notification, Ticket, TicketComment
+from app.sse_gateway import SSEGateway
+from conftest import login
+
+
+def _stream(app, path, user_id, headers=()):
+    """Abre o stream pelo gateway até SSE_MAX_SECONDS; devolve as mensagens com dados."""
+    cookie = app.session_interface.get_signing_serializer(app).dumps({'_user_id': str(user_id), '_fresh': True})
+    scope = {'type': 'http', 'path': path, 'query_string': b'',
+             'headers': [(b'cookie', f'session={cookie}'.encode())] + list(headers)}
+    chunks = []
+
+    async def receive():
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        if message['type'] == 'http.response.body':
+            chunks.append(message['body'].decode())
+
+    asyncio.run(SSEGateway(app)(scope, receive, send))
+    messages = []
+    for chunk in chunks:
+        if 'data:' not in chunk:
+            continue
+        fields = dict(line.split(': ', 1) for line in chunk.strip().splitlines())
+        messages.append((fields.get('id'), json.loads(fields['data'])))
+    return messages
+
+
+def _events(body):
+    out = []
+    for block in body.split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines() if ': ' in line)
+        if 'data' in fields:
+            out.append((fields.get('event'), fields.get('id'), json.loads(fields['data'])))
+    return out
+
+
+def _comments(app, admin, count):
+    with app.app_context():
+        ticket = Ticket(number='T-1', title='t', description='d',
+                        company_id=admin['company_id'], created_by_id=admin['id'])
+        db.session.add(ticket)
+        db.session.flush()
+        comments = [TicketComment(ticket_id=ticket.id, user_id=admin['id'], content=f'c{i}') for i in range(count)]
+        db.session.add_all(comments)
+        db.session.commit()
+        return ticket.id, [c.id for c in comments]
+
+
+def test_gateway_resumes_from_last_event_id(app, admin):
+    app.config.update(SSE_MAX_SECONDS=0.2, SSE_KEEPALIVE_SECONDS=0.05)
+    ticket_id, ids = _comments(app, admin, 5)
+    path = f'/tickets/{ticket_id}/comments/stream'
+
+    first = _stream(app, path, admin['id'])
+    assert [item['id'] for item in first[0][1]['items']] == ids
+    assert first[0][0] == str(ids[-1])
+
+    # Reconexão do EventSource: cabeçalho em minúsculas, como chega no ASGI
+    resumed = _stream(app, path, admin['id'], [(b'last-event-id', str(ids[2]).encode())])
+    assert [item['id'] for item in resumed[0][1]['items']] == ids[3:]
+
+    assert _stream(app, path, admin['id'], [(b'last-event-id', str(ids[-1]).encode())]) == []
+
+
+def test_gateway_backfill_continues_past_limit(app, admin):
+    # Mais comentários que SSE_BACKFILL_LIMIT e nenhum evento novo: todas as páginas chegam
+    app.config.update(SSE_MAX_SECONDS=0.3, SSE_KEEPALIVE_SECONDS=0.05, SSE_BACKFILL_LIMIT=3)
+    ticket_id, ids = _comments(app, admin, 8)
+    messages = _stream(app, f'/tickets/{ticket_id}/comments/stream', admin['id'])
+    assert [item['id'] for _, data in messages for item in data['items']] == ids
+    assert messages[-1][0] == str(ids[-1])
+
+
+def test_flask_streams_continue_past_limit(app, client, admin):
+    app.config.update(SSE_MAX_SECONDS=0.3, SSE_KEEPALIVE_SECONDS=0.05, SSE_BACKFILL_LIMIT=3)
+    ticket_id, ids = _comments(app, admin, 8)
+    with app.app_context():
+        notes = [Notification(user_id=admin['id'], company_id=admin['company_id'], kind='k', title=f'n{i}')
+                 for i in range(7)]
+        db.session.add_all(notes)
+        db.session.commit()
+        note_ids = [n.id for n in notes]
+    login(client, admin['id'])
+
+    body = client.get(f'/tickets/{ticket_id}/comments/stream').get_data(as_text=True)
+    assert [item['id'] for _, _, data in _events(body) for item in data['items']] == ids
+
+    # Retomada por Last-Event-ID: em ordem, a partir do cursor, até o fim
+    body = client.get('/notify/stream', headers={'Last-Event-ID': str(note_ids[0])}).get_data(as_text=True)
+    assert [item['id'] for _, _, data in _events(body) for item in data['items']] == note_ids[1:]
+
+    # /events: o cursor compartilhado não passa do que foi entregue enquanto há página pendente
+    body = client.get(f'/events?sid=abcdefgh12&ticket={ticket_id}&after_id={note_ids[-1]}').get_data(as_text=True)
+    comments = [(cursor, data) for kind, cursor, data in _events(body) if kind == 'comment']
+    assert [item['id'] for _, data in comments for item in data['items']] == ids
+    assert [cursor.split('-')[1] for cursor, _ in comments] == ['0', '0', str(ids[-1])]
+
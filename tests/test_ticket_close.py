@@ -0,0 +1,42 @@
+from app import db
+from app.models import Notification, Ticket, User
+
+from conftest import login
+
+CLOSE_FORM = {'reason': 'resolvido', 'tech_evaluation': 'ok', 'tech_eval_category': 'tecnico'}
+
+
+def _ticket(app, admin, digest_minutes=0):
+    with app.app_context():
+        creator = User(email='cliente@local.com', name='Cliente', role='client',
+                       company_id=admin['company_id'], notify_digest_minutes=digest_minutes)
+        creator.set_password('x')
+        db.session.add(creator)
+        db.session.flush()
+        ticket = Ticket(number='T-1', title='Impressora', description='d', status='Em atendimento',
+                        company_id=admin['company_id'], created_by_id=creator.id)
+        db.session.add(ticket)
+        db.session.commit()
+        return ticket.id, creator.id
+
+
+def test_close_notifies_creator(app, client, admin):
+    ticket_id, creator_id = _ticket(app, admin)
+    login(client, admin['id'])
+    assert client.post(f'/tickets/{ticket_id}/close', data=CLOSE_FORM).status_code == 302
+    with app.app_context():
+        notes = Notification.query.filter_by(user_id=creator_id, kind='ticket_closed').all()
+        assert [n.title for n in notes] == ['Ticket encerrado: T-1']
+
+
+def test_close_in_digest_mode_replaces_unread_notification(app, client, admin):
+    ticket_id, creator_id = _ticket(app, admin, digest_minutes=60)
+    login(client, admin['id'])
+    client.post(f'/tickets/{ticket_id}/close', data=CLOSE_FORM)
+    with app.app_context():
+        db.session.get(Ticket, ticket_id).status = 'Em atendimento'
+        db.session.commit()
+    client.post(f'/tickets/{ticket_id}/close', data=CLOSE_FORM)
+    with app.app_context():
+        notes = Notification.query.filter_by(user_id=creator_id, kind='ticket_closed').all()
+        assert [(n.title, n.group_count) for n in notes] == [('Ticket encerrado: T-1 (+1)', 2)]